@@ -1,11 +1,16 @@
+import os
+import time
+
 import streamlit as st
 import pandas as pd
 
-from config.settings import PAGE_CONFIG, CACHE_TTL
+from config.settings import PAGE_CONFIG, CACHE_TTL, DATA_SOURCE, DATA_SOURCE_PATH, SNAPSHOT_DIR, MAP_VIEWPORT_MODE
 from config.styles import DARK_THEME_CSS
 from services.google_sheets import GoogleSheetsService
 from services.data_loader import DataLoader
+from services.data_sources import criar_fonte_dados
 from services.stats_service import StatsService
+from services.snapshot_store import SnapshotStore
 from services.exceptions import (
     AppError, 
     DataConnectionError, 
@@ -13,7 +18,7 @@ from services.exceptions import (
     DataValidationError, 
     DataNotFoundError
 )
-from utils.coordinates import processar_coordenadas
+from utils.helpers import formatar_bytes, formatar_idade
 from components.maps import MapaBlocos, MapaLotes, Mapa3D, MapaCalor
 from components.legend import exibir_legenda
 from components.statistics import exibir_estatisticas_lotes, exibir_resumo_bloco
@@ -27,30 +32,33 @@ st.set_page_config(**PAGE_CONFIG)
 st.markdown(DARK_THEME_CSS, unsafe_allow_html=True)
 
 
-# --- Funções de Cache Wrapper ---
+# Visualizações da página; só a ativa é construída a cada rerun
+ABA_BLOCOS, ABA_LOTES, ABA_3D, ABA_CALOR = "🏘️ Blocos", "📍 Lotes", "🧊 Mapa 3D", "🔥 Mapa de Calor"
+ABAS = [ABA_BLOCOS, ABA_LOTES, ABA_3D, ABA_CALOR]
+# Widgets dentro das visualizações cujo valor deve sobreviver enquanto outra está ativa
+_WIDGETS_DAS_ABAS = ["bloco_detalhe", "multiselect_calor"]
 
-@st.cache_data(ttl=CACHE_TTL)
-def get_blocos_data(_loader: DataLoader) -> pd.DataFrame:
-    """Wrapper com cache para carregar dados de blocos."""
-    return _loader.carregar_dados_blocos()
 
+# --- Funções de Cache Wrapper ---
 
-@st.cache_data(ttl=CACHE_TTL)
-def get_lotes_data(_loader: DataLoader) -> pd.DataFrame:
-    """Wrapper com cache para carregar dados de lotes."""
-    return _loader.carregar_dados_lotes()
+@st.cache_resource
+def get_snapshot_store(fonte: str) -> SnapshotStore:
+    """Snapshot em disco compartilhado pelo processo (stale-while-revalidate), um por fonte de dados."""
+    return SnapshotStore(os.path.join(SNAPSHOT_DIR, fonte))
 
 
-@st.cache_data(ttl=CACHE_TTL)
-def processar_dados_cached(df: pd.DataFrame) -> pd.DataFrame:
-    """Wrapper com cache para processamento de coordenadas."""
-    return processar_coordenadas(df)
+@st.cache_resource
+def get_stats_service() -> StatsService:
+    """StatsService compartilhado pelo processo, com o estado agregado por bloco."""
+    return StatsService()
 
 
-@st.cache_data(ttl=CACHE_TTL)
-def enrich_blocos_cached(df_blocos: pd.DataFrame, df_lotes: pd.DataFrame) -> pd.DataFrame:
-    """Wrapper com cache para enriquecimento estatístico."""
-    return StatsService.enrich_blocos_data(df_blocos, df_lotes)
+def enrich_blocos_cached(df_blocos: pd.DataFrame, df_lotes: pd.DataFrame, versoes: dict = None) -> pd.DataFrame:
+    """
+    Enriquecimento estatístico incremental: só os blocos com lotes alterados são recalculados.
+    A busca no cache usa o token de versão dos dados (`versoes`), sem hashear os DataFrames.
+    """
+    return get_stats_service().enrich_blocos_incremental(df_blocos, df_lotes, versoes)
 
 
 def render_customization_ui(key_prefix, title, default_colors, default_icons):
@@ -89,8 +97,49 @@ def render_customization_ui(key_prefix, title, default_colors, default_icons):
         return new_colors, new_icons
 
 
+def exibir_status_snapshot(store: SnapshotStore, meta: dict = None):
+    """Mostra na barra lateral a versão e a idade dos dados servidos (`meta` da mesma leitura dos dados)."""
+    meta = meta or store.meta
+    if not meta:
+        return
+    status = f"🗂️ Dados v`{meta['versao']}` · atualizados {formatar_idade(time.time() - meta['timestamp'])}"
+    if store.atualizando:
+        status += " · sincronizando..."
+    st.sidebar.caption(status)
+    memoria = meta.get("carga", {}).get("memoria")
+    if memoria:
+        st.sidebar.caption("💾 Memória: " + " · ".join(
+            f"{nome} {formatar_bytes(m['antes'])} → {formatar_bytes(m['depois'])}" for nome, m in memoria.items()
+        ))
+    if store.ultimo_erro is not None:
+        st.sidebar.warning(f"Não foi possível atualizar os dados; exibindo a última versão salva. Detalhe: {store.ultimo_erro}")
+
+
+def exibir_auditoria(relatorio):
+    """Painel na barra lateral com o resumo e a tabela de anomalias dos dados."""
+    titulo = "🩺 Qualidade dos Dados" + (f" ({relatorio.total} alertas)" if relatorio.total else "")
+    with st.sidebar.expander(titulo, expanded=False):
+        if not relatorio.total:
+            st.caption("Nenhuma anomalia encontrada.")
+            return
+        for tipo, quantidade in relatorio.resumo.items():
+            if quantidade:
+                st.caption(f"**{tipo}**: {quantidade}")
+        st.dataframe(relatorio.anomalias, hide_index=True, use_container_width=True)
+
+
 # --- Main ---
 
+def manter_estado_widgets(chaves: list[str]) -> None:
+    """
+    Preserva o valor de widgets que não são desenhados neste rerun: o Streamlit
+    descarta o estado de widgets ausentes, o que reiniciaria a seleção ao voltar à visualização.
+    """
+    for chave in chaves:
+        if chave in st.session_state:
+            st.session_state[chave] = st.session_state[chave]
+
+
 def main():
     st.title("🗺️ Mapeamento Urbano - Bairro Brasília")
     st.markdown("**Altamira/PA** - 80 Quarteirões catalogados")
@@ -102,7 +151,7 @@ def main():
         # Botão de atualização
         if st.button("🔄 Atualizar Mapa", use_container_width=True):
             st.cache_data.clear()
-            st.success("Dados atualizados com sucesso!")
+            st.session_state["forcar_atualizacao"] = True
             st.rerun()
             
         st.divider()
@@ -135,47 +184,62 @@ def main():
             creds_dict = st.secrets
             
         sheets_service = GoogleSheetsService(credentials_dict=creds_dict)
-        data_loader = DataLoader(sheets_service)
+        fonte_dados = criar_fonte_dados(DATA_SOURCE, DATA_SOURCE_PATH, sheets_service=sheets_service)
+        data_loader = DataLoader(fonte_dados)
         
-        # 2. Carregar dados (usando wrappers com cache)
-        # Note: hash_funcs podem ser necessárias se DataLoader não for hashable, 
-        # mas aqui usamos _loader (leading underscore) para evitar hash do objeto se desejado,
-        # ou o Streamlit tentará hashear. Como DataLoader só tem ref para service, pode ser ok.
-        # Se falhar hash, usamos _loader no parametro para pular hash.
+        # 2. Carregar dados (snapshot local servido de imediato, revalidado em background;
+        #    a revalidação só baixa as abas se a revisão da planilha mudou)
+        snapshot_store = get_snapshot_store(DATA_SOURCE)
         
         with st.spinner("Carregando dados..."):
-            df_blocos = get_blocos_data(data_loader)
-            df_lotes = get_lotes_data(data_loader)
+            # Dados e metadados da mesma troca: a versão sempre corresponde aos DataFrames recebidos
+            if st.session_state.pop("forcar_atualizacao", False):
+                df_blocos, df_lotes, meta = snapshot_store.atualizar(
+                    data_loader.carregar_dados_se_alterado, forcar=True, com_meta=True
+                )
+                st.sidebar.success("Dados atualizados com sucesso!")
+            else:
+                df_blocos, df_lotes, meta = snapshot_store.obter(
+                    data_loader.carregar_dados_se_alterado, max_idade=CACHE_TTL, com_meta=True
+                )
         
-        # 3. Processamento (Pure functions)
-        try:
-            if df_blocos is not None and not df_blocos.empty:
-                df_blocos = processar_dados_cached(df_blocos)
-            
-            if df_lotes is not None and not df_lotes.empty:
-                df_lotes = processar_dados_cached(df_lotes)
-
-            # 4. Enriquecimento de Dados (Business Logic)
-            if df_blocos is not None and not df_blocos.empty:
-                # O StatsService lida com df_lotes sendo None/Vazio internamente se necessário
-                df_blocos = enrich_blocos_cached(df_blocos, df_lotes)
-                
-        except ValueError as ve:
-            # Captura erro de validação de coordenadas
-            raise DataValidationError(f"Erro ao processar coordenadas: {str(ve)}")
+        # Token de versão (hash calculado uma vez no carregamento): chave de todos os caches derivados
+        versoes = meta.get("versoes", {})
+        versao_lotes = versoes.get("lotes")
+        
+        exibir_status_snapshot(snapshot_store, meta)
+        exibir_auditoria(get_stats_service().obter_auditoria(
+            df_blocos, df_lotes,
+            coordenadas_rejeitadas=meta.get("carga", {}).get("coordenadas_rejeitadas"),
+            versao=meta.get("versao")
+        ))
+        
+        # 3. Enriquecimento de Dados (Business Logic)
+        # As coordenadas já chegam processadas pelo DataLoader (em paralelo no modo concorrente)
+        if df_blocos is not None and not df_blocos.empty:
+            # O StatsService lida com df_lotes sendo None/Vazio internamente se necessário
+            df_blocos = enrich_blocos_cached(df_blocos, df_lotes, versoes)
+        
+        # Cubo de contagens (bloco × uso × tipologia) e índice de filtros, montados uma vez por versão dos lotes
+        cubo = get_stats_service().obter_cubo(df_lotes, versao=versao_lotes)
+        indice_lotes = get_stats_service().obter_indice(df_lotes, versao=versao_lotes)
             
         # --- Configurações de Filtro (Compartilhadas entre 2D e 3D) ---
-        usos_disponiveis = ["Todos"] + sorted(df_lotes["uso_lote"].unique().tolist()) if df_lotes is not None else []
+        usos_disponiveis = ["Todos"] + cubo.usos_presentes() if df_lotes is not None else []
         uso_selecionado = st.sidebar.selectbox("Filtrar por Uso:", usos_disponiveis)
+        uso_filtro = None if uso_selecionado == "Todos" else uso_selecionado
         
         df_lotes_filtrado = df_lotes
-        if df_lotes is not None and uso_selecionado != "Todos":
-            df_lotes_filtrado = df_lotes[df_lotes["uso_lote"] == uso_selecionado]
+        if df_lotes is not None and uso_filtro is not None:
+            df_lotes_filtrado = indice_lotes.por_uso(uso_selecionado)
 
         # 4. Interface do Usuário
-        tab_blocos, tab_lotes, tab_3d, tab_calor = st.tabs(["🏘️ Blocos", "📍 Lotes", "🧊 Mapa 3D", "🔥 Mapa de Calor"])
+        # Navegação preguiçosa: ao contrário de st.tabs, só a visualização escolhida é
+        # construída; as demais são montadas na primeira visita (e os mapas vêm do cache depois)
+        manter_estado_widgets(_WIDGETS_DAS_ABAS)
+        aba_ativa = st.radio("Visualização", ABAS, horizontal=True, key="aba_ativa", label_visibility="collapsed")
         
-        with tab_blocos:
+        if aba_ativa == ABA_BLOCOS:
             st.header("Mapa de Blocos")
             st.markdown("Visualização dos 80 blocos catalogados no bairro Brasília.")
             
@@ -185,7 +249,8 @@ def main():
                     df_blocos, 
                     df_lotes, 
                     colors_config=custom_colors_blocos, 
-                    icons_config=custom_icons_blocos
+                    icons_config=custom_icons_blocos,
+                    versao=meta.get("versao")
                 )
                 mapa_blocos.renderizar()
 
@@ -194,33 +259,48 @@ def main():
                 # Filtro por Bloco
                 st.subheader("🔍 Detalhes por Bloco")
                 blocos_ids = sorted(df_blocos["id_bloco"].unique().tolist())
-                bloco_selecionado = st.selectbox("Selecione um bloco para detalhamento:", blocos_ids)
+                # Bloco guardado que sumiu após uma atualização: volta ao primeiro da lista
+                if st.session_state.get("bloco_detalhe") not in blocos_ids:
+                    st.session_state.pop("bloco_detalhe", None)
+                bloco_selecionado = st.selectbox("Selecione um bloco para detalhamento:", blocos_ids, key="bloco_detalhe")
                 
                 if df_lotes is not None:
-                    df_bloco_info = df_lotes[df_lotes["id_bloco"] == bloco_selecionado]
-                    exibir_resumo_bloco(df_bloco_info, bloco_selecionado)
+                    df_bloco_info = indice_lotes.por_bloco(bloco_selecionado)
+                    exibir_resumo_bloco(
+                        df_bloco_info, bloco_selecionado, cubo=cubo,
+                        geometria=get_stats_service().obter_geometria(df_lotes, versao=versao_lotes)
+                    )
             else:
                 st.info("Nenhum dado de blocos disponível.")
         
-        with tab_lotes:
+        elif aba_ativa == ABA_LOTES:
             st.header("Mapa de Lotes")
             st.markdown(f"Visualização de lotes ({uso_selecionado}).")
             
             if df_lotes_filtrado is not None and not df_lotes_filtrado.empty:
-                st.success(f"✅ {len(df_lotes_filtrado)} lotes exibidos!")
+                st.success(f"✅ {cubo.total(uso=uso_filtro)} lotes exibidos!")
                 
+                # Modo viewport: índice espacial dos lotes filtrados, um por versão e filtro
+                grade_lotes = None
+                if MAP_VIEWPORT_MODE:
+                    grade_lotes = get_stats_service().obter_grade(
+                        f"lotes_{uso_filtro or 'todos'}", df_lotes_filtrado, versao=versao_lotes
+                    )
                 mapa_lotes = MapaLotes(
                     df_lotes_filtrado,
                     colors_config=custom_colors_lotes,
-                    icons_config=custom_icons_lotes
+                    icons_config=custom_icons_lotes,
+                    versao=versao_lotes,
+                    filtro=uso_filtro,
+                    grade=grade_lotes
                 )
                 mapa_lotes.renderizar()
                 exibir_legenda()
-                exibir_estatisticas_lotes(df_lotes_filtrado)
+                exibir_estatisticas_lotes(df_lotes_filtrado, cubo=cubo, uso=uso_filtro)
             else:
                 st.info("Nenhum dado de lotes disponível para este filtro.")
 
-        with tab_3d:
+        elif aba_ativa == ABA_3D:
             st.header("Visualização 3D")
             st.markdown(f"Perspectiva tridimensional ({uso_selecionado}).")
             
@@ -230,10 +310,10 @@ def main():
             else:
                 st.info("Dados insuficientes para visualização 3D.")
 
-        with tab_calor:
+        elif aba_ativa == ABA_CALOR:
             if df_lotes is not None:
                 # 1. Definir opções
-                todos_usos = sorted(list(set(df_lotes['uso_lote'].dropna().unique())))
+                todos_usos = cubo.usos_presentes()
                 
                 # 2. Definir padrão (Empresarial, Misto, Institucional - validando existência)
                 # TIPOS_USO_COMERCIAL já inclui Institucional após atualização
@@ -244,16 +324,23 @@ def main():
                 if not default_usos and todos_usos:
                     default_usos = todos_usos[:3]
 
-                # 3. Widget de multiselect
+                # 3. Widget de multiselect: o valor vive só no session_state (semeado com o padrão);
+                #    usos que deixaram de existir após uma atualização dos dados são descartados
+                if "multiselect_calor" in st.session_state:
+                    st.session_state["multiselect_calor"] = [
+                        u for u in st.session_state["multiselect_calor"] if u in todos_usos
+                    ]
+                st.session_state.setdefault("multiselect_calor", default_usos)
                 usos_calor = st.multiselect(
                     "Selecione os Tipos de Uso para o Mapa de Calor:",
                     options=todos_usos,
-                    default=default_usos,
                     key="multiselect_calor"
                 )
                 
                 # 4. Renderizar mapa
-                mapa_calor = MapaCalor(df_lotes, usos_selecionados=usos_calor)
+                mapa_calor = MapaCalor(
+                    df_lotes, usos_selecionados=usos_calor, cubo=cubo, indice=indice_lotes, versao=versao_lotes
+                )
                 mapa_calor.renderizar()
 
     # --- Tratamento Granular de Erros ---
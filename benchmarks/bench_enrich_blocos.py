@@ -0,0 +1,119 @@
+"""
+Benchmark de StatsService.enrich_blocos_data (vetorizado) contra a implementação
+anterior baseada em groupby + lambda/mode + iterrows + merges, e da edição de um
+único lote via StatsService.enrich_blocos_incremental contra a reconstrução completa.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_enrich_blocos [--tamanhos 80 1000 10000 100000] [--lotes-por-bloco 20]
+                                             [--lotes-edicao 100000]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from config.constants import COL_ID_BLOCO, COL_USO_LOTE, COL_TIPOLOGIA, USO_RESIDENCIAL
+from services.data_loader import DataLoader
+from services.data_sources import FakeSheetsSource, gerar_dados_sinteticos
+from services.stats_service import StatsService
+
+
+def enrich_blocos_legado(df_blocos: pd.DataFrame, df_lotes: pd.DataFrame) -> pd.DataFrame:
+    """Implementação anterior (referência para comparação de desempenho e resultado)."""
+    grouped = df_lotes.groupby(COL_ID_BLOCO, observed=True)
+    agg_dict = {
+        'total_lotes': (COL_ID_BLOCO, 'size'),
+        'uso_predominante': (COL_USO_LOTE, lambda x: x.mode().iloc[0] if not x.mode().empty else "N/A"),
+    }
+    if COL_TIPOLOGIA in df_lotes.columns:
+        agg_dict['tipologia_pred'] = (COL_TIPOLOGIA, lambda x: x.mode().iloc[0] if not x.mode().empty else "N/A")
+    stats = grouped.agg(**agg_dict).reset_index()
+
+    usos_pivot = grouped[COL_USO_LOTE].value_counts().unstack(fill_value=0)
+    usos_dict = pd.DataFrame({
+        COL_ID_BLOCO: usos_pivot.index,
+        'usos_counts': [{k: v for k, v in row.items() if v > 0} for _, row in usos_pivot.iterrows()],
+    })
+
+    df_enriched = pd.merge(df_blocos, stats, on=COL_ID_BLOCO, how='left')
+    df_enriched = pd.merge(df_enriched, usos_dict, on=COL_ID_BLOCO, how='left')
+    df_enriched['total_lotes'] = df_enriched['total_lotes'].fillna(0).astype(int)
+    df_enriched['uso_predominante'] = df_enriched['uso_predominante'].astype(object).fillna("N/A")
+    df_enriched['tipologia_pred'] = df_enriched['tipologia_pred'].astype(object).fillna("N/A")
+    df_enriched['usos_counts'] = df_enriched['usos_counts'].apply(lambda x: x if isinstance(x, dict) else {})
+    return df_enriched
+
+
+def _cronometrar(fn, *args, repeticoes: int = 3) -> float:
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        fn(*args)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def bench_edicao(n_lotes: int, lotes_por_bloco: int) -> None:
+    """Uma edição de uso em um lote residencial: caminho incremental contra reconstrução completa."""
+    dados = gerar_dados_sinteticos(max(1, n_lotes // lotes_por_bloco), lotes_por_bloco, seed=42)
+    df_blocos, df_lotes = DataLoader(FakeSheetsSource(dados)).carregar_dados()
+    residenciais = np.flatnonzero((df_lotes[COL_USO_LOTE] == USO_RESIDENCIAL).to_numpy())
+    if not len(residenciais):
+        print("edição de um lote: nenhum lote residencial nos dados sintéticos")
+        return
+
+    # Versões alternadas com o mesmo lote editado, para cada repetição partir de um estado já carregado
+    editado = df_lotes.copy()
+    editado.loc[editado.index[residenciais[0]], COL_USO_LOTE] = next(
+        u for u in editado[COL_USO_LOTE].cat.categories if u != USO_RESIDENCIAL
+    )
+    servico = StatsService()
+    servico.enrich_blocos_incremental(df_blocos, df_lotes)
+    versoes = iter([editado, df_lotes] * 3)
+    t_incremental = _cronometrar(lambda: servico.enrich_blocos_incremental(df_blocos, next(versoes)))
+    t_completo = _cronometrar(StatsService.enrich_blocos_data, df_blocos, editado)
+
+    obtido = servico.enrich_blocos_incremental(df_blocos, editado)
+    esperado = StatsService.enrich_blocos_data(df_blocos, editado)
+    for col in ('total_lotes', 'uso_predominante', 'tipologia_pred', 'usos_counts'):
+        assert esperado[col].astype(object).tolist() == obtido[col].astype(object).tolist(), col
+    assert np.allclose(esperado['dist_comercial_media_m'], obtido['dist_comercial_media_m'], equal_nan=True)
+
+    print(f"\n{'edição de 1 lote':>18} {'lotes':>9} {'completo (s)':>13} {'incremental (s)':>16} {'ganho':>7}")
+    print(f"{'':>18} {len(df_lotes):>9} {t_completo:>13.4f} {t_incremental:>16.4f} {t_completo / t_incremental:>6.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[80, 1000, 10000, 100000])
+    parser.add_argument("--lotes-por-bloco", type=int, default=20)
+    parser.add_argument("--sem-legado", action="store_true", help="Não executa a implementação anterior (lenta em 100k).")
+    parser.add_argument("--lotes-edicao", type=int, default=100000,
+                        help="Lotes no caso de edição de um único lote (0 para não executar).")
+    args = parser.parse_args()
+
+    print(f"{'blocos':>8} {'lotes':>9} {'legado (s)':>11} {'vetorizado (s)':>15} {'ganho':>7}")
+    for n_blocos in args.tamanhos:
+        dados = gerar_dados_sinteticos(n_blocos, args.lotes_por_bloco, seed=42)
+        df_blocos, df_lotes = DataLoader(FakeSheetsSource(dados)).carregar_dados()
+
+        t_novo = _cronometrar(StatsService.enrich_blocos_data, df_blocos, df_lotes)
+        if args.sem_legado:
+            print(f"{n_blocos:>8} {len(df_lotes):>9} {'-':>11} {t_novo:>15.4f} {'-':>7}")
+            continue
+
+        t_legado = _cronometrar(enrich_blocos_legado, df_blocos, df_lotes, repeticoes=1)
+        esperado = enrich_blocos_legado(df_blocos, df_lotes)
+        obtido = StatsService.enrich_blocos_data(df_blocos, df_lotes)
+        for col in ('total_lotes', 'uso_predominante', 'tipologia_pred', 'usos_counts'):
+            assert esperado[col].astype(object).tolist() == obtido[col].astype(object).tolist(), col
+
+        print(f"{n_blocos:>8} {len(df_lotes):>9} {t_legado:>11.4f} {t_novo:>15.4f} {t_legado / t_novo:>6.1f}x")
+
+    if args.lotes_edicao > 0:
+        bench_edicao(args.lotes_edicao, args.lotes_por_bloco)
+
+
+if __name__ == "__main__":
+    main()
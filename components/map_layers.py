@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+import folium
+from folium.plugins import MarkerCluster
+from jinja2 import Template
+
+from config.settings import MAP_CLUSTER_THRESHOLD
+from utils.coordinates import desprojetar_local
+from utils.helpers import json_para_script
+from utils.geometry import vertices_hexagonos
+
+
+class MarcadoresEmLote(MarkerCluster):
+    """
+    Camada de marcadores enviada ao navegador como um único array de dados.
+
+    Cada linha de `dados` é [lat, lon, *campos]; uma única função JS (`callback`)
+    cria o marcador de cada linha no cliente, em vez de um bloco de JavaScript
+    por folium.Marker/Popup/Icon. Com `agrupar`, os marcadores vão para um
+    L.markerClusterGroup (como o FastMarkerCluster); sem, para um L.featureGroup.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function(){
+            var callback = {{ this.callback }};
+            var data = {{ this.dados|tojson }};
+            {%- if this.agrupar %}
+            var camada = L.markerClusterGroup({{ this.opcoes|tojson }});
+            {%- else %}
+            var camada = L.featureGroup();
+            {%- endif %}
+
+            for (var i = 0; i < data.length; i++) {
+                callback(data[i]).addTo(camada);
+            }
+
+            camada.addTo({{ this._parent.get_name() }});
+            return camada;
+        })();
+        {% endmacro %}""")
+
+    def __init__(self, dados: list, callback: str, agrupar: bool = True, opcoes: dict = None, name: str = None):
+        super().__init__(name=name)
+        self._name = "MarcadoresEmLote"
+        self.dados = dados
+        self.callback = callback
+        self.agrupar = agrupar
+        self.opcoes = opcoes or {}
+
+
+def propriedades_compactas(df: pd.DataFrame, campos: list[str]) -> tuple[list[list], dict]:
+    """
+    Valores de `campos` em colunas de tipos JSON (nulos como None), prontos para o array
+    de dados. Colunas categóricas seguem como códigos de um dicionário enviado uma
+    única vez ({campo: [rótulos]}), em vez de repetir o texto em cada linha.
+    """
+    colunas, dicionarios = [], {}
+    for campo in campos:
+        if campo not in df.columns:
+            colunas.append([None] * len(df))
+            continue
+        serie = df[campo]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            codigos = serie.cat.codes.to_numpy()
+            colunas.append(np.where(codigos < 0, None, codigos).tolist())
+            dicionarios[campo] = serie.cat.categories.astype(object).tolist()
+        else:
+            valores = serie.astype(object)
+            colunas.append(valores.where(valores.notna(), None).tolist())
+    return colunas, dicionarios
+
+
+def callback_marcadores(estilos: list, campos: list[str], dicionarios: dict,
+                        popup_js: str, tooltip_js: str, max_largura_popup: int) -> str:
+    """
+    Função JS compartilhada por todos os marcadores de uma camada `MarcadoresEmLote`.
+
+    Espera linhas [lat, lon, estilo, *valores de `campos`], com `estilo` indexando a
+    tabela `estilos` de pares [cor, ícone]. O tooltip é montado na criação do marcador;
+    o popup só quando é aberto, por `popup_js` (template compartilhado `(p) -> html`).
+    """
+    return f"""(function () {{
+        var estilos = {json_para_script(estilos)};
+        var campos = {json_para_script(campos)};
+        var dicionarios = {json_para_script(dicionarios)};
+        var popup = {popup_js};
+        var tooltip = {tooltip_js};
+        var propriedades = function (row) {{
+            var p = {{latitude: row[0], longitude: row[1]}};
+            for (var k = 0; k < campos.length; k++) {{
+                var v = row[3 + k], d = dicionarios[campos[k]];
+                p[campos[k]] = (d && v !== null) ? d[v] : v;
+            }}
+            return p;
+        }};
+        return function (row) {{
+            var estilo = estilos[row[2]];
+            var marker = L.marker(new L.LatLng(row[0], row[1]));
+            marker.setIcon(L.AwesomeMarkers.icon({{
+                icon: estilo[1], markerColor: estilo[0], iconColor: "white", prefix: "fa"
+            }}));
+            marker.bindTooltip(tooltip(propriedades(row)));
+            marker.bindPopup(function () {{ return popup(propriedades(row)); }}, {{maxWidth: {int(max_largura_popup)}}});
+            return marker;
+        }};
+    }})()"""
+
+
+def adicionar_marcadores_em_lote(mapa, df: pd.DataFrame, coluna_estilo: str, cores: dict, icones: dict,
+                                 cor_padrao: str, icone_padrao: str, campos: list[str], popup_js: str,
+                                 tooltip_js: str, max_largura_popup: int,
+                                 limite_agrupamento: int = None) -> MarcadoresEmLote:
+    """
+    Adiciona os pontos de `df` ao mapa como uma única camada `MarcadoresEmLote`.
+
+    Cor e ícone saem de `coluna_estilo` (ex.: uso do lote): cada valor distinto vira
+    uma entrada da tabela de estilos e as linhas carregam só o índice dela. Popup e
+    tooltip são montados no navegador a partir dos `campos` de cada linha. O
+    agrupamento (cluster) é ligado automaticamente acima de `limite_agrupamento`
+    pontos (padrão MAP_CLUSTER_THRESHOLD).
+    """
+    limite = MAP_CLUSTER_THRESHOLD if limite_agrupamento is None else limite_agrupamento
+    codigos, valores = pd.factorize(df[coluna_estilo].astype(object), use_na_sentinel=False)
+    estilos = [[cores.get(v, cor_padrao), icones.get(v, icone_padrao)] for v in valores]
+    colunas, dicionarios = propriedades_compactas(df, campos)
+
+    lat = df["latitude"].to_numpy(dtype=np.float64).tolist()
+    lon = df["longitude"].to_numpy(dtype=np.float64).tolist()
+    dados = [list(linha) for linha in zip(lat, lon, codigos.tolist(), *colunas)]
+
+    camada = MarcadoresEmLote(
+        dados,
+        callback_marcadores(estilos, campos, dicionarios, popup_js, tooltip_js, max_largura_popup),
+        agrupar=len(dados) > limite,
+    )
+    camada.add_to(mapa)
+    return camada
+
+
+def adicionar_hexagonos(destino, hexagonos: pd.DataFrame, raio_m: float, cor: str = "#e67e22") -> folium.GeoJson:
+    """
+    Desenha hexágonos agregados (`agregar_em_hexagonos`: centro x/y em metros e contagem `n`)
+    como uma única camada GeoJSON; a opacidade cresce com o logaritmo da contagem.
+    """
+    vx, vy = vertices_hexagonos(hexagonos["x"].to_numpy(), hexagonos["y"].to_numpy(), raio_m)
+    lat, lon = desprojetar_local(vx, vy)
+    contagens = hexagonos["n"].to_numpy()
+    opacidades = 0.2 + 0.6 * np.log1p(contagens) / np.log1p(max(int(contagens.max(initial=1)), 1))
+
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [[*zip(lons, lats), (lons[0], lats[0])]]},
+            "properties": {"lotes": n, "opacidade": round(o, 3)},
+        }
+        for lats, lons, n, o in zip(lat.tolist(), lon.tolist(), contagens.tolist(), opacidades.tolist())
+    ]
+    camada = folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        style_function=lambda f: {
+            "fillColor": cor, "color": cor, "weight": 1, "fillOpacity": f["properties"]["opacidade"],
+        },
+        tooltip=folium.GeoJsonTooltip(fields=["lotes"], aliases=["Lotes:"]),
+    )
+    camada.add_to(destino)
+    return camada
+
+
+def linha_clicada(df: pd.DataFrame, retorno: dict, tolerancia_graus: float = 1e-7) -> dict | None:
+    """
+    Linha de `df` do marcador clicado, a partir do retorno do st_folium
+    (`last_object_clicked`: {"lat", "lng"}), ou None se nenhum marcador foi clicado.
+    """
+    clicado = (retorno or {}).get("last_object_clicked")
+    if not clicado or df is None or df.empty:
+        return None
+    lat = df["latitude"].to_numpy(dtype=np.float64)
+    lon = df["longitude"].to_numpy(dtype=np.float64)
+    distancia = np.maximum(np.abs(lat - clicado["lat"]), np.abs(lon - clicado["lng"]))
+    posicao = int(np.argmin(distancia))
+    if distancia[posicao] > tolerancia_graus:
+        return None
+    return df.iloc[posicao].to_dict()
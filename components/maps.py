@@ -1,29 +1,107 @@
+import json
+
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
 import folium
 from folium.plugins import HeatMap
 from streamlit_folium import st_folium
 import pydeck as pdk
 
-from config.settings import MAP_DEFAULT_ZOOM, MAP_TILES
+from config.settings import (
+    MAP_DEFAULT_ZOOM,
+    MAP_TILES,
+    MAP_RENDER_MODE,
+    MAP_POPUP_SERVER_DETAILS,
+    MAP_VIEWPORT_MODE,
+    MAP_VIEWPORT_DETAIL_ZOOM,
+    MAP_VIEWPORT_MARGIN,
+    MAP_VIEWPORT_HEX_PX,
+)
 from utils.helpers import hex_to_rgb
+from utils.coordinates import metros_por_pixel
+from utils.geometry import agregar_em_hexagonos
+from utils.spatial_index import GradeEspacial
 from config.constants import CORES_FOLIUM, ICONES_USO_LOTE, CORES_USO_LOTE, TIPOS_USO_COMERCIAL
-from utils.html_templates import generate_bloco_popup_html
+from utils.html_templates import (
+    CAMPOS_POPUP_BLOCO,
+    CAMPOS_POPUP_LOTE,
+    generate_bloco_popup_html,
+    generate_lote_popup_html,
+    template_popup_bloco_js,
+    template_popup_lote_js,
+)
+from components.map_layers import adicionar_hexagonos, adicionar_marcadores_em_lote, linha_clicada
+from services.render_cache import CacheRenderizacao
+
+
+@st.cache_resource
+def get_cache_mapas() -> CacheRenderizacao:
+    """Cache do HTML renderizado dos mapas, compartilhado pelo processo."""
+    return CacheRenderizacao()
+
+
+def _chave_estilo(*configs: dict) -> str:
+    """Representação estável das configurações de cores/ícones, para a chave do cache."""
+    return json.dumps(configs, sort_keys=True, default=str)
+
+
+def _exibir_html_em_cache(chave: tuple, construir_mapa, altura: int) -> None:
+    """
+    Exibe o mapa a partir do HTML em cache; só na primeira vez (ou após a expulsão
+    do item) o mapa é construído por `construir_mapa()` e serializado.
+    """
+    html = get_cache_mapas().obter(chave, lambda: construir_mapa().get_root().render())
+    components.html(html, height=altura)
+
+
+def _retorno_st_folium(detalhes_servidor: bool) -> list:
+    """Objetos devolvidos pelo st_folium: só o clique, e só com detalhes no servidor (evita reruns no zoom/pan)."""
+    return ["last_object_clicked"] if detalhes_servidor else []
+
+
+def _limites_viewport(retorno: dict) -> tuple | None:
+    """(sul, oeste, norte, leste) dos `bounds` devolvidos pelo st_folium, ou None antes da primeira leitura."""
+    bounds = (retorno or {}).get("bounds") or {}
+    sw, ne = bounds.get("_southWest") or {}, bounds.get("_northEast") or {}
+    limites = (sw.get("lat"), sw.get("lng"), ne.get("lat"), ne.get("lng"))
+    return None if None in limites else limites
+
+
+def _expandir_janela(sul: float, oeste: float, norte: float, leste: float, margem: float) -> tuple:
+    """Janela ampliada em `margem` (fração da altura/largura) para cada lado."""
+    d_lat, d_lon = (norte - sul) * margem, (leste - oeste) * margem
+    return sul - d_lat, oeste - d_lon, norte + d_lat, leste + d_lon
+
+
+def _contem(janela: tuple, limites: tuple) -> bool:
+    sul, oeste, norte, leste = janela
+    return sul <= limites[0] and oeste <= limites[1] and norte >= limites[2] and leste >= limites[3]
 
 
 class MapaBlocos:
     """Componente de mapa para blocos."""
     
     def __init__(self, df: pd.DataFrame, df_lotes: pd.DataFrame = None, 
-                 colors_config: dict = None, icons_config: dict = None):
+                 colors_config: dict = None, icons_config: dict = None, modo: str = None,
+                 detalhes_servidor: bool = None, versao: str = None):
         # A lógica de cálculo foi movida para StatsService.
         # df já deve vir enriquecido com ['total_lotes', 'uso_predominante', 'usos_counts']
         self.df = df
         self.colors_config = colors_config or CORES_FOLIUM
         self.icons_config = icons_config or ICONES_USO_LOTE
+        # "lote" (array único + callback JS) ou "individual" (um folium.Marker por bloco)
+        self.modo = modo or MAP_RENDER_MODE
+        # Exibe abaixo do mapa o popup completo do bloco clicado
+        self.detalhes_servidor = MAP_POPUP_SERVER_DETAILS if detalhes_servidor is None else detalhes_servidor
+        # Token da versão dos dados: com ele, o HTML do mapa é reaproveitado entre reruns
+        self.versao = versao
     
     def _adicionar_marcadores(self, mapa):
         """Adiciona marcadores ao mapa com estatísticas pré-calculadas."""
+        if self.modo == "lote":
+            self._adicionar_marcadores_em_lote(mapa)
+            return
         for _, row in self.df.iterrows():
             id_bloco = row.get('id_bloco', row.get('ID', 'N/A'))
             lat = row["latitude"]
@@ -45,13 +123,25 @@ class MapaBlocos:
                 tooltip=f"{id_bloco} - {uso_predominante}",
                 icon=folium.Icon(color=cor_icon, icon=icon_name, prefix="fa")
             ).add_to(mapa)
-    
-    def renderizar(self):
-        """Renderiza o mapa no Streamlit de forma estável."""
-        if self.df is None or self.df.empty:
-            st.warning("Nenhum dado disponível para exibir.")
-            return
 
+    def _adicionar_marcadores_em_lote(self, mapa):
+        """
+        Todos os blocos em um único array de dados, estilizados no navegador; o popup
+        é montado ao clicar, a partir das propriedades compactas de cada bloco.
+        """
+        df = self.df
+        if "uso_predominante" not in df.columns:
+            df = df.assign(uso_predominante="N/A")
+        adicionar_marcadores_em_lote(
+            mapa, df, "uso_predominante", self.colors_config, self.icons_config,
+            cor_padrao="gray", icone_padrao="info-sign",
+            campos=CAMPOS_POPUP_BLOCO,
+            popup_js=template_popup_bloco_js(),
+            tooltip_js='function (p) { return p.id_bloco + " - " + p.uso_predominante; }',
+            max_largura_popup=350,
+        )
+    
+    def _construir_mapa(self) -> folium.Map:
         # Centro inicial se não houver estado
         centro_inicial = [self.df["latitude"].mean(), self.df["longitude"].mean()]
         
@@ -61,17 +151,34 @@ class MapaBlocos:
             tiles=MAP_TILES
         )
         self._adicionar_marcadores(mapa)
+        return mapa
+
+    def renderizar(self):
+        """Renderiza o mapa no Streamlit de forma estável."""
+        if self.df is None or self.df.empty:
+            st.warning("Nenhum dado disponível para exibir.")
+            return
+
+        if self.versao is not None and not self.detalhes_servidor:
+            chave = ("blocos", self.versao, self.modo, _chave_estilo(self.colors_config, self.icons_config))
+            _exibir_html_em_cache(chave, self._construir_mapa, altura=1000)
+            st.markdown(f"**Total de Blocos:** {len(self.df)}")
+            return
         
         # O segredo para estabilidade no zoom é remover returned_objects
         # Isso evita que o Streamlit recarregue a página a cada pequena interação
-        st_folium(
-            mapa, 
+        retorno = st_folium(
+            self._construir_mapa(), 
             key="folium_blocos",
             width=None, 
             height=1000, 
             use_container_width=True,
-            returned_objects=[] # Vazio para evitar reruns automáticos no zoom/pan
+            returned_objects=_retorno_st_folium(self.detalhes_servidor) # Vazio para evitar reruns automáticos no zoom/pan
         )
+        if self.detalhes_servidor:
+            row = linha_clicada(self.df, retorno)
+            if row is not None:
+                st.markdown(generate_bloco_popup_html(row), unsafe_allow_html=True)
 
         st.markdown(f"**Total de Blocos:** {len(self.df)}")
 
@@ -79,40 +186,36 @@ class MapaBlocos:
 class MapaLotes:
     """Componente de mapa para lotes."""
     
-    def __init__(self, df: pd.DataFrame, colors_config: dict = None, icons_config: dict = None):
+    def __init__(self, df: pd.DataFrame, colors_config: dict = None, icons_config: dict = None, modo: str = None,
+                 detalhes_servidor: bool = None, versao: str = None, filtro=None,
+                 viewport: bool = None, grade: GradeEspacial = None):
         self.df = df
         self.colors_config = colors_config or CORES_FOLIUM
         self.icons_config = icons_config or ICONES_USO_LOTE
+        # "lote" (array único + callback JS) ou "individual" (um folium.Marker por lote)
+        self.modo = modo or MAP_RENDER_MODE
+        # Exibe abaixo do mapa o popup completo do lote clicado
+        self.detalhes_servidor = MAP_POPUP_SERVER_DETAILS if detalhes_servidor is None else detalhes_servidor
+        # Token da versão dos lotes e filtro que produziu `df`: com o token, o HTML é reaproveitado entre reruns
+        self.versao = versao
+        self.filtro = filtro
+        # Modo viewport: só os lotes visíveis (ou hexágonos em zoom baixo), consultados em `grade`
+        self.viewport = MAP_VIEWPORT_MODE if viewport is None else viewport
+        self.grade = grade
     
     def _adicionar_marcadores(self, mapa):
         """Adiciona marcadores ao mapa."""
+        if self.modo == "lote":
+            self._adicionar_marcadores_em_lote(mapa)
+            return
         for _, row in self.df.iterrows():
             uso = row.get("uso_lote", "Desconhecido")
             cor = self.colors_config.get(uso, "gray")
             icone = self.icons_config.get(uso, "map-marker")
-            
-            nome_fantasia = row.get("nome_fantasia", "")
-            endereco = f"{row.get('rua', '')} {row.get('numero', '')}".strip()
             lat = row["latitude"]
             lon = row["longitude"]
             
-            popup_html = f"""
-            <div style="font-family: Arial; min-width: 200px;">
-                <h4 style="margin: 0; color: #333;">{row['id_lote']}</h4>
-                <p style="margin: 5px 0; color: #666;">
-                    <b>Bloco:</b> {row.get('id_bloco', 'N/A')}<br>
-                    <b>Quadra:</b> {row.get('id_quadra', 'N/A')}<br>
-                    <b>Uso:</b> <span style="font-weight: bold;">{uso}</span><br>
-                    {f'<b>Nome:</b> {nome_fantasia}<br>' if nome_fantasia else ''}
-                    <b>Endereço:</b> {endereco if endereco else 'N/A'}<br>
-                    <b>Tipologia:</b> {row.get('tipologia', 'N/A')}
-                </p>
-                <p style="margin: 5px 0; color: #999; font-size: 10px; border-top: 1px solid #ddd; padding-top: 5px;">
-                    <b>Coordenadas:</b><br>
-                    Lat: {lat:.6f} | Lon: {lon:.6f}
-                </p>
-            </div>
-            """
+            popup_html = generate_lote_popup_html(row.to_dict())
             
             folium.Marker(
                 location=[lat, lon],
@@ -120,13 +223,26 @@ class MapaLotes:
                 tooltip=f"{row['id_lote']} - {uso}",
                 icon=folium.Icon(color=cor, icon=icone, prefix="fa")
             ).add_to(mapa)
-    
-    def renderizar(self):
-        """Renderiza o mapa no Streamlit de forma estável."""
-        if self.df is None or self.df.empty:
-            st.warning("Nenhum dado disponível para exibir.")
-            return
 
+    def _adicionar_marcadores_em_lote(self, mapa, df: pd.DataFrame = None, limite_agrupamento: int = None):
+        """
+        Todos os lotes em um único array de dados, estilizados no navegador; o popup
+        é montado ao clicar, a partir das propriedades compactas de cada lote.
+        """
+        df = self.df if df is None else df
+        if "uso_lote" not in df.columns:
+            df = df.assign(uso_lote="Desconhecido")
+        adicionar_marcadores_em_lote(
+            mapa, df, "uso_lote", self.colors_config, self.icons_config,
+            cor_padrao="gray", icone_padrao="map-marker",
+            campos=CAMPOS_POPUP_LOTE,
+            popup_js=template_popup_lote_js(),
+            tooltip_js='function (p) { return p.id_lote + " - " + p.uso_lote; }',
+            max_largura_popup=300,
+            limite_agrupamento=limite_agrupamento,
+        )
+    
+    def _construir_mapa(self) -> folium.Map:
         centro_inicial = [self.df["latitude"].mean(), self.df["longitude"].mean()]
         
         mapa = folium.Map(
@@ -136,15 +252,120 @@ class MapaLotes:
         )
         
         self._adicionar_marcadores(mapa)
+        return mapa
+
+    def _grade(self) -> GradeEspacial:
+        if self.grade is None:
+            self.grade = GradeEspacial.de_dataframe(self.df)
+        return self.grade
+
+    def _camada_viewport(self, servido: dict) -> tuple[folium.FeatureGroup, str]:
+        """
+        Monta a camada da janela servida (`servido`: nível, janela, zoom e posições dos
+        lotes consultados): marcadores a partir de MAP_VIEWPORT_DETAIL_ZOOM, hexágonos
+        de ~MAP_VIEWPORT_HEX_PX px abaixo dele.
+        """
+        posicoes, zoom, janela = servido["posicoes"], servido["zoom"], servido["janela"]
+        camada = folium.FeatureGroup(name="Lotes visíveis")
+        if not len(posicoes):
+            return camada, "Nenhum lote na área visível."
+
+        if servido["nivel"] == "lotes":
+            visiveis = self.df.iloc[posicoes]
+            # Só a janela vai ao navegador: sem agrupamento, cada lote visível é um marcador
+            self._adicionar_marcadores_em_lote(camada, visiveis, limite_agrupamento=len(visiveis))
+            return camada, f"{len(visiveis)} lotes na área visível."
+
+        grade = self._grade()
+        raio_m = MAP_VIEWPORT_HEX_PX / 2 * metros_por_pixel(zoom, (janela[0] + janela[2]) / 2)
+        hexagonos = agregar_em_hexagonos(grade.x[posicoes], grade.y[posicoes], raio_m)
+        adicionar_hexagonos(camada, hexagonos, raio_m)
+        return camada, (f"{len(posicoes)} lotes na área visível, agregados em {len(hexagonos)} hexágonos "
+                        f"(aproxime até o zoom {MAP_VIEWPORT_DETAIL_ZOOM} para ver os lotes).")
+
+    def _renderizar_viewport(self):
+        """
+        Modo viewport: o mapa base é estável e só a camada de lotes muda, montada no
+        servidor para a área visível a partir dos bounds/zoom devolvidos pelo st_folium.
+
+        Executado como `st.fragment`: cada pan/zoom reexecuta só esta função, não a
+        página inteira. O custo restante por movimento é montar a camada (JSON dos lotes
+        visíveis ou dos hexágonos) e reenviá-la ao navegador, que a redesenha.
+
+        A janela consultada cobre o viewport mais uma margem (MAP_VIEWPORT_MARGIN);
+        enquanto a tela fica dentro dela, no mesmo nível de detalhe e com os mesmos dados,
+        as posições já consultadas são reaproveitadas sem nova consulta ao índice. A
+        sessão guarda só janela, nível e posições; a camada folium é refeita a cada execução.
+        """
+        retorno_anterior = st.session_state.get("folium_lotes_viewport")
+        zoom = (retorno_anterior or {}).get("zoom") or MAP_DEFAULT_ZOOM
+        limites = _limites_viewport(retorno_anterior)
+        if limites is None:
+            # Primeira execução: ainda sem viewport, serve a extensão dos dados
+            lat, lon = self.df["latitude"], self.df["longitude"]
+            limites = (lat.min(), lon.min(), lat.max(), lon.max())
+
+        nivel = "lotes" if zoom >= MAP_VIEWPORT_DETAIL_ZOOM else ("hexagonos", zoom)
+        chave_dados = (self.versao if self.versao is not None else id(self.df), str(self.filtro),
+                       _chave_estilo(self.colors_config, self.icons_config))
+        servido = st.session_state.get("_viewport_lotes")
+        if (servido is None or servido["nivel"] != nivel or servido["dados"] != chave_dados
+                or not _contem(servido["janela"], limites)):
+            janela = _expandir_janela(*limites, MAP_VIEWPORT_MARGIN)
+            servido = {"nivel": nivel, "dados": chave_dados, "janela": janela, "zoom": zoom,
+                       "posicoes": self._grade().na_janela(*janela)}
+            st.session_state["_viewport_lotes"] = servido
+        camada, resumo = self._camada_viewport(servido)
+
+        mapa = folium.Map(
+            location=[self.df["latitude"].mean(), self.df["longitude"].mean()],
+            zoom_start=MAP_DEFAULT_ZOOM,
+            tiles=MAP_TILES
+        )
+        retorno = st_folium(
+            mapa,
+            key="folium_lotes_viewport",
+            feature_group_to_add=camada,
+            width=None,
+            height=1000,
+            use_container_width=True,
+            returned_objects=["bounds", "zoom"] + _retorno_st_folium(self.detalhes_servidor)
+        )
+        st.caption(resumo)
+        if self.detalhes_servidor:
+            row = linha_clicada(self.df, retorno)
+            if row is not None:
+                st.markdown(generate_lote_popup_html(row), unsafe_allow_html=True)
+
+    def renderizar(self):
+        """Renderiza o mapa no Streamlit de forma estável."""
+        if self.df is None or self.df.empty:
+            st.warning("Nenhum dado disponível para exibir.")
+            return
+
+        if self.viewport:
+            # Fragmento: os reruns disparados por pan/zoom ficam restritos ao mapa
+            st.fragment(self._renderizar_viewport)()
+            return
+
+        if self.versao is not None and not self.detalhes_servidor:
+            chave = ("lotes", self.versao, str(self.filtro), self.modo,
+                     _chave_estilo(self.colors_config, self.icons_config))
+            _exibir_html_em_cache(chave, self._construir_mapa, altura=1000)
+            return
         
-        st_folium(
-            mapa, 
+        retorno = st_folium(
+            self._construir_mapa(), 
             key="folium_lotes",
             width=None, 
             height=1000, 
             use_container_width=True,
-            returned_objects=[] # Crucial para estabilidade
+            returned_objects=_retorno_st_folium(self.detalhes_servidor) # Crucial para estabilidade
         )
+        if self.detalhes_servidor:
+            row = linha_clicada(self.df, retorno)
+            if row is not None:
+                st.markdown(generate_lote_popup_html(row), unsafe_allow_html=True)
 
 
 class Mapa3D:
@@ -161,7 +382,8 @@ class Mapa3D:
 
         # Preparar dados para o PyDeck
         df_pdk = self.df.copy()
-        df_pdk["color_rgb"] = df_pdk["uso_lote"].apply(
+        # astype(object): uso_lote é categórico e o apply retorna listas (não categorizáveis)
+        df_pdk["color_rgb"] = df_pdk["uso_lote"].astype(object).apply(
             lambda x: hex_to_rgb(CORES_USO_LOTE.get(x, "#95a5a6"))
         )
         
@@ -201,10 +423,37 @@ class Mapa3D:
 class MapaCalor:
     """Componente de mapa de calor por densidade de uso selecionado."""
     
-    def __init__(self, df_lotes: pd.DataFrame, usos_selecionados: list = None):
+    def __init__(self, df_lotes: pd.DataFrame, usos_selecionados: list = None, cubo=None, indice=None,
+                 versao: str = None):
         self.df_lotes = df_lotes
         self.usos_selecionados = usos_selecionados if usos_selecionados else TIPOS_USO_COMERCIAL
+        # CuboAgregado opcional: responde "há lotes com esses usos?" sem varrer os lotes
+        self.cubo = cubo
+        # IndiceLotes opcional: seleciona os lotes dos usos escolhidos sem `isin` sobre todas as linhas
+        self.indice = indice
+        # Token da versão dos lotes: com ele, o HTML do mapa é reaproveitado entre reruns
+        self.versao = versao
     
+    def _construir_mapa(self, coords: pd.DataFrame) -> folium.Map:
+        # Preparar dados para o HeatMap: [lat, lon, weight=1]
+        # Usamos 1.0 como peso para cada lote (proporção 1:1)
+        heat_data = [[lat, lon, 1.0] for lat, lon in coords.values.tolist()]
+
+        # Criar mapa base
+        map_center = [coords['latitude'].mean(), coords['longitude'].mean()]
+        m = folium.Map(location=map_center, zoom_start=MAP_DEFAULT_ZOOM, tiles=MAP_TILES)
+        
+        # Adicionar HeatMap
+        HeatMap(
+            heat_data,
+            name="Densidade",
+            min_opacity=0.4,
+            radius=15,    # Ajustado para visualização mais granular
+            blur=10,      # Blur menor para distinguir pontos próximos
+            max_zoom=1,
+        ).add_to(m)
+        return m
+
     def renderizar(self):
         """Renderiza o mapa de calor."""
         st.subheader("Mapa de Calor - Densidade de Usos Selecionados")
@@ -217,42 +466,36 @@ class MapaCalor:
             st.warning("Selecione pelo menos um tipo de uso para gerar o mapa.")
             return
 
+        if self.cubo is not None and self.cubo.total(uso=self.usos_selecionados) == 0:
+            st.info("Nenhum lote com os usos selecionados encontrado para gerar o mapa.")
+            return
+
         # Filtrar lotes de interesse
-        lotes_interesse = self.df_lotes[self.df_lotes['uso_lote'].isin(self.usos_selecionados)].copy()
+        if self.indice is not None:
+            lotes_interesse = self.indice.por_uso(list(self.usos_selecionados))
+        else:
+            lotes_interesse = self.df_lotes[self.df_lotes['uso_lote'].isin(self.usos_selecionados)].copy()
         
         if lotes_interesse.empty:
             st.info("Nenhum lote com os usos selecionados encontrado para gerar o mapa.")
             return
             
-        # Preparar dados para o HeatMap: [lat, lon, weight=1]
-        # Usamos 1.0 como peso para cada lote (proporção 1:1)
-        heat_data = lotes_interesse[['latitude', 'longitude']].dropna().values.tolist()
-        heat_data = [[lat, lon, 1.0] for lat, lon in heat_data]
-        
-        if not heat_data:
+        coords = lotes_interesse[['latitude', 'longitude']].dropna()
+        if coords.empty:
             st.warning("Não foi possível obter coordenadas para os lotes selecionados.")
             return
-
-        # Criar mapa base
-        map_center = [lotes_interesse['latitude'].mean(), lotes_interesse['longitude'].mean()]
-        m = folium.Map(location=map_center, zoom_start=MAP_DEFAULT_ZOOM, tiles=MAP_TILES)
-        
-        # Adicionar HeatMap
-        HeatMap(
-            heat_data,
-            name="Densidade",
-            min_opacity=0.4,
-            radius=15,    # Ajustado para visualização mais granular
-            blur=10,      # Blur menor para distinguir pontos próximos
-            max_zoom=1,
-        ).add_to(m)
         
         # Adicionar legenda simples
-        st.markdown(f"**Total de Lotes Exibidos:** {len(heat_data)}")
+        st.markdown(f"**Total de Lotes Exibidos:** {len(coords)}")
+
+        if self.versao is not None:
+            chave = ("calor", self.versao, tuple(sorted(map(str, self.usos_selecionados))))
+            _exibir_html_em_cache(chave, lambda: self._construir_mapa(coords), altura=600)
+            return
 
         # Renderizar com estabilidade (returned_objects=[])
         st_folium(
-            m, 
+            self._construir_mapa(coords), 
             width="100%", 
             height=600, 
             key="mapa_calor", 
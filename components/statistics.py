@@ -5,13 +5,23 @@ import numpy as np
 import plotly.graph_objects as go
 
 from config.constants import CORES_USO_LOTE
+from utils.coordinates import coordenadas_metricas
 
 
-def exibir_estatisticas_lotes(df: pd.DataFrame):
-    """Exibe gráfico de pizza dos lotes por uso."""
+def exibir_estatisticas_lotes(df: pd.DataFrame = None, cubo=None, id_bloco=None, uso=None):
+    """
+    Exibe gráfico de pizza dos lotes por uso.
+    Com `cubo` (CuboAgregado), as contagens do recorte (bloco/uso) são lidas dele sem varrer `df`.
+    """
     
     # Contagem por uso
-    contagem_uso = df["uso_lote"].value_counts().reset_index()
+    if cubo is not None:
+        contagem_uso = cubo.contagem_por_uso(id_bloco=id_bloco, uso=uso)
+    else:
+        # Em colunas categóricas value_counts inclui categorias sem ocorrência; descartá-las
+        contagem_uso = df["uso_lote"].value_counts()
+        contagem_uso = contagem_uso[contagem_uso > 0]
+    contagem_uso = contagem_uso.reset_index()
     contagem_uso.columns = ["Uso", "Quantidade"]
     
     # Mapear cores
@@ -65,8 +75,12 @@ def exibir_estatisticas_lotes(df: pd.DataFrame):
     st.plotly_chart(fig, use_container_width=True)
 
 
-def exibir_resumo_bloco(df_lotes_bloco: pd.DataFrame, id_bloco: str):
-    """Exibe estatísticas específicas de um bloco selecionado e o gráfico poligonal."""
+def exibir_resumo_bloco(df_lotes_bloco: pd.DataFrame, id_bloco: str, cubo=None, geometria=None):
+    """
+    Exibe estatísticas específicas de um bloco selecionado e o gráfico poligonal.
+    Com `cubo` (CuboAgregado), métricas e gráfico de pizza são lidos dele; com
+    `geometria` (GeometriaBlocos), o contorno é o fecho convexo pré-calculado.
+    """
     
     st.subheader(f"📊 Detalhes do {id_bloco}")
     
@@ -77,24 +91,24 @@ def exibir_resumo_bloco(df_lotes_bloco: pd.DataFrame, id_bloco: str):
     # --- Gráfico de Polígono ---
     st.markdown("#### Área do Bloco (Geometria)")
     
-    # Ordenação Radial para evitar zig-zag
-    df_coords = df_lotes_bloco.copy()
-    
-    # 1. Calcular o centro (centróide)
-    centro_lat = df_coords["latitude"].mean()
-    centro_lon = df_coords["longitude"].mean()
-    
-    # 2. Calcular o ângulo de cada ponto em relação ao centro
-    df_coords["angulo"] = np.arctan2(
-        df_coords["latitude"] - centro_lat, 
-        df_coords["longitude"] - centro_lon
-    )
-    
-    # 3. Ordenar pelo ângulo para formar um perímetro estável
-    df_coords = df_coords.sort_values("angulo")
-    
-    # 4. Fechar o polígono ligando o último ponto ao primeiro
-    df_coords = pd.concat([df_coords, df_coords.head(1)])
+    if geometria is not None:
+        # Fecho convexo já fechado (sem auto-interseções, mesmo em blocos não convexos)
+        df_coords = geometria.contorno(id_bloco)
+    else:
+        # Ordenação Radial para evitar zig-zag
+        df_coords = df_lotes_bloco.copy()
+        
+        # 1. Calcular o centro (centróide) na projeção local em metros
+        x, y = coordenadas_metricas(df_coords)
+        
+        # 2. Calcular o ângulo de cada ponto em relação ao centro
+        df_coords["angulo"] = np.arctan2(y - y.mean(), x - x.mean())
+        
+        # 3. Ordenar pelo ângulo para formar um perímetro estável
+        df_coords = df_coords.sort_values("angulo")
+        
+        # 4. Fechar o polígono ligando o último ponto ao primeiro
+        df_coords = pd.concat([df_coords, df_coords.head(1)])
     
     fig_poly = go.Figure()
 
@@ -111,6 +125,17 @@ def exibir_resumo_bloco(df_lotes_bloco: pd.DataFrame, id_bloco: str):
         text=df_coords["id_lote"]
     ))
 
+    if geometria is not None:
+        # Lotes internos ao fecho continuam visíveis como pontos
+        fig_poly.add_trace(go.Scatter(
+            x=df_lotes_bloco["longitude"],
+            y=df_lotes_bloco["latitude"],
+            mode="markers",
+            marker=dict(size=6, color="#ccd6f6"),
+            name="Lotes",
+            text=df_lotes_bloco["id_lote"]
+        ))
+
     fig_poly.update_layout(
         xaxis_title="Longitude",
         yaxis_title="Latitude",
@@ -123,19 +148,34 @@ def exibir_resumo_bloco(df_lotes_bloco: pd.DataFrame, id_bloco: str):
     
     st.plotly_chart(fig_poly, use_container_width=True)
 
+    if geometria is not None and id_bloco in geometria.resumo.index:
+        forma = geometria.resumo.loc[id_bloco]
+        st.caption(
+            f"Área aproximada: {forma['area_m2']:,.0f} m² · Perímetro: {forma['perimetro_m']:,.0f} m · "
+            f"Centróide: {forma['centroide_lat']:.6f}, {forma['centroide_lon']:.6f}"
+        )
+
     # --- Métricas ---
     col1, col2, col3 = st.columns(3)
     
+    if cubo is not None:
+        total = cubo.total(id_bloco=id_bloco)
+        residenciais = cubo.total(id_bloco=id_bloco, uso="Residencial")
+        usos_empresariais = [u for u in cubo.usos_presentes() if "Empresarial" in u]
+        comerciais = cubo.total(id_bloco=id_bloco, uso=usos_empresariais)
+    else:
+        total = len(df_lotes_bloco)
+        residenciais = len(df_lotes_bloco[df_lotes_bloco["uso_lote"] == "Residencial"])
+        comerciais = len(df_lotes_bloco[df_lotes_bloco["uso_lote"].str.contains("Empresarial", na=False)])
+    
     with col1:
-        st.metric("Total de Lotes", len(df_lotes_bloco))
+        st.metric("Total de Lotes", total)
     
     with col2:
-        residenciais = len(df_lotes_bloco[df_lotes_bloco["uso_lote"] == "Residencial"])
         st.metric("Residencial", residenciais)
         
     with col3:
-        comerciais = len(df_lotes_bloco[df_lotes_bloco["uso_lote"].str.contains("Empresarial", na=False)])
         st.metric("Empresarial", comerciais)
 
     # Gráfico de pizza reduzido para o bloco
-    exibir_estatisticas_lotes(df_lotes_bloco)
+    exibir_estatisticas_lotes(df_lotes_bloco, cubo=cubo, id_bloco=id_bloco)
@@ -51,10 +51,47 @@ COL_ID_BLOCO = "id_bloco"
 COL_ID_LOTE = "id_lote"
 COL_USO_LOTE = "uso_lote"
 COL_TIPOLOGIA = "tipologia"
+COL_ID_QUADRA = "id_quadra"
+COL_NUMERO = "numero"
+# Projeção local em metros (utils/coordinates.py), derivada de latitude/longitude no carregamento
+COL_X_M = "x_m"
+COL_Y_M = "y_m"
+
+# Schema tipado dos DataFrames internos (aplicado pelo DataLoader no carregamento)
+# "category": strings repetidas de baixa cardinalidade (groupby/filtros sobre códigos)
+# DTYPE_COORDENADA: resolvido para float32/float64 conforme COORD_DTYPE (config/settings.py)
+# "Int32": inteiro anulável; só é aplicado se nenhum valor não vazio for perdido na conversão
+DTYPE_COORDENADA = "coordenada"
+
+# id_bloco é único por linha em blocos: "category" só compensa em lotes, onde se repete
+SCHEMA_BLOCOS = {
+    COL_ID_BLOCO: "string",
+    COL_LATITUDE: DTYPE_COORDENADA,
+    COL_LONGITUDE: DTYPE_COORDENADA,
+    COL_X_M: DTYPE_COORDENADA,
+    COL_Y_M: DTYPE_COORDENADA,
+}
+
+SCHEMA_LOTES = {
+    COL_ID_LOTE: "string",
+    COL_ID_BLOCO: "category",
+    COL_ID_QUADRA: "category",
+    COL_USO_LOTE: "category",
+    COL_TIPOLOGIA: "category",
+    COL_NUMERO: "Int32",
+    COL_LATITUDE: DTYPE_COORDENADA,
+    COL_LONGITUDE: DTYPE_COORDENADA,
+    COL_X_M: DTYPE_COORDENADA,
+    COL_Y_M: DTYPE_COORDENADA,
+}
 
 # Colunas brutas da planilha (para mapeamento/normalização)
 RAW_COL_COORD_BLOCOS = "latitude_longitude_bloco"
 RAW_COL_COORD_LOTES = "latitude_longitude"
+# Linha da planilha do primeiro registro (a linha 1 é o cabeçalho)
+LINHA_PRIMEIRO_REGISTRO = 2
+# Linha de origem de cada registro na planilha, preservada após o descarte de linhas inválidas
+COL_LINHA_PLANILHA = "linha_planilha"
 
 # Cores disponíveis no Folium
 FOLIUM_OK_COLORS = [
@@ -80,3 +117,6 @@ TIPOS_USO_COMERCIAL = [
     "Misto",
     "Institucional"
 ]
+
+# Uso considerado residencial nos indicadores de acesso ao comércio
+USO_RESIDENCIAL = "Residencial"
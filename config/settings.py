@@ -1,3 +1,5 @@
+import os
+
 # Configurações da página Streamlit
 PAGE_CONFIG = {
     "page_title": "Mapeamento LNB - Brasília/Altamira",
@@ -9,10 +11,72 @@ PAGE_CONFIG = {
 # Google Sheets
 SPREADSHEET_ID = "1FWb50dR8FXOVYUHbZDY0AC5zXiM_O7Cme59AqrnPCHY"
 CREDENTIALS_FILE = "credentials.json"
+WORKSHEET_BLOCOS = "Bloco"
+WORKSHEET_LOTES = 0  # Primeira aba (por índice)
+
+# Pool de clientes Google (compartilhado pelo processo)
+SHEETS_TOKEN_REFRESH_MARGIN = 300  # Renova o token 5 min antes de expirar
+SHEETS_HTTP_POOL_SIZE = 10         # Conexões keep-alive por host
+
+# Agendador de requisições ao Sheets (quota de leitura: 60 req/min por usuário)
+SHEETS_RATE_LIMIT_PER_MIN = 60
+SHEETS_RATE_BURST = 10
+SHEETS_MAX_RETRIES = 5
+SHEETS_BACKOFF_BASE = 0.5  # segundos
+SHEETS_BACKOFF_MAX = 32    # segundos
+
+# Fonte de dados: "sheets" (padrão), "arquivo" (CSV/Parquet), "sqlite" ou "fake" (offline)
+DATA_SOURCE = os.environ.get("LNB_DATA_SOURCE", "sheets")
+DATA_SOURCE_PATH = os.environ.get("LNB_DATA_SOURCE_PATH")
+# Semente dos dados sintéticos da fonte "fake": os mesmos dados (e a mesma revisão) a cada rerun
+DATA_SOURCE_FAKE_SEED = int(os.environ.get("LNB_DATA_SOURCE_FAKE_SEED", "42"))
+# Carregamento concorrente: baixa e processa cada aba em paralelo (em vez de uma leitura em lote)
+DATA_LOAD_CONCURRENT = os.environ.get("LNB_DATA_LOAD_CONCURRENT", "0") == "1"
+# Streaming: lê cada aba em páginas de STREAM_PAGE_ROWS linhas (memória limitada em planilhas grandes)
+DATA_LOAD_STREAMING = os.environ.get("LNB_DATA_LOAD_STREAMING", "0") == "1"
+STREAM_PAGE_ROWS = 5000
 
 # Cache
 CACHE_TTL = 300  # 5 minutos
 
+# Snapshot local (Parquet) servido no startup enquanto os dados são revalidados
+SNAPSHOT_DIR = ".snapshot"
+
+# Precisão das colunas de coordenadas ("float64" ou "float32"; float32 ≈ 0,5 m de resolução)
+COORD_DTYPE = "float64"
+
+# Origem (lat, lon) da projeção local em metros (x_m/y_m); centro aproximado do bairro
+PROJECTION_ORIGIN = (-3.2047, -52.2113)
+
+# Índice espacial: lado (metros) das células da grade uniforme
+SPATIAL_GRID_CELL_M = 50
+
+# Auditoria de qualidade dos dados
+# Limites do bairro (sul, oeste, norte, leste), independentes dos dados auditados; None desativa a checagem
+AUDIT_BBOX = (-3.2197, -52.2263, -3.1897, -52.1963)
+# Tolerância (m) em volta de AUDIT_BBOX antes de um ponto contar como fora do bairro
+AUDIT_BBOX_MARGIN_M = 200
+# Distância máxima (m) de um lote ao centro (mediana) dos lotes do seu bloco
+AUDIT_MAX_DIST_BLOCO_M = 150
+
 # Mapa
 MAP_DEFAULT_ZOOM = 16
 MAP_TILES = "OpenStreetMap"
+# Marcadores de blocos/lotes: "lote" (um único array de dados estilizado por um callback JS)
+# ou "individual" (um folium.Marker com Popup/Icon por linha)
+MAP_RENDER_MODE = os.environ.get("LNB_MAP_RENDER_MODE", "lote")
+# Acima deste número de pontos o modo "lote" agrupa os marcadores (cluster) automaticamente
+MAP_CLUSTER_THRESHOLD = 1000
+# Detalhes do marcador clicado também exibidos abaixo do mapa (montados no servidor; um rerun por clique)
+MAP_POPUP_SERVER_DETAILS = False
+# Cache do HTML renderizado dos mapas (LRU por versão dos dados, filtros e cores/ícones)
+MAP_RENDER_CACHE_MAX_ITEMS = 32
+MAP_RENDER_CACHE_MAX_MB = 128
+# Modo viewport (opcional): o mapa de lotes envia só o que está visível, lido de bounds/zoom do st_folium
+MAP_VIEWPORT_MODE = os.environ.get("LNB_MAP_VIEWPORT_MODE", "0") == "1"
+# A partir deste zoom os lotes visíveis vão como marcadores; abaixo, agregados em hexágonos
+MAP_VIEWPORT_DETAIL_ZOOM = 17
+# Margem (fração da largura/altura da tela) enviada além do viewport; pans dentro dela não recalculam as camadas
+MAP_VIEWPORT_MARGIN = 0.5
+# Diâmetro aproximado (px na tela) de cada hexágono de agregação
+MAP_VIEWPORT_HEX_PX = 40
@@ -1,2 +1,6 @@
 from .google_sheets import GoogleSheetsService
 from .data_loader import DataLoader
+from .snapshot_store import SnapshotStore
+from .data_sources import DataSource, GoogleSheetsSource, LocalFileSource, SQLiteSource, FakeSheetsSource
+from .stats_service import StatsService, CuboAgregado
+from .lot_index import IndiceLotes
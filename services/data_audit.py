@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+from config.settings import AUDIT_BBOX, AUDIT_BBOX_MARGIN_M, AUDIT_MAX_DIST_BLOCO_M
+from config.constants import COL_ID_BLOCO, COL_ID_LOTE, COL_LATITUDE, COL_LINHA_PLANILHA, COL_LONGITUDE
+from utils.coordinates import RAIO_TERRA_M, coordenadas_metricas
+
+# Tipos de anomalia, na ordem em que aparecem no resumo
+ID_LOTE_DUPLICADO = "id_lote duplicado"
+ID_BLOCO_DUPLICADO = "id_bloco duplicado"
+BLOCO_INEXISTENTE = "bloco inexistente"
+FORA_DO_BAIRRO = "fora do bairro"
+LONGE_DO_BLOCO = "longe do bloco"
+COORDENADA_INVALIDA = "coordenada inválida"
+TIPOS_ANOMALIA = [COORDENADA_INVALIDA, ID_LOTE_DUPLICADO, ID_BLOCO_DUPLICADO, BLOCO_INEXISTENTE,
+                  FORA_DO_BAIRRO, LONGE_DO_BLOCO]
+
+_COLUNAS_ANOMALIAS = ["tipo", "aba", "linha", COL_ID_LOTE, COL_ID_BLOCO, "detalhe"]
+
+
+class RelatorioAuditoria:
+    """Resultado da auditoria: tabela de anomalias (uma linha por ocorrência) e contagem por tipo."""
+
+    def __init__(self, anomalias: pd.DataFrame, caixa: tuple = None):
+        self.anomalias = anomalias
+        # Caixa (sul, oeste, norte, leste), já com a margem, usada na checagem "fora do bairro"
+        self.caixa = caixa
+        contagem = anomalias["tipo"].value_counts()
+        self.resumo = {tipo: int(contagem.get(tipo, 0)) for tipo in TIPOS_ANOMALIA}
+
+    @property
+    def total(self) -> int:
+        return len(self.anomalias)
+
+
+def _anomalias(tipo: str, aba: str, df: pd.DataFrame, linhas: np.ndarray, detalhe=None) -> pd.DataFrame:
+    """
+    Monta as linhas da tabela de anomalias para as posições `linhas` de `df`;
+    `linha` é a linha de origem na planilha (COL_LINHA_PLANILHA), não a posição no DataFrame.
+    """
+    def coluna(nome):
+        if nome not in df.columns:
+            return np.full(len(linhas), None, dtype=object)
+        return df[nome].iloc[linhas].to_numpy(dtype=object)
+
+    return pd.DataFrame({
+        "tipo": tipo,
+        "aba": aba,
+        "linha": coluna(COL_LINHA_PLANILHA),
+        COL_ID_LOTE: coluna(COL_ID_LOTE),
+        COL_ID_BLOCO: coluna(COL_ID_BLOCO),
+        "detalhe": "" if detalhe is None else detalhe,
+    }, columns=_COLUNAS_ANOMALIAS)
+
+
+def _anomalias_coordenadas_rejeitadas(rejeitadas: list[dict]) -> pd.DataFrame:
+    """
+    Linhas descartadas no carregamento por coordenada inválida (`DataLoader.relatorio_carga`),
+    que não chegam aos DataFrames auditados; `linha` já é a linha da planilha.
+    """
+    tabela = pd.DataFrame(rejeitadas, columns=["aba", "linha", COL_ID_LOTE, COL_ID_BLOCO, "valor_bruto", "motivo"])
+    valor = tabela["valor_bruto"].astype(str)
+    tabela["detalhe"] = tabela["motivo"].astype(str) + np.where(valor != "", ": " + valor, "")
+    tabela["tipo"] = COORDENADA_INVALIDA
+    return tabela[_COLUNAS_ANOMALIAS]
+
+
+def _ampliar_caixa(caixa: tuple, margem_m: float) -> tuple:
+    """Caixa (sul, oeste, norte, leste) ampliada por `margem_m` metros para cada lado."""
+    sul, oeste, norte, leste = caixa
+    margem_lat = float(np.degrees(margem_m / RAIO_TERRA_M))
+    margem_lon = margem_lat / float(np.cos(np.radians((sul + norte) / 2)))
+    return sul - margem_lat, oeste - margem_lon, norte + margem_lat, leste + margem_lon
+
+
+def _fora_da_caixa(df: pd.DataFrame, caixa: tuple) -> np.ndarray:
+    sul, oeste, norte, leste = caixa
+    lat = df[COL_LATITUDE].to_numpy(dtype=np.float64, na_value=np.nan)
+    lon = df[COL_LONGITUDE].to_numpy(dtype=np.float64, na_value=np.nan)
+    # Comparações com NaN são falsas: coordenadas ausentes não contam como fora do bairro
+    return np.flatnonzero((lat < sul) | (lat > norte) | (lon < oeste) | (lon > leste))
+
+
+def auditar_dados(df_blocos: pd.DataFrame, df_lotes: pd.DataFrame, caixa: tuple = None,
+                  margem_m: float = None, distancia_max_m: float = None,
+                  coordenadas_rejeitadas: list[dict] = None) -> RelatorioAuditoria:
+    """
+    Auditoria vetorizada dos dados já processados (coordenadas numéricas):
+    ids de lote/bloco duplicados, lotes cujo bloco não existe na aba de blocos,
+    coordenadas fora da caixa do bairro (AUDIT_BBOX, configurada; não derivada dos
+    próprios dados, para que um bloco mal posicionado não a amplie) e lotes distantes
+    do centro do seu bloco.
+    `coordenadas_rejeitadas` (do relatório de carga) entra como anomalias à parte.
+    """
+    caixa = caixa or AUDIT_BBOX
+    margem_m = AUDIT_BBOX_MARGIN_M if margem_m is None else margem_m
+    if caixa is not None:
+        caixa = _ampliar_caixa(caixa, margem_m)
+    distancia_max_m = AUDIT_MAX_DIST_BLOCO_M if distancia_max_m is None else distancia_max_m
+    tem_blocos = df_blocos is not None and not df_blocos.empty
+    tem_lotes = df_lotes is not None and not df_lotes.empty
+
+    partes = []
+    if coordenadas_rejeitadas:
+        partes.append(_anomalias_coordenadas_rejeitadas(coordenadas_rejeitadas))
+
+    if tem_blocos:
+        ids_blocos = df_blocos[COL_ID_BLOCO].astype(object)
+        partes.append(_anomalias(ID_BLOCO_DUPLICADO, "blocos", df_blocos,
+                                 np.flatnonzero(ids_blocos.duplicated(keep=False).to_numpy() & ids_blocos.notna().to_numpy())))
+        if caixa is not None:
+            partes.append(_anomalias(FORA_DO_BAIRRO, "blocos", df_blocos, _fora_da_caixa(df_blocos, caixa)))
+
+    if tem_lotes:
+        if COL_ID_LOTE in df_lotes.columns:
+            ids_lotes = df_lotes[COL_ID_LOTE]
+            partes.append(_anomalias(ID_LOTE_DUPLICADO, "lotes", df_lotes,
+                                     np.flatnonzero(ids_lotes.duplicated(keep=False).to_numpy() & ids_lotes.notna().to_numpy())))
+
+        blocos_lotes = df_lotes[COL_ID_BLOCO].astype(object)
+        if tem_blocos:
+            orfaos = blocos_lotes.notna().to_numpy() & ~blocos_lotes.isin(df_blocos[COL_ID_BLOCO].astype(object)).to_numpy()
+            partes.append(_anomalias(BLOCO_INEXISTENTE, "lotes", df_lotes, np.flatnonzero(orfaos)))
+
+        if caixa is not None:
+            partes.append(_anomalias(FORA_DO_BAIRRO, "lotes", df_lotes, _fora_da_caixa(df_lotes, caixa)))
+
+        # Distância ao centro do bloco: mediana dos lotes do bloco (robusta ao próprio lote desviante)
+        x, y = coordenadas_metricas(df_lotes)
+        if (np.isfinite(x) & np.isfinite(y)).any():
+            codigos, _ = pd.factorize(blocos_lotes)
+            xy = pd.DataFrame({"x": x, "y": y})
+            centros = xy.groupby(codigos).transform("median")
+            distancia = np.hypot(x - centros["x"].to_numpy(), y - centros["y"].to_numpy())
+            longe = np.flatnonzero((codigos >= 0) & (distancia > distancia_max_m))
+            partes.append(_anomalias(LONGE_DO_BLOCO, "lotes", df_lotes, longe,
+                                     [f"{d:,.0f} m do centro do bloco" for d in distancia[longe]]))
+
+    partes = [p for p in partes if len(p)]
+    anomalias = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=_COLUNAS_ANOMALIAS)
+    return RelatorioAuditoria(anomalias, caixa)
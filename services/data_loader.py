@@ -1,7 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
 from urllib3.exceptions import NameResolutionError
 
-from config.settings import SPREADSHEET_ID
+from config.settings import (
+    WORKSHEET_BLOCOS,
+    WORKSHEET_LOTES,
+    DATA_LOAD_CONCURRENT,
+    DATA_LOAD_STREAMING,
+    STREAM_PAGE_ROWS,
+    COORD_DTYPE
+)
+from services.data_sources import DataSource, GoogleSheetsSource
 from services.google_sheets import GoogleSheetsService
 from services.exceptions import DataConnectionError, DataValidationError
 from config.constants import (
@@ -9,18 +20,75 @@ from config.constants import (
     REQUIRED_COLUMNS_LOTES,
     COL_LATITUDE,
     COL_LONGITUDE,
+    COL_ID_BLOCO,
+    COL_ID_LOTE,
+    COL_LINHA_PLANILHA,
+    LINHA_PRIMEIRO_REGISTRO,
     RAW_COL_COORD_BLOCOS,
-    RAW_COL_COORD_LOTES
+    RAW_COL_COORD_LOTES,
+    SCHEMA_BLOCOS,
+    SCHEMA_LOTES,
+    DTYPE_COORDENADA
 )
-from utils.coordinates import extrair_latitude_longitude
+from utils.coordinates import adicionar_coordenadas_metricas, extrair_coordenadas_vetorizado, processar_coordenadas
+from utils.helpers import iterar_com_prefetch
+
+# Contrato de cada aba: coluna bruta de coordenadas, colunas obrigatórias e schema tipado
+_ESPECIFICACOES = {
+    WORKSHEET_BLOCOS: {
+        "nome": "blocos",
+        "coluna_bruta": RAW_COL_COORD_BLOCOS,
+        "obrigatorias": REQUIRED_COLUMNS_BLOCOS,
+        "schema": SCHEMA_BLOCOS,
+    },
+    WORKSHEET_LOTES: {
+        "nome": "lotes",
+        "coluna_bruta": RAW_COL_COORD_LOTES,
+        "obrigatorias": REQUIRED_COLUMNS_LOTES,
+        "schema": SCHEMA_LOTES,
+    },
+}
+
+
+def _como_texto(serie: pd.Series) -> pd.Series:
+    """
+    Converte para texto ("string"), preservando nulos. Colunas de inteiros com células
+    vazias chegam como float64 (1.0, NaN); valores inteiros perdem o ".0", para que o
+    mesmo id tenha o mesmo texto em todas as abas.
+    """
+    if pd.api.types.is_float_dtype(serie):
+        valores = serie.dropna().to_numpy()
+        if np.array_equal(valores, np.trunc(valores)):
+            serie = serie.astype("Int64")
+    return serie.mask(serie.isna(), None).astype("string")
 
 
 class DataLoader:
-    """Classe para carregar dados das planilhas."""
+    """Classe para carregar dados das planilhas a partir de uma fonte de dados plugável."""
     
-    def __init__(self, sheets_service: GoogleSheetsService):
-        self.sheets_service = sheets_service
+    def __init__(self, source: DataSource, concorrente: bool = None, streaming: bool = None,
+                 tamanho_pagina: int = None):
+        # Compatibilidade: aceita o GoogleSheetsService diretamente
+        if isinstance(source, GoogleSheetsService):
+            source = GoogleSheetsSource(source)
+        self.source = source
+        # Modo concorrente: cada aba é baixada e processada em sua própria thread
+        self.concorrente = DATA_LOAD_CONCURRENT if concorrente is None else concorrente
+        # Modo streaming: cada aba é lida em páginas de linhas, processadas à medida que chegam
+        self.streaming = DATA_LOAD_STREAMING if streaming is None else streaming
+        self.tamanho_pagina = tamanho_pagina or STREAM_PAGE_ROWS
+        # Linhas descartadas por coordenada inválida no último carregamento, por aba ("blocos"/"lotes"):
+        # índice = posição do registro na aba; colunas valor_bruto, motivo e ids do lote/bloco
+        self.coordenadas_rejeitadas = {}
+        # Memória (bytes) por DataFrame: "antes" = registros brutos da aba (antes da normalização),
+        # "depois" = DataFrame final tipado; medidos nos mesmos pontos em todos os modos
+        self.relatorio_memoria = {}
     
+    def _iniciar_carga(self) -> None:
+        """Zera os relatórios do carregamento anterior (o loader pode ser reutilizado)."""
+        self.coordenadas_rejeitadas = {}
+        self.relatorio_memoria = {}
+
     def _validar_colunas(self, df: pd.DataFrame, colunas_obrigatorias: list[str]) -> None:
         """Valida se as colunas obrigatórias estão presentes no DataFrame."""
         if df is None or df.empty:
@@ -30,37 +98,214 @@ class DataLoader:
         if faltantes:
             raise DataValidationError(f"Colunas obrigatórias ausentes: {', '.join(faltantes)}")
 
-    def _normalizar_coordenadas(self, df: pd.DataFrame, coluna_bruta: str) -> pd.DataFrame:
+    def _normalizar_coordenadas(self, df: pd.DataFrame, coluna_bruta: str, nome: str) -> pd.DataFrame:
         """Extrai latitude e longitude de uma coluna combinada se as colunas padrão não existirem."""
         if COL_LATITUDE not in df.columns or COL_LONGITUDE not in df.columns:
             if coluna_bruta in df.columns:
-                coords = df[coluna_bruta].apply(extrair_latitude_longitude)
-                df[COL_LATITUDE] = coords.apply(lambda x: x[0])
-                df[COL_LONGITUDE] = coords.apply(lambda x: x[1])
+                coords, rejeitados = extrair_coordenadas_vetorizado(df[coluna_bruta])
+                df[COL_LATITUDE] = coords[COL_LATITUDE]
+                df[COL_LONGITUDE] = coords[COL_LONGITUDE]
+                self.coordenadas_rejeitadas[nome] = rejeitados
         return df
 
-    def carregar_dados_blocos(self) -> pd.DataFrame:
-        """Carrega dados da aba 'Bloco' da planilha."""
-        data = self.sheets_service.get_worksheet_data(SPREADSHEET_ID, worksheet_name="Bloco")
-        df = pd.DataFrame(data)
+    def _registrar_descartadas(self, df: pd.DataFrame, descartadas: pd.Index, nome: str) -> None:
+        """
+        Completa o relatório de `nome` com as linhas descartadas: as que não vieram da
+        coluna combinada recebem o par latitude/longitude bruto como valor; todas
+        recebem os ids de lote/bloco, para que possam ser localizadas na planilha.
+        """
+        rejeitadas = self.coordenadas_rejeitadas.get(nome)
+        novas = descartadas if rejeitadas is None else descartadas.difference(rejeitadas.index)
+        if len(novas):
+            lat = df.loc[novas, COL_LATITUDE].astype("string").fillna("").str.strip()
+            lon = df.loc[novas, COL_LONGITUDE].astype("string").fillna("").str.strip()
+            vazio = ((lat == "") & (lon == "")).to_numpy()
+            extras = pd.DataFrame({
+                "valor_bruto": np.where(vazio, "", (lat + ", " + lon).to_numpy(dtype=object)),
+                "motivo": np.where(vazio, "vazio", "formato inválido"),
+            }, index=novas)
+            rejeitadas = extras if rejeitadas is None else pd.concat([rejeitadas, extras]).sort_index()
+        if rejeitadas is None or rejeitadas.empty:
+            return
+        for col in (COL_ID_LOTE, COL_ID_BLOCO):
+            if col in df.columns:
+                rejeitadas[col] = df.loc[rejeitadas.index, col]
+        self.coordenadas_rejeitadas[nome] = rejeitadas
+
+    def _processar_coordenadas(self, df: pd.DataFrame, nome: str) -> pd.DataFrame:
+        """
+        Converte coordenadas para numérico, descarta linhas inválidas (registradas em
+        `coordenadas_rejeitadas`) e projeta em metros.
+        """
+        try:
+            processado = adicionar_coordenadas_metricas(processar_coordenadas(df))
+        except ValueError as ve:
+            raise DataValidationError(f"Erro ao processar coordenadas: {str(ve)}", original_error=ve)
+        self._registrar_descartadas(df, df.index.difference(processado.index), nome)
+        return processado
+
+    def _aplicar_schema(self, df: pd.DataFrame, schema: dict, nome: str, memoria_bruta: int) -> pd.DataFrame:
+        """
+        Converte as colunas presentes para os tipos compactos declarados no schema e
+        registra a memória dos registros brutos (`memoria_bruta`) e do resultado.
+        """
+        df = df.copy()
+        
+        for col, dtype in schema.items():
+            if col not in df.columns:
+                continue
+            serie = df[col]
+            if dtype == DTYPE_COORDENADA:
+                df[col] = serie.astype(COORD_DTYPE)
+            elif dtype.startswith(("Int", "UInt")):
+                # Células vazias viram NA; se algum valor não numérico seria perdido, mantém a coluna
+                serie = serie.mask(serie.astype("string").str.strip() == "")
+                numeros = pd.to_numeric(serie, errors="coerce")
+                if numeros.notna().sum() == serie.notna().sum():
+                    df[col] = numeros.astype(dtype)
+            elif dtype == "category":
+                # Valores mistos (ex.: números e texto) são unificados como texto antes da categorização
+                df[col] = _como_texto(serie).astype("category")
+            elif dtype == "string":
+                df[col] = _como_texto(serie)
+            else:
+                df[col] = serie.astype(dtype)
+        
+        depois = int(df.memory_usage(deep=True).sum())
+        self.relatorio_memoria[nome] = {"antes": memoria_bruta, "depois": depois}
+        return df
+
+    def _montar(self, worksheet, df: pd.DataFrame) -> pd.DataFrame:
+        """Normaliza, valida, processa e tipa o DataFrame bruto de uma aba."""
+        espec = _ESPECIFICACOES[worksheet]
+        memoria_bruta = int(df.memory_usage(deep=True).sum())
+        
+        # Linha de origem na planilha (índice = posição do registro na aba), antes de qualquer descarte
+        df[COL_LINHA_PLANILHA] = (df.index.to_numpy() + LINHA_PRIMEIRO_REGISTRO).astype(np.uint32)
         
         # Normalização (Adapter para o contrato interno)
-        df = self._normalizar_coordenadas(df, RAW_COL_COORD_BLOCOS)
+        df = self._normalizar_coordenadas(df, espec["coluna_bruta"], espec["nome"])
         
         # Validar colunas (Fail Fast)
-        self._validar_colunas(df, REQUIRED_COLUMNS_BLOCOS)
+        self._validar_colunas(df, espec["obrigatorias"])
         
-        return df
+        df = self._processar_coordenadas(df, espec["nome"])
+        return self._aplicar_schema(df, espec["schema"], espec["nome"], memoria_bruta)
+
+    def _montar_blocos(self, data: list[dict]) -> pd.DataFrame:
+        """Constrói e valida o DataFrame de blocos a partir dos registros brutos."""
+        return self._montar(WORKSHEET_BLOCOS, pd.DataFrame(data))
     
-    def carregar_dados_lotes(self) -> pd.DataFrame:
-        """Carrega dados da primeira aba (Lotes)."""
-        data = self.sheets_service.get_worksheet_data(SPREADSHEET_ID, worksheet_index=0)
-        df = pd.DataFrame(data)
+    def _montar_lotes(self, data: list[dict]) -> pd.DataFrame:
+        """Constrói e valida o DataFrame de lotes a partir dos registros brutos."""
+        return self._montar(WORKSHEET_LOTES, pd.DataFrame(data))
+
+    def _montar_em_paginas(self, worksheet, paginas) -> pd.DataFrame:
+        """
+        Processa uma aba página a página (streaming): cada página bruta é normalizada,
+        validada e convertida para os tipos compactos assim que chega, e só as partes
+        tipadas são mantidas até a concatenação final.
+        """
+        espec = _ESPECIFICACOES[worksheet]
+        nome = espec["nome"]
+        partes, rejeicoes = [], []
+        memoria_bruta, deslocamento = 0, 0
         
-        # Normalização (Adapter para o contrato interno)
-        df = self._normalizar_coordenadas(df, RAW_COL_COORD_LOTES)
+        for pagina in iterar_com_prefetch(paginas):
+            # Índice global, para que o relatório de rejeições aponte a linha correta
+            pagina.index = pd.RangeIndex(deslocamento, deslocamento + len(pagina))
+            deslocamento += len(pagina)
+            memoria_bruta += int(pagina.memory_usage(deep=True).sum())
+            
+            # Validação por página: colunas ausentes interrompem o download na primeira página
+            partes.append(self._montar(worksheet, pagina))
+            if nome in self.coordenadas_rejeitadas:
+                rejeicoes.append(self.coordenadas_rejeitadas.pop(nome))
         
-        # Validar colunas (Fail Fast)
-        self._validar_colunas(df, REQUIRED_COLUMNS_LOTES)
+        if not partes:
+            raise DataValidationError("O DataFrame retornado está vazio.")
+        if rejeicoes:
+            self.coordenadas_rejeitadas[nome] = pd.concat(rejeicoes)
         
-        return df
+        # Categorias diferem entre páginas: concatenar e unificar os tipos
+        return self._aplicar_schema(pd.concat(partes, ignore_index=True), espec["schema"], nome, memoria_bruta)
+
+    def _carregar_aba(self, worksheet) -> pd.DataFrame:
+        if self.streaming:
+            return self._montar_em_paginas(worksheet, self.source.iter_pages(worksheet, self.tamanho_pagina))
+        data = self.source.get_records([worksheet])[worksheet]
+        return self._montar(worksheet, pd.DataFrame(data))
+
+    def _carregar_concorrente(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Baixa e processa blocos e lotes em paralelo: o processamento de uma aba
+        começa assim que ela chega, enquanto a outra ainda está em download.
+        Erros são propagados após ambas as tarefas terminarem (blocos primeiro).
+        """
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="carregar-aba") as executor:
+            futuro_blocos = executor.submit(self._carregar_aba, WORKSHEET_BLOCOS)
+            futuro_lotes = executor.submit(self._carregar_aba, WORKSHEET_LOTES)
+        return futuro_blocos.result(), futuro_lotes.result()
+
+    def _carregar_por_aba(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """Carrega cada aba separadamente (em paralelo no modo concorrente)."""
+        if self.concorrente:
+            return self._carregar_concorrente()
+        return self._carregar_aba(WORKSHEET_BLOCOS), self._carregar_aba(WORKSHEET_LOTES)
+
+    def carregar_dados(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Carrega blocos e lotes: em uma única leitura em lote ou, nos modos
+        concorrente/streaming, aba por aba.
+        """
+        self._iniciar_carga()
+        if self.concorrente or self.streaming:
+            return self._carregar_por_aba()
+        dados = self.source.get_records([WORKSHEET_BLOCOS, WORKSHEET_LOTES])
+        return self._montar_blocos(dados[WORKSHEET_BLOCOS]), self._montar_lotes(dados[WORKSHEET_LOTES])
+
+    def relatorio_carga(self) -> dict:
+        """
+        Relatório serializável (JSON) do último carregamento, guardado nos metadados do
+        snapshot: linhas descartadas por coordenada inválida, com o número da linha na
+        planilha, e a memória (bytes) de cada DataFrame antes/depois do schema tipado.
+        """
+        rejeitadas = []
+        for nome, df in self.coordenadas_rejeitadas.items():
+            tabela = df.reindex(columns=[COL_ID_LOTE, COL_ID_BLOCO, "valor_bruto", "motivo"])
+            tabela["valor_bruto"] = tabela["valor_bruto"].astype("string").fillna("")
+            tabela = tabela.astype(object).where(tabela.notna(), None)
+            linhas = (df.index.to_numpy() + LINHA_PRIMEIRO_REGISTRO).tolist()
+            rejeitadas += [{"aba": nome, "linha": linha, **registro}
+                           for linha, registro in zip(linhas, tabela.to_dict("records"))]
+        return {"coordenadas_rejeitadas": rejeitadas, "memoria": dict(self.relatorio_memoria)}
+
+    def carregar_dados_se_alterado(self, revisao_conhecida: str = None):
+        """
+        Carrega blocos e lotes apenas se a planilha mudou desde `revisao_conhecida`.
+        Retorna (revisao, (df_blocos, df_lotes, relatorio_carga)) ou (revisao, None) se nada mudou.
+        """
+        self._iniciar_carga()
+        if self.concorrente or self.streaming:
+            revisao = self.source.get_revision()
+            if revisao is not None and revisao == revisao_conhecida:
+                return revisao, None
+            return revisao, (*self._carregar_por_aba(), self.relatorio_carga())
+        
+        revisao, dados = self.source.get_records_if_changed(
+            [WORKSHEET_BLOCOS, WORKSHEET_LOTES], revisao_conhecida
+        )
+        if dados is None:
+            return revisao, None
+        df_blocos, df_lotes = self._montar_blocos(dados[WORKSHEET_BLOCOS]), self._montar_lotes(dados[WORKSHEET_LOTES])
+        return revisao, (df_blocos, df_lotes, self.relatorio_carga())
+
+    def carregar_dados_blocos(self) -> pd.DataFrame:
+        """Carrega dados da aba 'Bloco' da planilha."""
+        self._iniciar_carga()
+        return self._carregar_aba(WORKSHEET_BLOCOS)
+    
+    def carregar_dados_lotes(self) -> pd.DataFrame:
+        """Carrega dados da primeira aba (Lotes)."""
+        self._iniciar_carga()
+        return self._carregar_aba(WORKSHEET_LOTES)
@@ -0,0 +1,288 @@
+import os
+import random
+import sqlite3
+from contextlib import closing
+import time
+from abc import ABC, abstractmethod
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from config.settings import SPREADSHEET_ID, WORKSHEET_BLOCOS, WORKSHEET_LOTES, DATA_SOURCE_FAKE_SEED
+from config.constants import CORES_USO_LOTE
+from services.google_sheets import GoogleSheetsService
+from services.exceptions import AppError, DataConnectionError, DataNotFoundError, DataValidationError
+
+# Nome do arquivo/tabela local correspondente a cada aba da planilha
+NOMES_PADRAO = {
+    WORKSHEET_BLOCOS: "blocos",
+    WORKSHEET_LOTES: "lotes",
+}
+
+# Tipologias usadas apenas na geração de dados sintéticos
+_TIPOLOGIAS_SINTETICAS = ["Térrea", "Sobrado", "Edifício", "Galpão", "Sem edificação"]
+
+
+class DataSource(ABC):
+    """
+    Interface de fonte de dados consumida pelo DataLoader.
+
+    Abas são identificadas como na planilha (nome ou índice) e os dados são
+    devolvidos no formato de `get_all_records`: uma lista de dicts por aba.
+    """
+
+    @abstractmethod
+    def get_records(self, worksheets: list) -> dict:
+        """Retorna {aba: registros} para cada aba solicitada."""
+
+    def get_revision(self):
+        """Marcador barato de revisão da fonte. None significa "desconhecida"."""
+        return None
+
+    def iter_pages(self, worksheet, tamanho_pagina: int):
+        """
+        Produz a aba em páginas (DataFrames brutos) de até `tamanho_pagina` linhas.
+        Implementação padrão: uma única página com a aba inteira.
+        """
+        yield pd.DataFrame(self.get_records([worksheet])[worksheet])
+
+    def get_records_if_changed(self, worksheets: list, revisao_conhecida: str = None):
+        """Retorna (revisao, dados), com `dados` None se nada mudou desde `revisao_conhecida`."""
+        revisao = self.get_revision()
+        if revisao is not None and revisao == revisao_conhecida:
+            return revisao, None
+        return revisao, self.get_records(worksheets)
+
+
+class GoogleSheetsSource(DataSource):
+    """Fonte de dados baseada no GoogleSheetsService (produção)."""
+
+    def __init__(self, sheets_service: GoogleSheetsService, spreadsheet_id: str = None):
+        self.sheets_service = sheets_service
+        self.spreadsheet_id = spreadsheet_id or SPREADSHEET_ID
+
+    def get_records(self, worksheets: list) -> dict:
+        return self.sheets_service.get_many_worksheets(self.spreadsheet_id, worksheets)
+
+    def get_revision(self):
+        return self.sheets_service.get_revision(self.spreadsheet_id)
+
+    def get_records_if_changed(self, worksheets: list, revisao_conhecida: str = None):
+        return self.sheets_service.get_many_worksheets_if_changed(
+            self.spreadsheet_id, worksheets, revisao_conhecida
+        )
+
+    def iter_pages(self, worksheet, tamanho_pagina: int):
+        return self.sheets_service.iter_worksheet_pages(self.spreadsheet_id, worksheet, tamanho_pagina)
+
+
+class LocalFileSource(DataSource):
+    """Fonte de dados em arquivos locais (`<nome>.parquet` ou `<nome>.csv`) em um diretório."""
+
+    EXTENSOES = (".parquet", ".csv")
+
+    def __init__(self, diretorio: str, nomes: dict = None):
+        self.diretorio = diretorio
+        self.nomes = nomes or NOMES_PADRAO
+
+    def _resolver_arquivo(self, worksheet) -> str:
+        nome = self.nomes.get(worksheet, str(worksheet))
+        for ext in self.EXTENSOES:
+            caminho = os.path.join(self.diretorio, nome + ext)
+            if os.path.exists(caminho):
+                return caminho
+        raise DataNotFoundError(f"Arquivo não encontrado para a aba {worksheet}: {nome}.parquet/.csv em {self.diretorio}")
+
+    def get_records(self, worksheets: list) -> dict:
+        dados = {}
+        for ws in worksheets:
+            caminho = self._resolver_arquivo(ws)
+            try:
+                if caminho.endswith(".parquet"):
+                    df = pd.read_parquet(caminho)
+                else:
+                    # Células vazias como "" (mesmo comportamento de get_all_records)
+                    df = pd.read_csv(caminho, keep_default_na=False)
+            except Exception as e:
+                raise DataConnectionError(f"Erro ao ler arquivo local: {caminho}", original_error=e)
+            dados[ws] = df.to_dict("records")
+        return dados
+
+    def iter_pages(self, worksheet, tamanho_pagina: int):
+        caminho = self._resolver_arquivo(worksheet)
+        try:
+            if caminho.endswith(".parquet"):
+                arquivo = pq.ParquetFile(caminho)
+                for lote in arquivo.iter_batches(batch_size=tamanho_pagina):
+                    yield lote.to_pandas()
+            else:
+                with pd.read_csv(caminho, keep_default_na=False, chunksize=tamanho_pagina) as leitor:
+                    yield from leitor
+        except Exception as e:
+            raise DataConnectionError(f"Erro ao ler arquivo local: {caminho}", original_error=e)
+
+    def get_revision(self):
+        try:
+            stats = [os.stat(self._resolver_arquivo(ws)) for ws in self.nomes]
+        except (AppError, OSError):
+            return None
+        return ";".join(f"{s.st_mtime_ns}:{s.st_size}" for s in stats)
+
+
+class SQLiteSource(DataSource):
+    """Fonte de dados em um banco SQLite, com uma tabela por aba."""
+
+    def __init__(self, caminho: str, nomes: dict = None):
+        self.caminho = caminho
+        self.nomes = nomes or NOMES_PADRAO
+
+    def _consultar(self, conn: sqlite3.Connection, worksheet) -> sqlite3.Cursor:
+        """Executa SELECT * na tabela correspondente à aba."""
+        tabela = self.nomes.get(worksheet, str(worksheet))
+        try:
+            return conn.execute(f'SELECT * FROM "{tabela.replace(chr(34), chr(34) * 2)}"')
+        except sqlite3.OperationalError as e:
+            if "no such table" in str(e):
+                raise DataNotFoundError(f"Tabela não encontrada: {tabela}", original_error=e)
+            raise
+
+    def get_records(self, worksheets: list) -> dict:
+        if not os.path.exists(self.caminho):
+            raise DataNotFoundError(f"Banco SQLite não encontrado: {self.caminho}")
+
+        dados = {}
+        try:
+            with closing(sqlite3.connect(self.caminho)) as conn:
+                for ws in worksheets:
+                    cursor = self._consultar(conn, ws)
+                    colunas = [d[0] for d in cursor.description]
+                    dados[ws] = [dict(zip(colunas, linha)) for linha in cursor]
+        except AppError:
+            raise
+        except Exception as e:
+            raise DataConnectionError(f"Erro ao ler banco SQLite: {self.caminho}", original_error=e)
+        return dados
+
+    def iter_pages(self, worksheet, tamanho_pagina: int):
+        if not os.path.exists(self.caminho):
+            raise DataNotFoundError(f"Banco SQLite não encontrado: {self.caminho}")
+
+        try:
+            with closing(sqlite3.connect(self.caminho)) as conn:
+                cursor = self._consultar(conn, worksheet)
+                colunas = [d[0] for d in cursor.description]
+                while True:
+                    linhas = cursor.fetchmany(tamanho_pagina)
+                    if not linhas:
+                        break
+                    yield pd.DataFrame.from_records(linhas, columns=colunas)
+        except AppError:
+            raise
+        except Exception as e:
+            raise DataConnectionError(f"Erro ao ler banco SQLite: {self.caminho}", original_error=e)
+
+    def get_revision(self):
+        try:
+            s = os.stat(self.caminho)
+        except OSError:
+            return None
+        return f"{s.st_mtime_ns}:{s.st_size}"
+
+
+class FakeSheetsSource(DataSource):
+    """
+    Substituto em memória do Google Sheets para benchmarks e testes de carga offline.
+
+    Simula a latência de rede por aba lida e injeta falhas com a probabilidade
+    `taxa_erro`, lançando `erro` (por padrão DataConnectionError).
+    """
+
+    def __init__(self, dados: dict = None, latencia: float = 0.0, taxa_erro: float = 0.0,
+                 erro: type = DataConnectionError, seed: int = None):
+        self.dados = dados if dados is not None else gerar_dados_sinteticos(seed=seed)
+        self.latencia = latencia
+        self.taxa_erro = taxa_erro
+        self.erro = erro
+        self.revisao = 1
+        self.chamadas = 0
+        self._rng = random.Random(seed)
+
+    def _simular_rede(self) -> None:
+        self.chamadas += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        if self.taxa_erro and self._rng.random() < self.taxa_erro:
+            raise self.erro("Falha simulada na fonte de dados")
+
+    def atualizar_aba(self, worksheet, registros: list) -> None:
+        """Substitui os registros de uma aba e avança a revisão (simula edição na planilha)."""
+        self.dados[worksheet] = registros
+        self.revisao += 1
+
+    def get_records(self, worksheets: list) -> dict:
+        dados = {}
+        for ws in worksheets:
+            self._simular_rede()
+            if ws not in self.dados:
+                raise DataNotFoundError(f"Aba não encontrada: {ws}")
+            dados[ws] = [dict(r) for r in self.dados[ws]]
+        return dados
+
+    def iter_pages(self, worksheet, tamanho_pagina: int):
+        if worksheet not in self.dados:
+            raise DataNotFoundError(f"Aba não encontrada: {worksheet}")
+        registros = self.dados[worksheet]
+        for inicio in range(0, len(registros), tamanho_pagina):
+            self._simular_rede()
+            yield pd.DataFrame(registros[inicio:inicio + tamanho_pagina])
+
+    def get_revision(self):
+        self._simular_rede()
+        return str(self.revisao)
+
+
+def gerar_dados_sinteticos(n_blocos: int = 80, lotes_por_bloco: int = 20, seed: int = None,
+                           centro: tuple = (-3.2047, -52.2113), raio_graus: float = 0.01) -> dict:
+    """
+    Gera registros sintéticos no formato bruto da planilha (coordenadas combinadas
+    "lat, lon"), para exercitar ingestão e renderização em escala realista.
+    """
+    rng = random.Random(seed)
+    usos = list(CORES_USO_LOTE.keys())
+    blocos, lotes = [], []
+    for b in range(1, n_blocos + 1):
+        id_bloco = f"B_{b:03d}"
+        lat_b = centro[0] + rng.uniform(-raio_graus, raio_graus)
+        lon_b = centro[1] + rng.uniform(-raio_graus, raio_graus)
+        blocos.append({"id_bloco": id_bloco, "latitude_longitude_bloco": f"{lat_b:.6f}, {lon_b:.6f}"})
+        for n in range(1, lotes_por_bloco + 1):
+            lotes.append({
+                "id_lote": f"{id_bloco}_L{n:03d}",
+                "id_bloco": id_bloco,
+                "id_quadra": f"Q_{b:03d}",
+                "uso_lote": rng.choice(usos),
+                "tipologia": rng.choice(_TIPOLOGIAS_SINTETICAS),
+                "nome_fantasia": "",
+                "rua": f"Rua {b}",
+                "numero": n,
+                "latitude_longitude": f"{lat_b + rng.uniform(-2e-4, 2e-4):.6f}, {lon_b + rng.uniform(-2e-4, 2e-4):.6f}",
+            })
+    return {WORKSHEET_BLOCOS: blocos, WORKSHEET_LOTES: lotes}
+
+
+def criar_fonte_dados(tipo: str, caminho: str = None, sheets_service: GoogleSheetsService = None) -> DataSource:
+    """Fábrica de fontes de dados: 'sheets', 'arquivo', 'sqlite' ou 'fake'."""
+    if tipo == "sheets":
+        return GoogleSheetsSource(sheets_service or GoogleSheetsService())
+    if tipo in ("arquivo", "sqlite") and not caminho:
+        raise DataValidationError(
+            f"A fonte de dados '{tipo}' exige um caminho: defina a variável de ambiente LNB_DATA_SOURCE_PATH."
+        )
+    if tipo == "arquivo":
+        return LocalFileSource(caminho)
+    if tipo == "sqlite":
+        return SQLiteSource(caminho)
+    if tipo == "fake":
+        # Semente fixa: o app recria a fonte a cada rerun e os dados devem corresponder à revisão
+        return FakeSheetsSource(seed=DATA_SOURCE_FAKE_SEED)
+    raise DataValidationError(f"Fonte de dados desconhecida: {tipo}")
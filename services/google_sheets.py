@@ -1,41 +1,210 @@
 import os
+import random
+import threading
+import time
 import gspread
+import pandas as pd
+import requests
+from google.auth.exceptions import RefreshError
+from gspread.utils import absolute_range_name, fill_gaps, numericise_all, to_records
 from oauth2client.service_account import ServiceAccountCredentials
 
 from config.constants import GOOGLE_SCOPES
-from config.settings import CREDENTIALS_FILE
+from config.settings import (
+    CREDENTIALS_FILE,
+    SHEETS_RATE_LIMIT_PER_MIN,
+    SHEETS_RATE_BURST,
+    SHEETS_MAX_RETRIES,
+    SHEETS_BACKOFF_BASE,
+    SHEETS_BACKOFF_MAX,
+)
 from services.exceptions import DataConnectionError, DataPermissionError, DataNotFoundError
+from services.sheets_client_pool import SheetsClientPool, chave_credenciais
+
+# Códigos HTTP que indicam falha transitória (quota excedida ou erro do servidor)
+STATUS_TRANSITORIOS = {429, 500, 502, 503, 504}
+# Códigos HTTP de credencial inválida/revogada ou sem permissão
+STATUS_AUTENTICACAO = {401, 403}
+
+
+def _status_http(e: gspread.exceptions.APIError):
+    status = getattr(e, "code", None)
+    if status is None and getattr(e, "response", None) is not None:
+        status = e.response.status_code
+    return status
+
+
+def _erro_transitorio(e: Exception) -> bool:
+    """Indica se a exceção vale uma nova tentativa (429, 5xx ou falha de rede)."""
+    if isinstance(e, gspread.exceptions.APIError):
+        return _status_http(e) in STATUS_TRANSITORIOS
+    return isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+def _erro_autenticacao(e: Exception) -> bool:
+    """Indica se a exceção aponta para credenciais inválidas/revogadas (401/403, token que não renova)."""
+    if isinstance(e, (DataPermissionError, RefreshError)):
+        return True
+    if isinstance(e, gspread.exceptions.APIError):
+        return _status_http(e) in STATUS_AUTENTICACAO
+    return False
+
+
+class TokenBucket:
+    """Limitador de taxa token bucket (thread-safe): `taxa` tokens/s, até `capacidade` acumulados."""
+
+    def __init__(self, taxa: float, capacidade: int):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self._tokens = float(capacidade)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def adquirir(self) -> None:
+        """Bloqueia até haver um token disponível e o consome."""
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._tokens = min(self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa)
+                self._ultimo = agora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.taxa
+            time.sleep(espera)
+
+
+class _ChamadaEmAndamento:
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+
+class SheetsRequestScheduler:
+    """
+    Agendador de requisições ao Google Sheets, compartilhado pelo processo.
+
+    - Coalescência (single-flight): chamadas concorrentes idênticas compartilham uma única execução.
+    - Limite de taxa: token bucket ajustado à quota de leitura da API.
+    - Novas tentativas: backoff exponencial com jitter para 429/5xx e falhas de rede.
+    """
+
+    _instancia = None
+    _lock_instancia = threading.Lock()
+
+    def __init__(self, limite_por_minuto: int = SHEETS_RATE_LIMIT_PER_MIN, rajada: int = SHEETS_RATE_BURST,
+                 max_tentativas: int = SHEETS_MAX_RETRIES, backoff_base: float = SHEETS_BACKOFF_BASE,
+                 backoff_max: float = SHEETS_BACKOFF_MAX):
+        self.bucket = TokenBucket(limite_por_minuto / 60.0, rajada)
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._em_andamento = {}
+
+    @classmethod
+    def default(cls) -> "SheetsRequestScheduler":
+        """Retorna o agendador único do processo."""
+        with cls._lock_instancia:
+            if cls._instancia is None:
+                cls._instancia = cls()
+            return cls._instancia
+
+    def _espera_backoff(self, tentativa: int) -> float:
+        """Backoff exponencial com jitter completo."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** tentativa)))
+
+    def executar(self, fn, *args, **kwargs):
+        """Executa uma requisição respeitando o limite de taxa, com novas tentativas em falhas transitórias."""
+        tentativa = 0
+        while True:
+            self.bucket.adquirir()
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not _erro_transitorio(e) or tentativa >= self.max_tentativas:
+                    raise
+            time.sleep(self._espera_backoff(tentativa))
+            tentativa += 1
+
+    def coalescer(self, chave, fn):
+        """Executa `fn()` uma única vez para chamadas concorrentes com a mesma `chave`."""
+        with self._lock:
+            chamada = self._em_andamento.get(chave)
+            lider = chamada is None
+            if lider:
+                chamada = self._em_andamento[chave] = _ChamadaEmAndamento()
+
+        if not lider:
+            chamada.evento.wait()
+            if chamada.erro is not None:
+                raise chamada.erro
+            return chamada.resultado
+
+        try:
+            chamada.resultado = fn()
+            return chamada.resultado
+        except Exception as e:
+            chamada.erro = e
+            raise
+        finally:
+            with self._lock:
+                self._em_andamento.pop(chave, None)
+            chamada.evento.set()
 
 
 class GoogleSheetsService:
     """Serviço para conexão com Google Sheets."""
     
-    def __init__(self, credentials_dict: dict = None, credentials_file: str = None):
+    def __init__(self, credentials_dict: dict = None, credentials_file: str = None,
+                 client_pool: SheetsClientPool = None, scheduler: SheetsRequestScheduler = None):
         self.client = None
         self.credentials_dict = credentials_dict
         self.credentials_file = credentials_file or CREDENTIALS_FILE
+        self.client_pool = client_pool or SheetsClientPool.default()
+        self.scheduler = scheduler or SheetsRequestScheduler.default()
+    
+    def _criar_cliente(self):
+        """Cria as credenciais e autoriza um novo cliente gspread."""
+        if self.credentials_dict:
+            creds = ServiceAccountCredentials.from_json_keyfile_dict(
+                dict(self.credentials_dict), GOOGLE_SCOPES
+            )
+        elif os.path.exists(self.credentials_file):
+            creds = ServiceAccountCredentials.from_json_keyfile_name(
+                self.credentials_file, GOOGLE_SCOPES
+            )
+        else:
+            raise DataPermissionError("Credenciais não encontradas. Configure o arquivo credentials.json ou st.secrets.")
+        
+        return gspread.authorize(creds)
+    
+    def _descartar_cliente(self) -> None:
+        """
+        Remove o cliente do pool do processo: a próxima chamada reautentica em vez
+        de reutilizar credenciais revogadas ou um token que não renova.
+        """
+        self.client = None
+        self.client_pool.descartar(chave_credenciais(self.credentials_dict, self.credentials_file))
+    
+    def _descartar_cliente_se_autenticacao(self, e: Exception) -> None:
+        """Descarta o cliente do pool se `e` for um erro de autenticação/permissão."""
+        if _erro_autenticacao(e):
+            self._descartar_cliente()
     
     def authenticate(self):
-        """Autentica e retorna cliente do Google Sheets."""
+        """Autentica e retorna cliente do Google Sheets (compartilhado via pool do processo)."""
         if self.client:
             return self.client
         
         try:
-            if self.credentials_dict:
-                creds = ServiceAccountCredentials.from_json_keyfile_dict(
-                    dict(self.credentials_dict), GOOGLE_SCOPES
-                )
-            elif os.path.exists(self.credentials_file):
-                creds = ServiceAccountCredentials.from_json_keyfile_name(
-                    self.credentials_file, GOOGLE_SCOPES
-                )
-            else:
-                raise DataPermissionError("Credenciais não encontradas. Configure o arquivo credentials.json ou st.secrets.")
-            
-            self.client = gspread.authorize(creds)
+            chave = chave_credenciais(self.credentials_dict, self.credentials_file)
+            self.client = self.client_pool.obter(chave, self._criar_cliente)
             return self.client
             
         except Exception as e:
+            self._descartar_cliente_se_autenticacao(e)
             if isinstance(e, DataPermissionError):
                 raise e
             raise DataConnectionError("Falha na autenticação com Google Sheets", original_error=e)
@@ -44,34 +213,184 @@ class GoogleSheetsService:
         """Retorna uma planilha pelo ID."""
         try:
             client = self.authenticate()
-            return client.open_by_key(spreadsheet_id)
+            return self.scheduler.executar(client.open_by_key, spreadsheet_id)
         except gspread.SpreadsheetNotFound:
             raise DataNotFoundError(f"Planilha não encontrada: {spreadsheet_id}")
         except Exception as e:
+            self._descartar_cliente_se_autenticacao(e)
             if isinstance(e, (DataConnectionError, DataPermissionError)):
                 raise e
             if "403" in str(e) or "permission" in str(e).lower():
+                self._descartar_cliente()
                 raise DataPermissionError(f"Permissão negada para acessar planilha: {spreadsheet_id}", original_error=e)
             raise DataConnectionError(f"Erro ao acessar planilha: {spreadsheet_id}", original_error=e)
     
+    def get_spreadsheet_metadata(self, spreadsheet_id: str) -> dict:
+        """
+        Metadados da planilha (propriedades e abas) em uma única requisição: a mesma
+        que `open_by_key` faz, mas mantendo a lista de abas (títulos e índices), que o
+        objeto Spreadsheet descarta.
+        """
+        try:
+            client = self.authenticate()
+            return self.scheduler.executar(client.http_client.fetch_sheet_metadata, spreadsheet_id)
+        except gspread.exceptions.APIError as e:
+            self._descartar_cliente_se_autenticacao(e)
+            status = _status_http(e)
+            if status == 404:
+                raise DataNotFoundError(f"Planilha não encontrada: {spreadsheet_id}", original_error=e)
+            if status == 403:
+                raise DataPermissionError(f"Permissão negada para acessar planilha: {spreadsheet_id}", original_error=e)
+            raise
+    
+    def get_revision(self, spreadsheet_id: str):
+        """
+        Retorna um marcador barato de revisão da planilha (modifiedTime do Drive),
+        sem baixar valores. Retorna None se o marcador não puder ser obtido, o que
+        deve ser tratado como "revisão desconhecida" (forçar download completo).
+        """
+        def _buscar():
+            client = self.authenticate()
+            metadata = self.scheduler.executar(client.http_client.get_file_drive_metadata, spreadsheet_id)
+            return metadata.get("modifiedTime")
+        
+        try:
+            return self.scheduler.coalescer(("revision", spreadsheet_id), _buscar)
+        except Exception as e:
+            self._descartar_cliente_se_autenticacao(e)
+            return None
+    
+    def get_many_worksheets_if_changed(self, spreadsheet_id: str, worksheets: list, revisao_conhecida: str = None):
+        """
+        Consulta a revisão antes de baixar as abas.
+        Retorna (revisao, dados), onde `dados` é None se a planilha não mudou desde `revisao_conhecida`.
+        """
+        revisao = self.get_revision(spreadsheet_id)
+        if revisao is not None and revisao == revisao_conhecida:
+            return revisao, None
+        return revisao, self.get_many_worksheets(spreadsheet_id, worksheets)
+    
     def get_worksheet_data(self, spreadsheet_id: str, worksheet_name: str = None, worksheet_index: int = None):
         """Retorna dados de uma aba específica."""
-        try:
+        def _buscar():
             spreadsheet = self.get_spreadsheet(spreadsheet_id)
             
             try:
                 if worksheet_name:
-                    worksheet = spreadsheet.worksheet(worksheet_name)
+                    worksheet = self.scheduler.executar(spreadsheet.worksheet, worksheet_name)
                 elif worksheet_index is not None:
-                    worksheet = spreadsheet.get_worksheet(worksheet_index)
+                    worksheet = self.scheduler.executar(spreadsheet.get_worksheet, worksheet_index)
                 else:
-                    worksheet = spreadsheet.get_worksheet(0)
+                    worksheet = self.scheduler.executar(spreadsheet.get_worksheet, 0)
             except gspread.WorksheetNotFound:
                 raise DataNotFoundError(f"Aba não encontrada: {worksheet_name if worksheet_name else f'index {worksheet_index}'}")
             
-            return worksheet.get_all_records()
+            return self.scheduler.executar(worksheet.get_all_records)
+        
+        try:
+            return self.scheduler.coalescer(("worksheet", spreadsheet_id, worksheet_name, worksheet_index), _buscar)
+        except Exception as e:
+            self._descartar_cliente_se_autenticacao(e)
+            if isinstance(e, (DataConnectionError, DataPermissionError, DataNotFoundError)):
+                raise e
+            raise DataConnectionError("Erro ao ler dados da planilha", original_error=e)
+
+    def get_many_worksheets(self, spreadsheet_id: str, worksheets: list) -> dict:
+        """
+        Retorna dados de várias abas em uma única requisição em lote (values.batchGet).
+        Cada item de `worksheets` pode ser o nome (str) ou o índice (int) da aba;
+        o dicionário retornado usa os mesmos identificadores como chave.
+        """
+        def _buscar():
+            # Uma requisição de metadados (equivale a abrir a planilha) já traz os títulos
+            # das abas, usados para resolver índices sem uma segunda chamada
+            metadados = self.get_spreadsheet_metadata(spreadsheet_id)
+            abas = [aba["properties"]["title"] for aba in metadados.get("sheets", [])]
+            titulos = {}
+            for ws in worksheets:
+                if isinstance(ws, int):
+                    if not 0 <= ws < len(abas):
+                        raise DataNotFoundError(f"Aba não encontrada: index {ws}")
+                    titulos[ws] = abas[ws]
+                else:
+                    titulos[ws] = ws
+            
+            ranges = [absolute_range_name(titulos[ws]) for ws in worksheets]
+            try:
+                response = self.scheduler.executar(
+                    self.authenticate().http_client.values_batch_get, spreadsheet_id, ranges
+                )
+            except gspread.exceptions.APIError as e:
+                if "Unable to parse range" in str(e):
+                    raise DataNotFoundError(f"Aba não encontrada: {', '.join(map(str, worksheets))}", original_error=e)
+                raise
             
+            value_ranges = response.get("valueRanges", [])
+            return {
+                ws: self._valores_para_registros(vr.get("values", []))
+                for ws, vr in zip(worksheets, value_ranges)
+            }
+        
+        try:
+            return self.scheduler.coalescer(("batch", spreadsheet_id, tuple(worksheets)), _buscar)
+        except Exception as e:
+            self._descartar_cliente_se_autenticacao(e)
+            if isinstance(e, (DataConnectionError, DataPermissionError, DataNotFoundError)):
+                raise e
+            if _erro_transitorio(e):
+                raise DataConnectionError("Limite de requisições ou instabilidade do Google Sheets; tente novamente em instantes", original_error=e)
+            raise DataConnectionError("Erro ao ler dados da planilha", original_error=e)
+    
+    def iter_worksheet_pages(self, spreadsheet_id: str, worksheet, tamanho_pagina: int):
+        """
+        Lê uma aba em páginas de `tamanho_pagina` linhas (intervalos de linhas A1),
+        produzindo um DataFrame bruto por página. Evita materializar a aba inteira
+        como lista de dicts e permite processar uma página enquanto a próxima chega.
+
+        A grade da aba (`row_count`) costuma ter muitas linhas vazias após os dados: a
+        leitura termina na primeira página vazia, sem gastar requisições com o restante.
+        """
+        try:
+            spreadsheet = self.get_spreadsheet(spreadsheet_id)
+            try:
+                if isinstance(worksheet, int):
+                    aba = self.scheduler.executar(spreadsheet.get_worksheet, worksheet)
+                else:
+                    aba = self.scheduler.executar(spreadsheet.worksheet, worksheet)
+            except gspread.WorksheetNotFound:
+                raise DataNotFoundError(f"Aba não encontrada: {worksheet}")
+            if aba is None:
+                raise DataNotFoundError(f"Aba não encontrada: index {worksheet}")
+            
+            resposta = self.scheduler.executar(spreadsheet.values_get, absolute_range_name(aba.title, "1:1"))
+            cabecalho = (resposta.get("values") or [[]])[0]
+            n_colunas = len(cabecalho)
+            
+            for inicio in range(2, aba.row_count + 1, tamanho_pagina):
+                fim = min(inicio + tamanho_pagina - 1, aba.row_count)
+                resposta = self.scheduler.executar(
+                    spreadsheet.values_get, absolute_range_name(aba.title, f"{inicio}:{fim}")
+                )
+                linhas = resposta.get("values", [])
+                if not linhas:
+                    break
+                # Mesmo formato de get_all_records: preencher/cortar pela largura do cabeçalho e numericizar
+                linhas = [numericise_all(linha[:n_colunas]) for linha in fill_gaps(linhas, cols=n_colunas)]
+                yield pd.DataFrame(linhas, columns=cabecalho)
+                
         except Exception as e:
+            self._descartar_cliente_se_autenticacao(e)
             if isinstance(e, (DataConnectionError, DataPermissionError, DataNotFoundError)):
                 raise e
             raise DataConnectionError("Erro ao ler dados da planilha", original_error=e)
+    
+    @staticmethod
+    def _valores_para_registros(values: list) -> list[dict]:
+        """Converte a matriz de valores (cabeçalho na 1ª linha) no mesmo formato de get_all_records."""
+        if not values or values == [[]]:
+            return []
+        
+        values = fill_gaps(values)
+        keys, rows = values[0], values[1:]
+        rows = [numericise_all(row) for row in rows]
+        return to_records(keys, rows)
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+from config.constants import COL_ID_BLOCO, COL_USO_LOTE
+
+
+class _Particao:
+    """Posições das linhas agrupadas por valor de uma coluna (ordenação estável por código)."""
+
+    def __init__(self, serie: pd.Series):
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            codigos, rotulos = serie.cat.codes.to_numpy(), serie.cat.categories
+        else:
+            codigos, rotulos = pd.factorize(serie.astype(object))
+        self.rotulos = pd.Index(np.asarray(rotulos, dtype=object))
+        # Nulos (-1) ficam fora das partições
+        validos = np.flatnonzero(codigos >= 0)
+        self.ordem = validos[np.argsort(codigos[validos], kind="stable")]
+        self.limites = np.concatenate([[0], np.cumsum(np.bincount(codigos[validos], minlength=len(self.rotulos)))])
+
+    def posicoes(self, valor) -> np.ndarray:
+        """Posições (crescentes) das linhas com o valor, ou com qualquer um dos valores de uma lista."""
+        valores = valor if isinstance(valor, (list, tuple, set)) else [valor]
+        codigos = self.rotulos.get_indexer(list(valores))
+        codigos = np.unique(codigos[codigos >= 0])
+        if len(codigos) == 1:
+            # Fatia do array pré-computado (view, sem cópia)
+            return self.ordem[self.limites[codigos[0]]:self.limites[codigos[0] + 1]]
+        partes = [self.ordem[self.limites[c]:self.limites[c + 1]] for c in codigos]
+        return np.sort(np.concatenate(partes)) if partes else np.array([], dtype=np.int64)
+
+
+class IndiceLotes:
+    """
+    Índice dos lotes por uso_lote e por id_bloco, montado uma vez por versão dos dados.
+    Os filtros viram `take` das posições pré-computadas, sem máscara booleana sobre
+    todas as linhas; o resultado mantém a ordem original dos lotes.
+    """
+
+    COLUNAS = (COL_USO_LOTE, COL_ID_BLOCO)
+
+    def __init__(self, df_lotes: pd.DataFrame):
+        self.df = df_lotes
+        self._particoes = {
+            coluna: _Particao(df_lotes[coluna])
+            for coluna in self.COLUNAS
+            if df_lotes is not None and coluna in df_lotes.columns
+        }
+
+    def posicoes(self, coluna: str, valor) -> np.ndarray:
+        """Posições das linhas em que `coluna` vale `valor` (ou um dos valores de uma lista)."""
+        return self._particoes[coluna].posicoes(valor)
+
+    def filtrar(self, coluna: str, valor) -> pd.DataFrame:
+        """Equivalente a `df[df[coluna].isin(valores)]`, via `take` das posições indexadas."""
+        return self.df.take(self.posicoes(coluna, valor))
+
+    def por_uso(self, uso) -> pd.DataFrame:
+        """Lotes com o uso informado (aceita lista, como no multiselect do mapa de calor)."""
+        return self.filtrar(COL_USO_LOTE, uso)
+
+    def por_bloco(self, id_bloco) -> pd.DataFrame:
+        """Lotes do bloco informado."""
+        return self.filtrar(COL_ID_BLOCO, id_bloco)
@@ -0,0 +1,58 @@
+import threading
+from collections import OrderedDict
+
+from config.settings import MAP_RENDER_CACHE_MAX_ITEMS, MAP_RENDER_CACHE_MAX_MB
+
+
+class CacheRenderizacao:
+    """
+    Cache LRU do HTML serializado dos mapas, limitado em número de itens e em memória.
+
+    A chave deve identificar tudo o que muda o mapa (versão dos dados, filtros,
+    cores/ícones): reruns com as mesmas entradas reaproveitam o HTML em vez de
+    reconstruir os marcadores. Um item maior que o limite de memória não é guardado.
+    """
+
+    def __init__(self, max_itens: int = None, max_bytes: int = None):
+        self.max_itens = max_itens or MAP_RENDER_CACHE_MAX_ITEMS
+        self.max_bytes = max_bytes or MAP_RENDER_CACHE_MAX_MB * 1024 * 1024
+        self._lock = threading.Lock()
+        self._itens = OrderedDict()   # chave -> (html, bytes)
+        self.bytes = 0
+        self.acertos = 0
+        self.falhas = 0
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
+    def obter(self, chave, construir) -> str:
+        """Retorna o HTML de `chave`, gerando-o com `construir()` (e guardando) se ausente."""
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return item[0]
+            self.falhas += 1
+
+        # Construção fora do lock: outras sessões continuam servidas do cache
+        html = construir()
+        tamanho = len(html.encode("utf-8"))
+        if tamanho > self.max_bytes:
+            return html
+
+        with self._lock:
+            anterior = self._itens.pop(chave, None)
+            if anterior is not None:
+                self.bytes -= anterior[1]
+            self._itens[chave] = (html, tamanho)
+            self.bytes += tamanho
+            while len(self._itens) > self.max_itens or self.bytes > self.max_bytes:
+                _, (_, liberado) = self._itens.popitem(last=False)
+                self.bytes -= liberado
+        return html
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._itens.clear()
+            self.bytes = 0
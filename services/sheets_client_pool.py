@@ -0,0 +1,101 @@
+import datetime
+import hashlib
+import json
+import threading
+
+from requests.adapters import HTTPAdapter
+
+from config.settings import SHEETS_HTTP_POOL_SIZE, SHEETS_TOKEN_REFRESH_MARGIN
+
+
+def chave_credenciais(credentials_dict: dict = None, credentials_file: str = None) -> str:
+    """Identificador estável de um conjunto de credenciais (sem expor a chave privada)."""
+    if credentials_dict:
+        conteudo = json.dumps(dict(credentials_dict), sort_keys=True, default=str)
+    else:
+        conteudo = f"file:{credentials_file}"
+    return hashlib.sha256(conteudo.encode()).hexdigest()
+
+
+class _EntradaPool:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.client = None
+
+
+class SheetsClientPool:
+    """
+    Pool de clientes gspread autorizados, compartilhado por todo o processo.
+
+    Mantém um cliente por conjunto de credenciais, de modo que sessões e reruns do
+    Streamlit reutilizem a mesma autenticação e a mesma sessão HTTP (keep-alive),
+    e renova o token de acesso antes de expirar.
+    """
+
+    _instancia = None
+    _lock_instancia = threading.Lock()
+
+    def __init__(self, margem_renovacao: float = SHEETS_TOKEN_REFRESH_MARGIN,
+                 tamanho_pool_http: int = SHEETS_HTTP_POOL_SIZE):
+        self.margem_renovacao = margem_renovacao
+        self.tamanho_pool_http = tamanho_pool_http
+        self._lock = threading.Lock()
+        self._entradas = {}
+
+    @classmethod
+    def default(cls) -> "SheetsClientPool":
+        """Retorna o pool único do processo."""
+        with cls._lock_instancia:
+            if cls._instancia is None:
+                cls._instancia = cls()
+            return cls._instancia
+
+    def _entrada(self, chave: str) -> _EntradaPool:
+        with self._lock:
+            if chave not in self._entradas:
+                self._entradas[chave] = _EntradaPool()
+            return self._entradas[chave]
+
+    def _configurar_sessao(self, client) -> None:
+        """Amplia o pool de conexões keep-alive da sessão HTTP do cliente."""
+        session = getattr(getattr(client, "http_client", client), "session", None)
+        if session is None:
+            return
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.tamanho_pool_http)
+        session.mount("https://", adapter)
+
+    def _renovar_token_se_necessario(self, client) -> None:
+        """Renova o token se ele expira dentro da margem configurada."""
+        creds = getattr(getattr(client, "http_client", client), "auth", None)
+        if creds is None or not hasattr(creds, "refresh"):
+            return
+
+        expiry = getattr(creds, "expiry", None)
+        agora = datetime.datetime.utcnow()
+        if creds.token and expiry and (expiry - agora).total_seconds() > self.margem_renovacao:
+            return
+
+        try:
+            from google.auth.transport.requests import Request
+            creds.refresh(Request())
+        except Exception:
+            # A AuthorizedSession ainda renova sob demanda; falha aqui não é fatal
+            pass
+
+    def obter(self, chave: str, criar_fn):
+        """
+        Retorna o cliente associado a `chave`, criando-o com `criar_fn()` na primeira vez.
+        A criação é serializada por chave, evitando autenticações concorrentes duplicadas.
+        """
+        entrada = self._entrada(chave)
+        with entrada.lock:
+            if entrada.client is None:
+                entrada.client = criar_fn()
+                self._configurar_sessao(entrada.client)
+            self._renovar_token_se_necessario(entrada.client)
+            return entrada.client
+
+    def descartar(self, chave: str) -> None:
+        """Remove um cliente do pool (ex.: após erro de autenticação)."""
+        with self._lock:
+            self._entradas.pop(chave, None)
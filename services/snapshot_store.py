@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+from config.settings import SNAPSHOT_DIR
+
+# Versão do formato em disco; snapshots de formatos diferentes são ignorados
+SNAPSHOT_FORMAT = 6
+
+_ARQUIVO_BLOCOS = "blocos.parquet"
+_ARQUIVO_LOTES = "lotes.parquet"
+_ARQUIVO_META = "meta.json"
+
+
+def calcular_versao(*dfs: pd.DataFrame) -> str:
+    """Calcula um identificador curto do conteúdo dos DataFrames (hash estável)."""
+    h = hashlib.sha1()
+    for df in dfs:
+        if df is None:
+            continue
+        h.update(",".join(map(str, df.columns)).encode())
+        h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.hexdigest()[:12]
+
+
+def _combinar_versoes(*versoes: str) -> str:
+    return hashlib.sha1(";".join(versoes).encode()).hexdigest()[:12]
+
+
+class SnapshotStore:
+    """
+    Snapshot local (Parquet) dos DataFrames normalizados de blocos e lotes.
+
+    Serve os dados do disco imediatamente no startup e revalida em segundo plano
+    (stale-while-revalidate) quando o snapshot é mais antigo que `max_idade`.
+
+    A revalidação usa uma função `carregar_fn(revisao_conhecida)` que retorna
+    `(revisao, (df_blocos, df_lotes[, relatorio]))`, ou `(revisao, None)` quando a
+    fonte não mudou; nesse caso apenas a validade do snapshot atual é estendida.
+    O `relatorio` opcional do carregamento (dict serializável, ex.: linhas rejeitadas)
+    é guardado em `meta["carga"]`.
+    """
+
+    def __init__(self, diretorio: str = None):
+        self.diretorio = diretorio or SNAPSHOT_DIR
+        self._lock = threading.Lock()
+        # Single-flight de carregamento + gravação: um único writer por vez, e chamadas
+        # concorrentes no startup a frio esperam a primeira carga em vez de repeti-la
+        self._lock_carga = threading.RLock()
+        # (df_blocos, df_lotes, meta), trocados juntos;
+        # meta = {"formato", "versao", "versoes", "revisao", "carga", "timestamp"}
+        self._atual = None
+        self._atualizando = False
+        self.ultimo_erro = None
+
+    # --- Persistência ---
+
+    def _caminho(self, nome: str) -> str:
+        return os.path.join(self.diretorio, nome)
+
+    @staticmethod
+    def _preparar_para_parquet(df: pd.DataFrame) -> pd.DataFrame:
+        """Converte colunas object com tipos mistos (ex.: int e "") para texto, preservando nulos."""
+        df = df.copy()
+        for col in df.columns[df.dtypes == object]:
+            serie = df[col]
+            df[col] = serie.where(serie.isna(), serie.astype(str))
+        return df
+
+    @staticmethod
+    def _novo_meta(df_blocos: pd.DataFrame, df_lotes: pd.DataFrame, revisao: str = None,
+                   carga: dict = None) -> dict:
+        # Hash do conteúdo calculado uma única vez por versão: é a chave dos caches derivados
+        versoes = {"blocos": calcular_versao(df_blocos), "lotes": calcular_versao(df_lotes)}
+        carga = carga or {}
+        # A versão geral também cobre o relatório de carga (linhas rejeitadas não estão nos DataFrames)
+        versao_carga = hashlib.sha1(json.dumps(carga, sort_keys=True, default=str).encode()).hexdigest()[:12]
+        return {
+            "formato": SNAPSHOT_FORMAT,
+            "versao": _combinar_versoes(versoes["blocos"], versoes["lotes"], versao_carga),
+            "versoes": versoes,
+            "revisao": revisao,
+            "carga": carga,
+            "timestamp": time.time(),
+        }
+
+    def _gravar_atomico(self, nome: str, escrever) -> None:
+        """Grava `nome` via `escrever(caminho_tmp)` em um arquivo temporário único, trocado com os.replace."""
+        fd, tmp = tempfile.mkstemp(dir=self.diretorio, prefix=nome + ".", suffix=".tmp")
+        os.close(fd)
+        try:
+            escrever(tmp)
+            os.replace(tmp, self._caminho(nome))
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def _salvar_meta(self, meta: dict) -> None:
+        def escrever(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+        self._gravar_atomico(_ARQUIVO_META, escrever)
+
+    def salvar(self, df_blocos: pd.DataFrame, df_lotes: pd.DataFrame, revisao: str = None,
+               carga: dict = None) -> dict:
+        """Grava o snapshot em disco de forma atômica e retorna seus metadados."""
+        os.makedirs(self.diretorio, exist_ok=True)
+        meta = self._novo_meta(df_blocos, df_lotes, revisao, carga)
+
+        for nome, df in ((_ARQUIVO_BLOCOS, df_blocos), (_ARQUIVO_LOTES, df_lotes)):
+            self._gravar_atomico(nome, lambda tmp, df=df: self._preparar_para_parquet(df).to_parquet(tmp, index=False))
+
+        # Metadados por último: só marcam o snapshot como válido após os dados
+        self._salvar_meta(meta)
+
+        return meta
+
+    def carregar(self):
+        """Lê o snapshot do disco. Retorna (df_blocos, df_lotes, meta) ou None se ausente/inválido."""
+        try:
+            with open(self._caminho(_ARQUIVO_META), encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("formato") != SNAPSHOT_FORMAT:
+                return None
+            df_blocos = pd.read_parquet(self._caminho(_ARQUIVO_BLOCOS))
+            df_lotes = pd.read_parquet(self._caminho(_ARQUIVO_LOTES))
+        except Exception:
+            # Snapshot corrompido ou inexistente não deve impedir o carregamento remoto
+            return None
+        return df_blocos, df_lotes, meta
+
+    # --- Stale-while-revalidate ---
+
+    @property
+    def meta(self) -> dict:
+        """Metadados (versão e timestamp) dos dados servidos atualmente."""
+        atual = self._atual
+        return atual[2] if atual else None
+
+    def idade(self) -> float:
+        """Idade em segundos dos dados servidos atualmente (inf se não houver dados)."""
+        meta = self.meta
+        if not meta:
+            return float("inf")
+        return time.time() - meta["timestamp"]
+
+    @property
+    def atualizando(self) -> bool:
+        return self._atualizando
+
+    def _trocar(self, df_blocos: pd.DataFrame, df_lotes: pd.DataFrame, meta: dict) -> tuple:
+        atual = (df_blocos, df_lotes, meta)
+        with self._lock:
+            self._atual = atual
+        return atual
+
+    @staticmethod
+    def _resultado(atual: tuple, com_meta: bool) -> tuple:
+        return atual if com_meta else atual[:2]
+
+    def atualizar(self, carregar_fn, forcar: bool = False, com_meta: bool = False) -> tuple:
+        """
+        Revalida de forma síncrona. Se a fonte mudou (ou `forcar`), grava o novo
+        snapshot e troca os dados servidos; caso contrário, só renova o timestamp.
+        Com `com_meta`, retorna (df_blocos, df_lotes, meta) da mesma troca.
+
+        `ultimo_erro` reflete apenas esta atualização: é limpo no início e recebe
+        a exceção de carregamento (que é propagada) ou de gravação em disco.
+        Atualizações concorrentes (botão de atualizar, revalidação em background)
+        são serializadas: carga e gravação de uma não se intercalam com as da outra.
+        """
+        with self._lock_carga:
+            return self._atualizar(carregar_fn, forcar, com_meta)
+
+    def _atualizar(self, carregar_fn, forcar: bool, com_meta: bool) -> tuple:
+        self.ultimo_erro = None
+        atual = self._atual
+        revisao_conhecida = None
+        if not forcar and atual is not None:
+            revisao_conhecida = atual[2].get("revisao")
+
+        try:
+            revisao, dados = carregar_fn(revisao_conhecida)
+        except Exception as e:
+            self.ultimo_erro = e
+            raise
+
+        if dados is None:
+            meta = dict(atual[2], timestamp=time.time())
+            try:
+                self._salvar_meta(meta)
+            except Exception as e:
+                self.ultimo_erro = e
+            return self._resultado(self._trocar(atual[0], atual[1], meta), com_meta)
+
+        df_blocos, df_lotes, *relatorio = dados
+        carga = relatorio[0] if relatorio else None
+        try:
+            meta = self.salvar(df_blocos, df_lotes, revisao, carga)
+        except Exception as e:
+            # Falha de disco não invalida os dados recém-carregados
+            self.ultimo_erro = e
+            meta = self._novo_meta(df_blocos, df_lotes, revisao, carga)
+        return self._resultado(self._trocar(df_blocos, df_lotes, meta), com_meta)
+
+    def _atualizar_em_segundo_plano(self, carregar_fn) -> None:
+        with self._lock:
+            if self._atualizando:
+                return
+            self._atualizando = True
+
+        def _tarefa():
+            try:
+                self.atualizar(carregar_fn)
+            except Exception:
+                # Mantém os dados antigos; o erro já ficou em `ultimo_erro` para a UI
+                pass
+            finally:
+                self._atualizando = False
+
+        threading.Thread(target=_tarefa, name="snapshot-refresh", daemon=True).start()
+
+    def obter(self, carregar_fn, max_idade: float, com_meta: bool = False) -> tuple:
+        """
+        Retorna (df_blocos, df_lotes) sem bloquear sempre que houver algum dado disponível.
+
+        Ordem: memória -> snapshot em disco -> carregamento síncrono. Dados mais antigos
+        que `max_idade` são servidos mesmo assim, disparando uma revalidação em background.
+
+        Com `com_meta`, retorna (df_blocos, df_lotes, meta): os metadados (e a versão)
+        saem da mesma leitura que os dados, sem corrida com a troca feita pela
+        revalidação em background entre uma leitura e outra.
+        """
+        atual = self._atual
+        if atual is None:
+            with self._lock_carga:
+                # Startup a frio: só a primeira chamada carrega; as concorrentes recebem o resultado dela
+                atual = self._atual
+                if atual is None:
+                    snapshot = self.carregar()
+                    if snapshot is None:
+                        return self._atualizar(carregar_fn, forcar=True, com_meta=com_meta)
+                    atual = self._trocar(*snapshot)
+
+        if time.time() - atual[2]["timestamp"] > max_idade:
+            self._atualizar_em_segundo_plano(carregar_fn)
+
+        return self._resultado(atual, com_meta)
@@ -1,71 +1,669 @@
+import threading
+
+import numpy as np
 import pandas as pd
-from config.constants import COL_ID_BLOCO, COL_USO_LOTE, COL_TIPOLOGIA
+from config.constants import (
+    COL_ID_BLOCO,
+    COL_ID_LOTE,
+    COL_USO_LOTE,
+    COL_TIPOLOGIA,
+    TIPOS_USO_COMERCIAL,
+    USO_RESIDENCIAL
+)
+from services.lot_index import IndiceLotes
+from utils.coordinates import coordenadas_metricas
+from utils.spatial_index import GradeEspacial
+from utils.geometry import GeometriaBlocos
+from services.data_audit import RelatorioAuditoria, auditar_dados
+
+# Colunas dos lotes que influenciam as estatísticas por bloco
+_COLUNAS_ESTADO = [COL_ID_BLOCO, COL_USO_LOTE, COL_TIPOLOGIA]
+
+
+def _codificar(serie: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Códigos inteiros (-1 para nulos) e rótulos de uma coluna, na ordem usada por
+    Series.mode: ordem das categorias em colunas categóricas, lexicográfica nas demais.
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Reaproveita os códigos categóricos (sem fatorar as strings novamente)
+        return serie.cat.codes.to_numpy().astype(np.int64), np.asarray(serie.cat.categories, dtype=object)
+    codigos, rotulos = pd.factorize(serie.astype(object), sort=True)
+    return codigos, np.asarray(rotulos, dtype=object)
+
+
+def _tabela_contagens(codigos_bloco: np.ndarray, n_blocos: int, codigos: np.ndarray, n_rotulos: int) -> np.ndarray:
+    """Crosstab bloco × rótulo via bincount (ignora lotes com rótulo nulo)."""
+    validos = codigos >= 0
+    plano = codigos_bloco[validos] * n_rotulos + codigos[validos]
+    return np.bincount(plano, minlength=n_blocos * n_rotulos).reshape(n_blocos, n_rotulos)
+
+
+def _predominante(contagens: np.ndarray, rotulos: np.ndarray) -> np.ndarray:
+    """Moda por bloco (argmax; empates resolvidos pelo menor rótulo, como Series.mode)."""
+    resultado = np.full(contagens.shape[0], "N/A", dtype=object)
+    if contagens.shape[1]:
+        tem_dados = contagens.max(axis=1) > 0
+        resultado[tem_dados] = rotulos[contagens.argmax(axis=1)[tem_dados]]
+    return resultado
+
+
+def _contagens_para_dicts(contagens: np.ndarray, rotulos: np.ndarray) -> list[dict]:
+    """Converte a matriz de contagens em um dict {uso: n} por bloco, sem entradas zeradas."""
+    linhas, colunas = np.nonzero(contagens)
+    valores = contagens[linhas, colunas].tolist()
+    chaves = rotulos[colunas].tolist()
+    limites = np.searchsorted(linhas, np.arange(contagens.shape[0] + 1)).tolist()
+    # Única etapa em Python: materializar os dicts da coluna de saída
+    return [dict(zip(chaves[i:j], valores[i:j])) for i, j in zip(limites[:-1], limites[1:])]
+
+
+def _entropia(contagens: np.ndarray) -> np.ndarray:
+    """Entropia de Shannon (em nats) da distribuição de cada linha; 0 para linhas zeradas."""
+    total = contagens.sum(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = contagens / total
+        termos = np.where(contagens > 0, p * np.log(p), 0.0)
+    return -termos.sum(axis=1) + 0.0
+
+
+def _participacao(contagens: np.ndarray, colunas: np.ndarray) -> np.ndarray:
+    """Fração dos lotes de cada linha nas colunas marcadas; NaN para linhas zeradas."""
+    total = contagens.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(total > 0, contagens[:, colunas].sum(axis=1) / total, np.nan)
+
+
+def distancia_ao_comercio(df_lotes: pd.DataFrame) -> np.ndarray:
+    """
+    Distância (m) de cada lote residencial ao lote comercial (TIPOS_USO_COMERCIAL)
+    mais próximo, em uma única busca de vizinho mais próximo em lote sobre a grade
+    espacial dos lotes comerciais. NaN para lotes não residenciais ou sem coordenada.
+    """
+    return AcessoComercial(df_lotes).distancias
+
+
+def _marcar(serie: pd.Series, valores) -> np.ndarray:
+    """Máscara dos elementos de `serie` em `valores`; em colunas categóricas, avaliada só sobre as categorias."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        marcadas = np.append(serie.cat.categories.isin(valores), False)
+        return marcadas[serie.cat.codes.to_numpy()]
+    return serie.astype(object).isin(valores).to_numpy()
+
+
+def _posicoes_em(serie: pd.Series, indice: pd.Index) -> tuple[np.ndarray, pd.Index]:
+    """
+    Posição de cada valor de `serie` em `indice` (-1 para nulos), acrescentando ao
+    índice os valores novos. Colunas categóricas são traduzidas pelas categorias.
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos, rotulos = serie.cat.codes.to_numpy(), serie.cat.categories
+    else:
+        codigos, rotulos = pd.factorize(serie.astype(object))
+    rotulos = pd.Index(rotulos, dtype=object)
+    novos = rotulos.difference(indice)
+    if len(novos):
+        indice = indice.append(novos)
+    traducao = np.append(indice.get_indexer(rotulos), -1)
+    return traducao[codigos], indice
+
+
+def _iguais_ou_nulos(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return (a == b) | (np.isnan(a) & np.isnan(b))
+
+
+class AcessoComercial:
+    """
+    Distância de cada lote residencial ao comércio mais próximo e, por bloco, a soma
+    e a quantidade dessas distâncias (para a média por bloco).
+
+    Guarda a grade dos lotes comerciais entre versões dos lotes: ela só é refeita
+    quando a nova versão adiciona, remove, move ou reclassifica algum lote comercial.
+    Caso contrário, só os lotes adicionados ou alterados são consultados na grade e
+    somas/quantidades mudam apenas nos blocos desses lotes.
+    """
+
+    def __init__(self, df_lotes: pd.DataFrame):
+        self.blocos = pd.Index([], dtype=object)
+        self._reconstruir(df_lotes)
+
+    def _classificar(self, df_lotes: pd.DataFrame) -> tuple:
+        x, y = coordenadas_metricas(df_lotes)
+        usos = df_lotes[COL_USO_LOTE]
+        codigos, self.blocos = _posicoes_em(df_lotes[COL_ID_BLOCO], self.blocos)
+        return x, y, _marcar(usos, TIPOS_USO_COMERCIAL), _marcar(usos, [USO_RESIDENCIAL]), codigos
+
+    def _guardar(self, df_lotes: pd.DataFrame, x, y, comercial, residencial, codigos) -> None:
+        self._df_lotes = df_lotes
+        self.x, self.y, self.comercial, self.residencial, self.codigos = x, y, comercial, residencial, codigos
+
+    def _consultar(self, posicoes: np.ndarray) -> np.ndarray:
+        if self.grade is None or not len(posicoes):
+            return np.full(len(posicoes), np.nan)
+        return self.grade.mais_proximos_xy(self.x[posicoes], self.y[posicoes])[1]
+
+    def _contribuicoes(self, posicoes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Bloco e distância dos lotes em `posicoes` que entram na média (com bloco e distância)."""
+        codigos, distancias = self.codigos[posicoes], self.distancias[posicoes]
+        validos = (codigos >= 0) & np.isfinite(distancias)
+        return codigos[validos], distancias[validos]
+
+    def _reconstruir(self, df_lotes: pd.DataFrame) -> None:
+        self._guardar(df_lotes, *self._classificar(df_lotes))
+        comerciais = np.flatnonzero(self.comercial)
+        self.grade = GradeEspacial.para_vizinhos(self.x[comerciais], self.y[comerciais]) if len(comerciais) else None
+        self.distancias = np.full(len(df_lotes), np.nan)
+        residenciais = np.flatnonzero(self.residencial)
+        self.distancias[residenciais] = self._consultar(residenciais)
+
+        codigos, distancias = self._contribuicoes(np.arange(len(df_lotes)))
+        self.soma = np.bincount(codigos, weights=distancias, minlength=len(self.blocos))
+        self.quantidade = np.bincount(codigos, minlength=len(self.blocos))
+
+    def atualizar(self, df_lotes: pd.DataFrame) -> np.ndarray | None:
+        """
+        Leva o estado para uma nova versão dos lotes. Retorna os id_bloco cuja média
+        mudou, ou None se tudo foi recalculado (lotes não pareáveis ou comércio alterado).
+        """
+        posicoes = _parear_lotes(self._df_lotes, df_lotes)
+        if posicoes is None:
+            self._reconstruir(df_lotes)
+            return None
+
+        antigo = (self.x, self.y, self.comercial, self.residencial, self.codigos, self.distancias)
+        x, y, comercial, residencial, codigos = self._classificar(df_lotes)
+        existentes = np.flatnonzero(posicoes >= 0)
+        origem = posicoes[existentes]
+
+        # Mesma posição e mesma classe: a distância ao comércio não muda
+        mesma_posicao = np.zeros(len(df_lotes), dtype=bool)
+        mesma_posicao[existentes] = (
+            _iguais_ou_nulos(antigo[0][origem], x[existentes]) & _iguais_ou_nulos(antigo[1][origem], y[existentes])
+            & (antigo[2][origem] == comercial[existentes]) & (antigo[3][origem] == residencial[existentes])
+        )
+        inalterados_antigos = np.zeros(len(antigo[0]), dtype=bool)
+        inalterados_antigos[posicoes[mesma_posicao]] = True
+        if (antigo[2] & ~inalterados_antigos).any() or (comercial & ~mesma_posicao).any():
+            # Algum lote comercial entrou, saiu ou mudou: grade e todas as distâncias refeitas
+            self._reconstruir(df_lotes)
+            return None
+
+        # Contribuições antigas dos lotes removidos/alterados (posição, classe ou bloco) saem...
+        inalterado = mesma_posicao.copy()
+        inalterado[existentes] &= antigo[4][origem] == codigos[existentes]
+        mantidos_antigos = np.zeros(len(antigo[0]), dtype=bool)
+        mantidos_antigos[posicoes[inalterado]] = True
+        codigos_saida, distancias_saida = self._contribuicoes(np.flatnonzero(~mantidos_antigos))
+
+        # ...e as novas entram, consultando a grade só para lotes com posição ou classe nova
+        distancias = np.full(len(df_lotes), np.nan)
+        distancias[mesma_posicao] = antigo[5][posicoes[mesma_posicao]]
+        self._guardar(df_lotes, x, y, comercial, residencial, codigos)
+        consultar = np.flatnonzero(residencial & ~mesma_posicao)
+        distancias[consultar] = self._consultar(consultar)
+        self.distancias = distancias
+        codigos_entrada, distancias_entrada = self._contribuicoes(np.flatnonzero(~inalterado))
+
+        n = len(self.blocos)
+        self.soma = np.pad(self.soma, (0, n - len(self.soma)))
+        self.quantidade = np.pad(self.quantidade, (0, n - len(self.quantidade)))
+        np.subtract.at(self.soma, codigos_saida, distancias_saida)
+        np.subtract.at(self.quantidade, codigos_saida, 1)
+        np.add.at(self.soma, codigos_entrada, distancias_entrada)
+        np.add.at(self.quantidade, codigos_entrada, 1)
+        afetados = np.unique(np.concatenate([codigos_saida, codigos_entrada]))
+        # Sem resíduo de ponto flutuante em blocos que ficaram sem distâncias
+        self.soma[afetados[self.quantidade[afetados] == 0]] = 0.0
+        return self.blocos[afetados].to_numpy()
+
+    def medias(self, ids_bloco: pd.Series) -> np.ndarray:
+        """Distância média (m) ao comércio dos lotes residenciais de cada bloco em `ids_bloco` (NaN se nenhum)."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            medias = np.append(self.soma / self.quantidade, np.nan)
+        return medias[self.blocos.get_indexer(ids_bloco.astype(object))]
+
+
+def _linhas(matriz: np.ndarray, posicoes: np.ndarray) -> np.ndarray:
+    """Seleciona as linhas `posicoes` da matriz, com zeros onde a posição é -1 (bloco sem lotes)."""
+    if not len(matriz):
+        return np.zeros((len(posicoes), matriz.shape[1]), dtype=matriz.dtype)
+    return np.where((posicoes < 0)[:, None], 0, matriz[posicoes])
+
+
+def _valores_iguais(antes: pd.Series, depois: pd.Series, pos_antes=slice(None), pos_depois=slice(None)) -> np.ndarray:
+    """Compara antes[pos_antes] com depois[pos_depois] elemento a elemento (nulo == nulo)."""
+    if isinstance(antes.dtype, pd.CategoricalDtype) and isinstance(depois.dtype, pd.CategoricalDtype):
+        codigos_antes = antes.cat.codes.to_numpy()[pos_antes]
+        codigos_depois = depois.cat.codes.to_numpy()[pos_depois]
+        if antes.cat.categories.equals(depois.cat.categories):
+            return codigos_antes == codigos_depois
+        # Traduz os códigos de `antes` para as categorias de `depois`
+        # (-1 = nulo; -2 = categoria que deixou de existir, nunca igual)
+        traducao = depois.cat.categories.get_indexer(antes.cat.categories)
+        traducao = np.append(np.where(traducao < 0, -2, traducao), -1)
+        return traducao[codigos_antes] == codigos_depois
+    a = antes.to_numpy(dtype=object)[pos_antes]
+    d = depois.to_numpy(dtype=object)[pos_depois]
+    return (a == d) | (pd.isna(a) & pd.isna(d))
+
+
+def _parear_lotes(antigo: pd.DataFrame, novo: pd.DataFrame) -> np.ndarray | None:
+    """
+    Posição de cada lote de `novo` em `antigo` (-1 = lote adicionado), pareando por
+    id_lote; None se os lotes não podem ser pareados (sem id_lote, ids nulos ou duplicados).
+    """
+    if COL_ID_LOTE not in antigo.columns or COL_ID_LOTE not in novo.columns:
+        return None
+    if antigo[COL_ID_LOTE].equals(novo[COL_ID_LOTE]):
+        return np.arange(len(novo))
+    ids_antigos = pd.Index(antigo[COL_ID_LOTE].to_numpy(dtype=object))
+    ids_novos = pd.Index(novo[COL_ID_LOTE].to_numpy(dtype=object))
+    if ids_antigos.hasnans or ids_novos.hasnans or not (ids_antigos.is_unique and ids_novos.is_unique):
+        return None
+    return ids_antigos.get_indexer(ids_novos)
+
+
+def diff_lotes(antigo: pd.DataFrame, novo: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame] | None:
+    """
+    Diferença entre duas versões dos lotes, pareadas por id_lote, nas colunas que
+    influenciam as estatísticas (bloco, uso e tipologia).
+
+    Retorna (removidos, adicionados): um lote alterado aparece nos dois, com os
+    valores antigos em `removidos` e os novos em `adicionados`. Retorna None se os
+    lotes não podem ser pareados (sem id_lote, ids nulos/duplicados ou colunas diferentes).
+    """
+    colunas = [c for c in _COLUNAS_ESTADO if c in antigo.columns]
+    if COL_ID_LOTE not in antigo.columns or COL_ID_LOTE not in novo.columns:
+        return None
+    if colunas != [c for c in _COLUNAS_ESTADO if c in novo.columns]:
+        return None
+
+    # Caso comum (edição de células): mesmos ids na mesma ordem, pareamento posicional
+    if antigo[COL_ID_LOTE].equals(novo[COL_ID_LOTE]):
+        iguais = np.ones(len(novo), dtype=bool)
+        for coluna in colunas:
+            iguais &= _valores_iguais(antigo[coluna], novo[coluna])
+        alterados = np.flatnonzero(~iguais)
+        return antigo[colunas].iloc[alterados], novo[colunas].iloc[alterados]
+
+    # Posição de cada lote novo na versão antiga (-1 = lote adicionado)
+    posicoes = _parear_lotes(antigo, novo)
+    if posicoes is None:
+        return None
+    existentes = np.flatnonzero(posicoes >= 0)
+    iguais = np.ones(len(existentes), dtype=bool)
+    for coluna in colunas:
+        iguais &= _valores_iguais(antigo[coluna], novo[coluna], posicoes[existentes], existentes)
+    alterados = existentes[~iguais]
+
+    mantidos = np.zeros(len(antigo), dtype=bool)
+    mantidos[posicoes[existentes]] = True
+    saida = np.concatenate([np.flatnonzero(~mantidos), posicoes[alterados]])
+    entrada = np.concatenate([np.flatnonzero(posicoes < 0), alterados])
+    return antigo[colunas].iloc[saida], novo[colunas].iloc[entrada]
+
+
+class EstatisticasBlocos:
+    """
+    Estado agregado por bloco: total de lotes e matrizes de contagem bloco × uso e
+    bloco × tipologia. Pode ser atualizado a partir de um diff de lotes, somando e
+    subtraindo apenas as linhas alteradas.
+    """
+
+    def __init__(self, df_lotes: pd.DataFrame):
+        self.tem_tipologia = COL_TIPOLOGIA in df_lotes.columns
+        codigos_bloco, ids_bloco = _codificar(df_lotes[COL_ID_BLOCO])
+        com_bloco = codigos_bloco >= 0
+        codigos_bloco = codigos_bloco[com_bloco]
+        n_blocos = len(ids_bloco)
+
+        self.blocos = pd.Index(ids_bloco, dtype=object)
+        self.total = np.bincount(codigos_bloco, minlength=n_blocos)
+
+        codigos_uso, usos = _codificar(df_lotes[COL_USO_LOTE])
+        self.usos = pd.Index(usos, dtype=object)
+        self.usos_contagens = _tabela_contagens(codigos_bloco, n_blocos, codigos_uso[com_bloco], len(usos))
+
+        if self.tem_tipologia:
+            codigos_tip, tipologias = _codificar(df_lotes[COL_TIPOLOGIA])
+            self.tipologias = pd.Index(tipologias, dtype=object)
+            self.tip_contagens = _tabela_contagens(codigos_bloco, n_blocos, codigos_tip[com_bloco], len(tipologias))
+        else:
+            self.tipologias = pd.Index([], dtype=object)
+            self.tip_contagens = np.zeros((n_blocos, 0), dtype=np.int64)
+
+        # Versão dos lotes refletida no estado (base do próximo diff)
+        self._df_lotes = df_lotes
+
+    def _posicoes_blocos(self, valores: pd.Series) -> np.ndarray:
+        """Linhas dos blocos informados, acrescentando linhas zeradas para blocos novos."""
+        valores = pd.Index(valores.to_numpy(dtype=object))
+        novos = valores.dropna().unique().difference(self.blocos)
+        if len(novos):
+            self.blocos = self.blocos.append(novos)
+            extra = ((0, len(novos)), (0, 0))
+            self.total = np.pad(self.total, (0, len(novos)))
+            self.usos_contagens = np.pad(self.usos_contagens, extra)
+            self.tip_contagens = np.pad(self.tip_contagens, extra)
+        return self.blocos.get_indexer(valores)
+
+    def _posicoes_rotulos(self, atributo: str, matriz: str, valores: pd.Series) -> np.ndarray:
+        """Colunas dos rótulos informados, mantendo a ordem dos rótulos (desempate da moda)."""
+        rotulos = getattr(self, atributo)
+        valores = pd.Index(valores.to_numpy(dtype=object))
+        novos = valores.dropna().unique().difference(rotulos)
+        if len(novos):
+            uniao = rotulos.append(novos)
+            try:
+                uniao = uniao.sort_values()
+            except TypeError:
+                pass
+            antiga = getattr(self, matriz)
+            nova = np.zeros((antiga.shape[0], len(uniao)), dtype=antiga.dtype)
+            nova[:, uniao.get_indexer(rotulos)] = antiga
+            setattr(self, atributo, uniao)
+            setattr(self, matriz, nova)
+        return getattr(self, atributo).get_indexer(valores)
+
+    def aplicar_diff(self, removidos: pd.DataFrame, adicionados: pd.DataFrame) -> np.ndarray:
+        """
+        Subtrai os lotes removidos e soma os adicionados (ver `diff_lotes`).
+        Custo proporcional ao tamanho do diff. Retorna os id_bloco afetados.
+        """
+        afetados = []
+        for df, sinal in ((removidos, -1), (adicionados, 1)):
+            if df.empty:
+                continue
+            blocos = self._posicoes_blocos(df[COL_ID_BLOCO])
+            com_bloco = blocos >= 0
+            np.add.at(self.total, blocos[com_bloco], sinal)
+
+            usos = self._posicoes_rotulos("usos", "usos_contagens", df[COL_USO_LOTE])
+            validos = com_bloco & (usos >= 0)
+            np.add.at(self.usos_contagens, (blocos[validos], usos[validos]), sinal)
+
+            if self.tem_tipologia:
+                tips = self._posicoes_rotulos("tipologias", "tip_contagens", df[COL_TIPOLOGIA])
+                validos = com_bloco & (tips >= 0)
+                np.add.at(self.tip_contagens, (blocos[validos], tips[validos]), sinal)
+
+            afetados.append(df[COL_ID_BLOCO].dropna())
+        if not afetados:
+            return np.array([], dtype=object)
+        return pd.unique(pd.concat(afetados).to_numpy(dtype=object))
+
+    def atualizar(self, df_lotes: pd.DataFrame) -> np.ndarray | None:
+        """
+        Leva o estado para uma nova versão dos lotes aplicando apenas o diff.
+        Retorna os id_bloco afetados, ou None se o diff não se aplica (ver
+        `diff_lotes`) e o estado deve ser reconstruído.
+        """
+        diff = diff_lotes(self._df_lotes, df_lotes)
+        if diff is None:
+            return None
+        afetados = self.aplicar_diff(*diff)
+        self._df_lotes = df_lotes
+        return afetados
+
+    def colunas_blocos(self, ids_bloco: pd.Series) -> dict:
+        """
+        Colunas de estatísticas para os blocos informados: total, modas, distribuição
+        de usos e indicadores de mistura (entropia dos usos e fração comercial).
+        """
+        posicoes = self.blocos.get_indexer(ids_bloco.astype(object))
+        usos_contagens = _linhas(self.usos_contagens, posicoes)
+        return {
+            'total_lotes': _linhas(self.total[:, None], posicoes)[:, 0].astype(int),
+            'uso_predominante': _predominante(usos_contagens, self.usos.to_numpy()),
+            'tipologia_pred': _predominante(_linhas(self.tip_contagens, posicoes), self.tipologias.to_numpy()),
+            # Para blocos sem lotes, usos_counts é dict vazio
+            'usos_counts': _contagens_para_dicts(usos_contagens, self.usos.to_numpy()),
+            'entropia_usos': _entropia(usos_contagens),
+            'participacao_comercial': _participacao(usos_contagens, self.usos.isin(TIPOS_USO_COMERCIAL)),
+        }
+
+    def enriquecer(self, df_blocos: pd.DataFrame) -> pd.DataFrame:
+        """Anexa as estatísticas a todos os blocos (equivalente ao left join por id_bloco)."""
+        df_enriched = df_blocos.reset_index(drop=True)
+        for coluna, valores in self.colunas_blocos(df_enriched[COL_ID_BLOCO]).items():
+            df_enriched[coluna] = valores
+        return df_enriched
+
+    def atualizar_enriquecido(self, df_enriched: pd.DataFrame, afetados: np.ndarray) -> pd.DataFrame:
+        """Recalcula, em uma cópia de `df_enriched`, apenas as linhas dos blocos afetados."""
+        df_enriched = df_enriched.copy()
+        linhas = np.flatnonzero(df_enriched[COL_ID_BLOCO].astype(object).isin(afetados).to_numpy())
+        if not len(linhas):
+            return df_enriched
+        novas = self.colunas_blocos(df_enriched[COL_ID_BLOCO].iloc[linhas])
+        for coluna, valores in novas.items():
+            atual = df_enriched[coluna].to_numpy(copy=True)
+            atual[linhas] = _como_objeto(valores) if atual.dtype == object else valores
+            df_enriched[coluna] = atual
+        return df_enriched
+
+
+def _como_objeto(valores: list) -> np.ndarray:
+    """Array de objetos sem que o NumPy tente expandir os elementos (ex.: dicts)."""
+    arr = np.empty(len(valores), dtype=object)
+    arr[:] = valores
+    return arr
+
+
+class CuboAgregado:
+    """
+    Contagens de lotes por bloco × uso × tipologia, montadas uma única vez por
+    versão dos dados. Cada eixo tem uma posição extra (a última) para valores
+    nulos, de modo que os totais incluem lotes sem bloco, uso ou tipologia.
+    """
+
+    EIXOS = (COL_ID_BLOCO, COL_USO_LOTE, COL_TIPOLOGIA)
+
+    def __init__(self, df_lotes: pd.DataFrame):
+        codigos, self.rotulos = [], []
+        for coluna in self.EIXOS:
+            if df_lotes is not None and coluna in df_lotes.columns:
+                cod, rot = _codificar(df_lotes[coluna])
+                cod = np.where(cod < 0, len(rot), cod)
+            else:
+                cod, rot = np.zeros(0 if df_lotes is None else len(df_lotes), dtype=np.int64), np.array([], dtype=object)
+            codigos.append(cod)
+            self.rotulos.append(pd.Index(rot, dtype=object))
+
+        forma = tuple(len(r) + 1 for r in self.rotulos)
+        plano = np.ravel_multi_index(codigos, forma) if len(codigos[0]) else np.zeros(0, dtype=np.int64)
+        self.contagens = np.bincount(plano, minlength=int(np.prod(forma))).reshape(forma)
+        # Totais por uso (sem nulos) e usos presentes, consultados a cada rerun: calculados uma vez
+        self.total_por_uso = self.contagens[:, :-1, :].sum(axis=(0, 2))
+        self._usos_presentes = sorted(self.rotulos[1][self.total_por_uso > 0].tolist())
+
+    @property
+    def blocos(self) -> pd.Index:
+        return self.rotulos[0]
+
+    def usos_presentes(self) -> list:
+        """Usos com ao menos um lote, em ordem alfabética."""
+        return list(self._usos_presentes)
+
+    def _fatia(self, eixo: int, valor):
+        """Posições do eixo para um valor, uma lista de valores ou None (todos, inclusive nulos)."""
+        if valor is None:
+            return slice(None)
+        valores = valor if isinstance(valor, (list, tuple, set)) else [valor]
+        posicoes = self.rotulos[eixo].get_indexer(list(valores))
+        return posicoes[posicoes >= 0]
+
+    def _sub_cubo(self, id_bloco=None, uso=None, tipologia=None) -> np.ndarray:
+        sub = self.contagens[self._fatia(0, id_bloco)]
+        sub = sub[:, self._fatia(1, uso)]
+        return sub[:, :, self._fatia(2, tipologia)]
+
+    def total(self, id_bloco=None, uso=None, tipologia=None) -> int:
+        """Número de lotes no recorte (cada filtro aceita um valor, uma lista ou None)."""
+        return int(self._sub_cubo(id_bloco, uso, tipologia).sum())
+
+    def contagem_por_uso(self, id_bloco=None, uso=None, tipologia=None) -> pd.Series:
+        """Lotes por uso no recorte, como `value_counts` (sem nulos e sem zeros, decrescente)."""
+        if id_bloco is None and tipologia is None:
+            usos = self.total_por_uso
+        else:
+            usos = self.contagens[self._fatia(0, id_bloco)][:, :-1][:, :, self._fatia(2, tipologia)].sum(axis=(0, 2))
+        serie = pd.Series(usos, index=self.rotulos[1], name="count")
+        if uso is not None:
+            serie = serie.iloc[self._fatia(1, uso)]
+        serie = serie[serie > 0]
+        return serie.iloc[np.argsort(-serie.to_numpy(), kind="stable")]
+
 
 class StatsService:
-    """Serviço responsável por enriquecer os dados com cálculos estatísticos."""
-    
+    """
+    Serviço responsável por enriquecer os dados com cálculos estatísticos.
+
+    Uma instância guarda o último enriquecimento e o estado agregado por bloco,
+    para que novas versões dos lotes recalculem apenas os blocos alterados, e as
+    estruturas derivadas dos dados (cubo de contagens, índice de filtros,
+    índices espaciais, geometria dos blocos e auditoria), montadas uma vez por versão.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._estatisticas = None
+        self._df_blocos = None
+        self._df_lotes = None
+        self._versoes = {}
+        self._resultado = None
+        # Blocos recalculados na última chamada (None = recálculo completo)
+        self.blocos_recalculados = None
+        # Acesso ao comércio (grade comercial, distâncias e somas por bloco), atualizado por diff
+        self._acesso = None
+        # Estruturas derivadas por versão dos dados: {nome: (token de versão, DataFrames de origem, estrutura)}
+        self._derivados = {}
+
     @staticmethod
     def enrich_blocos_data(df_blocos: pd.DataFrame, df_lotes: pd.DataFrame) -> pd.DataFrame:
         """
         Calcula estatísticas de lotes (contagem, moda, distribuição) e anexa aos blocos.
+
+        Totalmente vetorizado: os lotes são codificados (bloco, uso, tipologia) e
+        contados em matrizes bloco × categoria; a moda sai de um argmax por linha.
         """
         if df_blocos is None or df_blocos.empty:
             return df_blocos
 
         if df_lotes is None or df_lotes.empty:
+            df_blocos = df_blocos.copy()
             df_blocos['total_lotes'] = 0
             df_blocos['uso_predominante'] = "N/A"
             df_blocos['tipologia_pred'] = "N/A"
             df_blocos['usos_counts'] = None
+            df_blocos['entropia_usos'] = 0.0
+            df_blocos['participacao_comercial'] = np.nan
+            df_blocos['dist_comercial_media_m'] = np.nan
             return df_blocos
 
-        # Trabalhar com cópias
-        df_blocos = df_blocos.copy()
-        df_lotes = df_lotes.copy()
-        
-        # Agrupar lotes por bloco
-        grouped = df_lotes.groupby(COL_ID_BLOCO)
-        
-        # 1. Estatísticas Básicas
-        agg_dict = {
-            'total_lotes': (COL_ID_BLOCO, 'size'),
-            'uso_predominante': (COL_USO_LOTE, lambda x: x.mode().iloc[0] if not x.mode().empty else "N/A")
-        }
-        
-        if COL_TIPOLOGIA in df_lotes.columns:
-             agg_dict['tipologia_pred'] = (COL_TIPOLOGIA, lambda x: x.mode().iloc[0] if not x.mode().empty else "N/A")
-        
-        stats = grouped.agg(**agg_dict).reset_index()
-        
-        # 2. Contagem de Usos (para badges)
-        # Retorna dataframe onde colunas são os usos
-        usos_pivot = grouped[COL_USO_LOTE].value_counts().unstack(fill_value=0)
-        
-        # Converter cada linha em um dicionário {uso: count}
-        # Limpar chaves com valor 0 para economizar espaço
-        def to_dict_clean(row):
-            return {k: v for k, v in row.items() if v > 0}
-            
-        usos_dict = uses_series = pd.DataFrame({
-            COL_ID_BLOCO: usos_pivot.index,
-            'usos_counts': [to_dict_clean(row) for _, row in usos_pivot.iterrows()]
-        })
-
-        # 3. Merge com df_blocos
-        # Merge stats
-        df_enriched = pd.merge(df_blocos, stats, on=COL_ID_BLOCO, how='left')
-        # Merge counts
-        df_enriched = pd.merge(df_enriched, usos_dict, on=COL_ID_BLOCO, how='left')
-        
-        # Preencher NaNs resultantes do Left Join (blocos sem lotes)
-        df_enriched['total_lotes'] = df_enriched['total_lotes'].fillna(0).astype(int)
-        df_enriched['uso_predominante'] = df_enriched['uso_predominante'].fillna("N/A")
-        if 'tipologia_pred' in df_enriched.columns:
-            df_enriched['tipologia_pred'] = df_enriched['tipologia_pred'].fillna("N/A")
-        else:
-            df_enriched['tipologia_pred'] = "N/A"
-        
-        # Para usos_counts, NaN deve ser dict vazio
-        df_enriched['usos_counts'] = df_enriched['usos_counts'].apply(lambda x: x if isinstance(x, dict) else {})
-        
+        df_enriched = EstatisticasBlocos(df_lotes).enriquecer(df_blocos)
+        return StatsService._anexar_acesso_comercial(df_enriched, AcessoComercial(df_lotes))
+
+    @staticmethod
+    def _anexar_acesso_comercial(df_enriched: pd.DataFrame, acesso: AcessoComercial) -> pd.DataFrame:
+        """Anexa a distância média (m) dos lotes residenciais de cada bloco ao comércio mais próximo."""
+        df_enriched['dist_comercial_media_m'] = acesso.medias(df_enriched[COL_ID_BLOCO])
         return df_enriched
+
+    @property
+    def distancias_comercio(self) -> np.ndarray | None:
+        """Distância (m) de cada lote residencial ao comércio mais próximo, alinhada aos últimos lotes."""
+        return None if self._acesso is None else self._acesso.distancias
+
+    def _mesma_versao(self, nome: str, df: pd.DataFrame, anterior: pd.DataFrame, versoes: dict) -> bool:
+        """Mesmo DataFrame da chamada anterior: mesmo objeto ou mesmo token de versão."""
+        versao = versoes.get(nome)
+        return df is anterior or (versao is not None and versao == self._versoes.get(nome))
+
+    def enrich_blocos_incremental(self, df_blocos: pd.DataFrame, df_lotes: pd.DataFrame,
+                                  versoes: dict = None) -> pd.DataFrame:
+        """
+        Mesmo resultado de `enrich_blocos_data`, reaproveitando a chamada anterior:
+        com os mesmos dados devolve o resultado guardado; se só os lotes mudaram,
+        aplica o diff ao estado agregado e recalcula apenas os blocos afetados.
+
+        `versoes` ({"blocos": ..., "lotes": ...}, ver `SnapshotStore`) identifica os
+        dados sem comparar conteúdo: com tokens iguais o resultado é reaproveitado em O(1).
+        """
+        versoes = versoes or {}
+        with self._lock:
+            mesmos_blocos = self._mesma_versao("blocos", df_blocos, self._df_blocos, versoes)
+            if mesmos_blocos and self._mesma_versao("lotes", df_lotes, self._df_lotes, versoes):
+                return self._resultado
+
+            incremental = (
+                self._estatisticas is not None
+                and df_lotes is not None and not df_lotes.empty
+                and df_blocos is not None
+                and (mesmos_blocos or df_blocos.equals(self._df_blocos))
+            )
+            afetados = self._estatisticas.atualizar(df_lotes) if incremental else None
+
+            if df_blocos is None or df_blocos.empty or df_lotes is None or df_lotes.empty:
+                self._estatisticas = None
+                self._acesso = None
+                resultado = self.enrich_blocos_data(df_blocos, df_lotes)
+            else:
+                if afetados is not None:
+                    resultado = self._estatisticas.atualizar_enriquecido(self._resultado, afetados)
+                else:
+                    self._estatisticas = EstatisticasBlocos(df_lotes)
+                    resultado = self._estatisticas.enriquecer(df_blocos)
+                # Grade comercial reaproveitada: só lotes novos/alterados são consultados
+                if self._acesso is None:
+                    self._acesso = AcessoComercial(df_lotes)
+                else:
+                    self._acesso.atualizar(df_lotes)
+                resultado = self._anexar_acesso_comercial(resultado, self._acesso)
+
+            self.blocos_recalculados = afetados
+            self._df_blocos, self._df_lotes, self._resultado = df_blocos, df_lotes, resultado
+            self._versoes = dict(versoes)
+            return resultado
+
+    def _derivado(self, nome: str, construir, *dfs: pd.DataFrame, versao: str = None):
+        """
+        Estrutura derivada de `dfs`, reconstruída apenas quando chega outra versão deles:
+        outro token `versao` quando informado, senão outro objeto em algum dos DataFrames.
+        """
+        with self._lock:
+            versao_anterior, origem, valor = self._derivados.get(nome, (None, (), None))
+            if versao is not None:
+                atual = versao == versao_anterior
+            else:
+                atual = len(origem) == len(dfs) and all(a is b for a, b in zip(origem, dfs))
+            if valor is None or not atual:
+                valor = construir(*dfs)
+                self._derivados[nome] = (versao, dfs, valor)
+            return valor
+
+    def obter_cubo(self, df_lotes: pd.DataFrame, versao: str = None) -> CuboAgregado:
+        """Cubo de contagens dos lotes, reconstruído apenas quando chega uma nova versão dos lotes."""
+        return self._derivado("cubo", CuboAgregado, df_lotes, versao=versao)
+
+    def obter_indice(self, df_lotes: pd.DataFrame, versao: str = None) -> IndiceLotes:
+        """Índice de filtros por uso e por bloco, reconstruído apenas quando chega uma nova versão dos lotes."""
+        return self._derivado("indice", IndiceLotes, df_lotes, versao=versao)
+
+    def obter_grade(self, nome: str, df: pd.DataFrame, versao: str = None) -> GradeEspacial:
+        """Índice espacial (grade uniforme) das coordenadas de `df`, um por nome ("lotes", "blocos")."""
+        return self._derivado(f"grade_{nome}", GradeEspacial.de_dataframe, df, versao=versao)
+
+    def obter_geometria(self, df_lotes: pd.DataFrame, versao: str = None) -> GeometriaBlocos:
+        """Fecho convexo, área e centróide de todos os blocos, calculados uma vez por versão dos lotes."""
+        return self._derivado("geometria", GeometriaBlocos, df_lotes, versao=versao)
+
+    def obter_auditoria(self, df_blocos: pd.DataFrame, df_lotes: pd.DataFrame,
+                        coordenadas_rejeitadas: list[dict] = None, versao: str = None) -> RelatorioAuditoria:
+        """
+        Auditoria de qualidade dos dados (incluindo as linhas rejeitadas no carregamento),
+        executada uma vez por versão do snapshot.
+        """
+        def construir(blocos, lotes):
+            return auditar_dados(blocos, lotes, coordenadas_rejeitadas=coordenadas_rejeitadas)
+        return self._derivado("auditoria", construir, df_blocos, df_lotes, versao=versao)
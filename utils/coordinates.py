@@ -1,5 +1,16 @@
+import numpy as np
 import pandas as pd
-from config.constants import COL_LATITUDE, COL_LONGITUDE
+import pyarrow as pa
+import pyarrow.compute as pc
+from config.settings import PROJECTION_ORIGIN
+from config.constants import COL_LATITUDE, COL_LONGITUDE, COL_X_M, COL_Y_M
+
+# Raio médio da Terra (m), para a projeção equiretangular local
+RAIO_TERRA_M = 6_371_008.8
+
+# "lat, lon" (campos extras após uma segunda vírgula são ignorados, como no parser escalar)
+_NUMERO = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+_PADRAO_COORDENADA = rf"^\s*(?P<lat>{_NUMERO})\s*,\s*(?P<lon>{_NUMERO})\s*(?:,.*)?$"
 
 def extrair_latitude_longitude(coord_str) -> tuple:
     """Extrai latitude e longitude de uma string formatada como 'lat, lon'."""
@@ -19,6 +30,42 @@ def extrair_latitude_longitude(coord_str) -> tuple:
         pass
     return None, None
 
+def extrair_coordenadas_vetorizado(serie: pd.Series) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Versão vetorizada de `extrair_latitude_longitude` para uma coluna inteira.
+
+    Faz o split, a conversão e a validação de faixa em uma única passada (kernels
+    Arrow), sem loops Python por linha. Retorna (coords, rejeitados): `coords` tem
+    as colunas latitude/longitude (float, NaN quando inválidas) alinhadas ao índice
+    de `serie`; `rejeitados` lista, por índice, o valor bruto e o motivo
+    ('vazio', 'formato inválido' ou 'fora do intervalo').
+    """
+    texto = pa.array(serie.astype("string"))
+    vazio = np.asarray(pc.fill_null(pc.equal(pc.utf8_trim_whitespace(texto), ""), True))
+
+    partes = pc.extract_regex(texto, _PADRAO_COORDENADA)
+    lat = pc.cast(pc.struct_field(partes, "lat"), pa.float64()).to_numpy(zero_copy_only=False)
+    lon = pc.cast(pc.struct_field(partes, "lon"), pa.float64()).to_numpy(zero_copy_only=False)
+
+    # NaN em lat/lon = linha sem correspondência com o padrão "lat, lon"
+    formato_invalido = ~vazio & (np.isnan(lat) | np.isnan(lon))
+    with np.errstate(invalid="ignore"):
+        fora_intervalo = ~vazio & ~formato_invalido & ((np.abs(lat) > 90) | (np.abs(lon) > 180))
+    invalido = vazio | formato_invalido | fora_intervalo
+
+    coords = pd.DataFrame({
+        COL_LATITUDE: np.where(invalido, np.nan, lat),
+        COL_LONGITUDE: np.where(invalido, np.nan, lon),
+    }, index=serie.index)
+
+    motivo = np.select([vazio, formato_invalido], ["vazio", "formato inválido"], "fora do intervalo")
+    rejeitados = pd.DataFrame(
+        {"valor_bruto": serie[invalido], "motivo": motivo[invalido]},
+        index=serie.index[invalido],
+    )
+
+    return coords, rejeitados
+
 def processar_coordenadas(df: pd.DataFrame) -> pd.DataFrame:
     """
     Garante que as colunas de coordenadas sejam numéricas.
@@ -43,3 +90,55 @@ def processar_coordenadas(df: pd.DataFrame) -> pd.DataFrame:
         
     return df
 
+
+def projetar_local(lat, lon, origem: tuple = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Projeção equiretangular em metros (x para leste, y para norte) em torno de
+    `origem` (lat, lon), por padrão PROJECTION_ORIGIN; precisa na escala de um bairro.
+    """
+    lat0, lon0 = origem or PROJECTION_ORIGIN
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    x = np.radians(lon - lon0) * np.cos(np.radians(lat0)) * RAIO_TERRA_M
+    y = np.radians(lat - lat0) * RAIO_TERRA_M
+    return x, y
+
+
+def desprojetar_local(x, y, origem: tuple = None) -> tuple[np.ndarray, np.ndarray]:
+    """Inversa de `projetar_local`: metros locais para (lat, lon)."""
+    lat0, lon0 = origem or PROJECTION_ORIGIN
+    lat = lat0 + np.degrees(np.asarray(y, dtype=np.float64) / RAIO_TERRA_M)
+    lon = lon0 + np.degrees(np.asarray(x, dtype=np.float64) / (RAIO_TERRA_M * np.cos(np.radians(lat0))))
+    return lat, lon
+
+
+def adicionar_coordenadas_metricas(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Acrescenta as colunas x_m/y_m (projeção local em metros) a partir de latitude/longitude.
+    Calculadas uma vez por versão dos dados, no carregamento, e reaproveitadas
+    por todo cálculo de distância, área ou índice espacial.
+    """
+    if df is None or COL_LATITUDE not in df.columns or COL_LONGITUDE not in df.columns:
+        return df
+    x, y = projetar_local(df[COL_LATITUDE].to_numpy(dtype=np.float64, na_value=np.nan),
+                          df[COL_LONGITUDE].to_numpy(dtype=np.float64, na_value=np.nan))
+    df[COL_X_M] = x
+    df[COL_Y_M] = y
+    return df
+
+
+def coordenadas_metricas(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Arrays (x, y) em metros das linhas de `df`: usa as colunas x_m/y_m quando
+    presentes e, para DataFrames montados fora do DataLoader, projeta na hora.
+    """
+    if COL_X_M in df.columns and COL_Y_M in df.columns:
+        return (df[COL_X_M].to_numpy(dtype=np.float64, na_value=np.nan),
+                df[COL_Y_M].to_numpy(dtype=np.float64, na_value=np.nan))
+    return projetar_local(df[COL_LATITUDE].to_numpy(dtype=np.float64, na_value=np.nan),
+                          df[COL_LONGITUDE].to_numpy(dtype=np.float64, na_value=np.nan))
+
+
+def metros_por_pixel(zoom: float, latitude: float) -> float:
+    """Resolução (m/pixel) dos mapas em Web Mercator (tiles de 256 px) no zoom e latitude dados."""
+    return 2 * np.pi * RAIO_TERRA_M * np.cos(np.radians(latitude)) / (256 * 2 ** zoom)
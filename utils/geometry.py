@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+
+from config.constants import COL_ID_BLOCO, COL_LATITUDE, COL_LONGITUDE
+from utils.coordinates import coordenadas_metricas, desprojetar_local
+
+
+def _cadeia(grupo: np.ndarray, x: np.ndarray, y: np.ndarray, sinal: int) -> np.ndarray:
+    """
+    Cadeia inferior (sinal=1) ou superior (sinal=-1) do fecho convexo de cada grupo,
+    com os pontos já ordenados por (grupo, x, y). Remove, em passadas vetorizadas
+    sobre todos os grupos ao mesmo tempo, os pontos internos que não fazem curva
+    para o lado da cadeia; um ponto assim nunca é vértice, então removê-los juntos é seguro.
+    """
+    vivos = np.arange(len(grupo))
+    while len(vivos) > 2:
+        g = grupo[vivos]
+        interno = np.zeros(len(vivos), dtype=bool)
+        interno[1:-1] = (g[1:-1] == g[:-2]) & (g[1:-1] == g[2:])
+        i, p, n = vivos[1:-1], vivos[:-2], vivos[2:]
+        cruz = (x[i] - x[p]) * (y[n] - y[i]) - (y[i] - y[p]) * (x[n] - x[i])
+        remover = interno.copy()
+        remover[1:-1] &= sinal * cruz <= 0
+        if not remover.any():
+            break
+        vivos = vivos[~remover]
+    return vivos
+
+
+def _limites_grupos(grupo: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Primeira posição de cada grupo e marcador de última posição, para arrays ordenados por grupo."""
+    novo = np.concatenate([[True], grupo[1:] != grupo[:-1]]) if len(grupo) else np.zeros(0, dtype=bool)
+    ultimo = np.concatenate([novo[1:], [True]]) if len(grupo) else novo
+    return np.flatnonzero(novo), ultimo
+
+
+class GeometriaBlocos:
+    """
+    Geometria de todos os blocos a partir das coordenadas dos lotes: fecho convexo
+    (vértices em sentido anti-horário), área, perímetro e centróide do polígono,
+    calculados de uma vez, em NumPy vetorizado, sobre coordenadas projetadas em metros.
+    """
+
+    def __init__(self, df_lotes: pd.DataFrame):
+        self.df_lotes = df_lotes
+        colunas = (COL_ID_BLOCO, COL_LATITUDE, COL_LONGITUDE)
+        if df_lotes is None or df_lotes.empty or any(c not in df_lotes.columns for c in colunas):
+            self._vazio()
+            return
+
+        x, y = coordenadas_metricas(df_lotes)
+        codigos, blocos = pd.factorize(df_lotes[COL_ID_BLOCO].astype(object), sort=True)
+        validos = np.flatnonzero((codigos >= 0) & np.isfinite(x) & np.isfinite(y))
+        if not len(validos):
+            self._vazio()
+            return
+
+        # 1. Ordenação por (bloco, x, y) e cadeias inferior/superior de todos os blocos
+        ordem = validos[np.lexsort((y[validos], x[validos], codigos[validos]))]
+        g, xs, ys = codigos[ordem], x[ordem], y[ordem]
+        inferior = _cadeia(g, xs, ys, 1)
+        superior = _cadeia(g, xs, ys, -1)
+
+        # 2. Fecho anti-horário: inferior em x crescente + superior em x decrescente,
+        #    sem os extremos da superior (já presentes na inferior)
+        inicios_sup, ultimo_sup = _limites_grupos(g[superior])
+        extremo = ultimo_sup.copy()
+        extremo[inicios_sup] = True
+        superior = superior[~extremo]
+        vertices = np.concatenate([inferior, superior])
+        parte = np.concatenate([np.zeros(len(inferior)), np.ones(len(superior))])
+        sentido = np.concatenate([inferior, -superior])
+        vertices = vertices[np.lexsort((sentido, parte, g[vertices]))]
+
+        # 3. Área, perímetro e centróide (fórmula do polígono) por bloco
+        gv, xv, yv = g[vertices], xs[vertices], ys[vertices]
+        inicios, ultimo = _limites_grupos(gv)
+        proximo = np.arange(len(vertices)) + 1
+        proximo[ultimo] = inicios
+        cruz = xv * yv[proximo] - xv[proximo] * yv
+        area = np.add.reduceat(cruz, inicios) / 2
+        perimetro = np.add.reduceat(np.hypot(xv[proximo] - xv, yv[proximo] - yv), inicios)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cx = np.add.reduceat((xv + xv[proximo]) * cruz, inicios) / (6 * area)
+            cy = np.add.reduceat((yv + yv[proximo]) * cruz, inicios) / (6 * area)
+
+        # Blocos degenerados (1-2 lotes ou colineares): centróide = média dos lotes
+        n_lotes = np.bincount(g, minlength=len(blocos))
+        media_x = np.bincount(g, weights=xs, minlength=len(blocos)) / np.maximum(n_lotes, 1)
+        media_y = np.bincount(g, weights=ys, minlength=len(blocos)) / np.maximum(n_lotes, 1)
+        presentes = gv[inicios]
+        degenerado = np.abs(area) < 1e-6
+        cx = np.where(degenerado, media_x[presentes], cx)
+        cy = np.where(degenerado, media_y[presentes], cy)
+        centro_lat, centro_lon = desprojetar_local(cx, cy)
+
+        self.resumo = pd.DataFrame({
+            "n_lotes": n_lotes[presentes],
+            "n_vertices": np.diff(np.append(inicios, len(vertices))),
+            "area_m2": np.abs(area),
+            "perimetro_m": perimetro,
+            "centroide_lat": centro_lat,
+            "centroide_lon": centro_lon,
+        }, index=pd.Index(np.asarray(blocos, dtype=object)[presentes], name=COL_ID_BLOCO))
+        # Vértices de cada bloco como posições das linhas de df_lotes (CSR: posicoes + limites)
+        self._posicoes = ordem[vertices]
+        self._limites = np.append(inicios, len(vertices))
+
+    def _vazio(self) -> None:
+        self.resumo = pd.DataFrame(
+            columns=["n_lotes", "n_vertices", "area_m2", "perimetro_m", "centroide_lat", "centroide_lon"],
+            index=pd.Index([], name=COL_ID_BLOCO, dtype=object),
+        )
+        self._posicoes = np.zeros(0, dtype=np.int64)
+        self._limites = np.zeros(1, dtype=np.int64)
+
+    def contorno(self, id_bloco) -> pd.DataFrame:
+        """Lotes que formam o fecho do bloco, em sentido anti-horário e fechado (primeiro repetido no fim)."""
+        if id_bloco not in self.resumo.index:
+            return self.df_lotes.iloc[:0] if self.df_lotes is not None else pd.DataFrame()
+        i = self.resumo.index.get_loc(id_bloco)
+        posicoes = self._posicoes[self._limites[i]:self._limites[i + 1]]
+        return self.df_lotes.take(np.append(posicoes, posicoes[:1]))
+
+
+def agregar_em_hexagonos(x: np.ndarray, y: np.ndarray, raio_m: float) -> pd.DataFrame:
+    """
+    Contagem de pontos por célula de uma malha hexagonal (pontas para cima, circunraio
+    `raio_m`) sobre coordenadas em metros. Retorna uma linha por hexágono ocupado:
+    centro (x, y) e número de pontos `n`.
+    """
+    # Coordenadas axiais fracionárias e arredondamento cúbico para o hexágono mais próximo
+    q = (np.sqrt(3) / 3 * x - y / 3) / raio_m
+    r = (2 / 3 * y) / raio_m
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    ajusta_q = (dq > dr) & (dq > ds)
+    ajusta_r = ~ajusta_q & (dr > ds)
+    rq = np.where(ajusta_q, -rr - rs, rq)
+    rr = np.where(ajusta_r, -rq - rs, rr)
+
+    celulas, contagens = np.unique(np.stack([rq, rr], axis=1).astype(np.int64), axis=0, return_counts=True)
+    cq, cr = celulas[:, 0], celulas[:, 1]
+    return pd.DataFrame({
+        "x": raio_m * np.sqrt(3) * (cq + cr / 2),
+        "y": raio_m * 1.5 * cr,
+        "n": contagens,
+    })
+
+
+def vertices_hexagonos(cx: np.ndarray, cy: np.ndarray, raio_m: float) -> tuple[np.ndarray, np.ndarray]:
+    """Vértices (n × 6, em metros) dos hexágonos de centros (cx, cy) de `agregar_em_hexagonos`."""
+    angulos = np.radians(60 * np.arange(6) - 30)
+    return (np.asarray(cx)[:, None] + raio_m * np.cos(angulos),
+            np.asarray(cy)[:, None] + raio_m * np.sin(angulos))
@@ -1,3 +1,7 @@
+import json
+import queue
+import threading
+
 from config.constants import CORES_USO_LOTE
 
 
@@ -12,3 +16,80 @@ def hex_to_rgb(hex_color: str) -> list:
     if len(hex_color) == 3:
         hex_color = ''.join([c*2 for c in hex_color])
     return [int(hex_color[i:i+2], 16) for i in (0, 2, 4)]
+
+
+def formatar_idade(segundos: float) -> str:
+    """Formata uma idade em segundos de forma legível (ex.: 'há 3 min')."""
+    if segundos < 60:
+        return "agora mesmo"
+    if segundos < 3600:
+        return f"há {int(segundos // 60)} min"
+    if segundos < 86400:
+        return f"há {int(segundos // 3600)} h"
+    return f"há {int(segundos // 86400)} dias"
+
+
+def formatar_bytes(quantidade: float) -> str:
+    """Formata um tamanho em bytes de forma legível (ex.: '1.2 MB')."""
+    for unidade in ("B", "KB", "MB"):
+        if quantidade < 1024:
+            return f"{quantidade:.0f} {unidade}" if unidade == "B" else f"{quantidade:.1f} {unidade}"
+        quantidade /= 1024
+    return f"{quantidade:.1f} GB"
+
+
+def json_para_script(valor) -> str:
+    """
+    JSON de `valor` seguro para embutir em um bloco <script> (como o filtro `tojson`
+    do Jinja): '<', '>', '&' e "'" viram escapes \\u, então dados como "</script>"
+    não encerram o script.
+    """
+    return (
+        json.dumps(valor)
+        .replace("<", "\\u003c")
+        .replace(">", "\\u003e")
+        .replace("&", "\\u0026")
+        .replace("'", "\\u0027")
+    )
+
+
+def iterar_com_prefetch(iteravel, tamanho: int = 2):
+    """
+    Consome `iteravel` em uma thread produtora, mantendo no máximo `tamanho` itens
+    à frente do consumidor. Permite sobrepor o download da próxima página ao
+    processamento da atual com memória limitada. Exceções do produtor são relançadas.
+    """
+    fila = queue.Queue(maxsize=tamanho)
+    parar = threading.Event()
+    fim = object()
+
+    def _colocar(item) -> bool:
+        while not parar.is_set():
+            try:
+                fila.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produtor():
+        try:
+            for item in iteravel:
+                if not _colocar(item):
+                    return
+            _colocar(fim)
+        except Exception as e:
+            _colocar(e)
+
+    threading.Thread(target=_produtor, name="prefetch", daemon=True).start()
+    try:
+        while True:
+            item = fila.get()
+            if item is fim:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Libera o produtor se o consumidor parar antes do fim (ex.: erro de validação)
+        parar.set()
@@ -1,4 +1,7 @@
+import pandas as pd
+
 from config.constants import CORES_USO_LOTE
+from utils.helpers import json_para_script
 
 def generate_bloco_popup_html(row: dict) -> str:
     """Gera o HTML do popup para um bloco."""
@@ -22,6 +25,9 @@ def generate_bloco_popup_html(row: dict) -> str:
     uso_predominante = row.get('uso_predominante', 'N/A')
     tipologia_pred = row.get('tipologia_pred', 'N/A')
     usos_counts = row.get('usos_counts', {})
+    entropia = row.get('entropia_usos')
+    participacao = row.get('participacao_comercial')
+    distancia = row.get('dist_comercial_media_m')
     
     # Gerar badges
     badges_html = ""
@@ -31,6 +37,18 @@ def generate_bloco_popup_html(row: dict) -> str:
             for uso, count in usos_counts.items()
         ])
 
+    # Indicadores de mistura de usos (ausentes em dados não enriquecidos)
+    indicadores = []
+    if entropia is not None and pd.notna(entropia):
+        indicadores.append(f"<b style=\"color: #444;\">Mix (entropia):</b> {entropia:.2f}")
+    if participacao is not None and pd.notna(participacao):
+        indicadores.append(f"<b style=\"color: #444;\">Comercial:</b> {participacao:.0%}")
+    if distancia is not None and pd.notna(distancia):
+        indicadores.append(f"<b style=\"color: #444;\">Resid. → comércio:</b> {distancia:,.0f} m")
+    indicadores_html = ""
+    if indicadores:
+        indicadores_html = f'<div style="font-size: 11px; color: #666; margin-top: 8px;">{" · ".join(indicadores)}</div>'
+
     stats_html = f"""
     <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 8px; margin-top: 10px;">
         <div style="background: #f0f2f6; padding: 8px; border-radius: 6px; text-align: center; grid-column: span 2;">
@@ -46,6 +64,7 @@ def generate_bloco_popup_html(row: dict) -> str:
             <span style="color: #666;">{tipologia_pred}</span>
         </div>
     </div>
+    {indicadores_html}
     <div style="margin-top: 10px; border-top: 1px solid #eee; padding-top: 8px;">
         <b style="font-size: 11px; color: #444;">Distribuição de Usos:</b>
         <div style="display: flex; flex-wrap: wrap; gap: 4px; margin-top: 4px;">
@@ -62,3 +81,126 @@ def generate_bloco_popup_html(row: dict) -> str:
     </div>
     """
     return popup_html
+
+
+def generate_lote_popup_html(row: dict) -> str:
+    """Gera o HTML do popup para um lote."""
+    
+    uso = row.get("uso_lote", "Desconhecido")
+    nome_fantasia = row.get("nome_fantasia", "")
+    endereco = f"{row.get('rua', '')} {row.get('numero', '')}".strip()
+    lat = row["latitude"]
+    lon = row["longitude"]
+    
+    return f"""
+    <div style="font-family: Arial; min-width: 200px;">
+        <h4 style="margin: 0; color: #333;">{row['id_lote']}</h4>
+        <p style="margin: 5px 0; color: #666;">
+            <b>Bloco:</b> {row.get('id_bloco', 'N/A')}<br>
+            <b>Quadra:</b> {row.get('id_quadra', 'N/A')}<br>
+            <b>Uso:</b> <span style="font-weight: bold;">{uso}</span><br>
+            {f'<b>Nome:</b> {nome_fantasia}<br>' if nome_fantasia else ''}
+            <b>Endereço:</b> {endereco if endereco else 'N/A'}<br>
+            <b>Tipologia:</b> {row.get('tipologia', 'N/A')}
+        </p>
+        <p style="margin: 5px 0; color: #999; font-size: 10px; border-top: 1px solid #ddd; padding-top: 5px;">
+            <b>Coordenadas:</b><br>
+            Lat: {lat:.6f} | Lon: {lon:.6f}
+        </p>
+    </div>
+    """
+
+
+# --- Templates JS: mesmos popups, montados no navegador ao clicar ---
+# Recebem as propriedades compactas de um marcador (campos abaixo + latitude/longitude)
+
+CAMPOS_POPUP_LOTE = ["id_lote", "id_bloco", "id_quadra", "uso_lote", "tipologia", "nome_fantasia", "rua", "numero"]
+CAMPOS_POPUP_BLOCO = [
+    "id_bloco", "total_lotes", "uso_predominante", "tipologia_pred", "usos_counts",
+    "entropia_usos", "participacao_comercial", "dist_comercial_media_m",
+]
+
+_ESCAPAR_JS = """function esc(v, padrao) {
+        if (v === null || v === undefined) { v = padrao; }
+        return String(v).replace(/[&<>"']/g, function (c) {
+            return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;"}[c];
+        });
+    }"""
+
+
+def template_popup_lote_js() -> str:
+    """Função JS `(p) -> html` equivalente a `generate_lote_popup_html`."""
+    return f"""(function () {{
+    {_ESCAPAR_JS}
+    return function (p) {{
+        var endereco = ((p.rua || "") + " " + (p.numero === null ? "" : p.numero)).trim();
+        return '<div style="font-family: Arial; min-width: 200px;">'
+            + '<h4 style="margin: 0; color: #333;">' + esc(p.id_lote, "") + '</h4>'
+            + '<p style="margin: 5px 0; color: #666;">'
+            + '<b>Bloco:</b> ' + esc(p.id_bloco, "N/A") + '<br>'
+            + '<b>Quadra:</b> ' + esc(p.id_quadra, "N/A") + '<br>'
+            + '<b>Uso:</b> <span style="font-weight: bold;">' + esc(p.uso_lote, "Desconhecido") + '</span><br>'
+            + (p.nome_fantasia ? '<b>Nome:</b> ' + esc(p.nome_fantasia) + '<br>' : '')
+            + '<b>Endereço:</b> ' + (endereco ? esc(endereco) : 'N/A') + '<br>'
+            + '<b>Tipologia:</b> ' + esc(p.tipologia, "N/A")
+            + '</p>'
+            + '<p style="margin: 5px 0; color: #999; font-size: 10px; border-top: 1px solid #ddd; padding-top: 5px;">'
+            + '<b>Coordenadas:</b><br>Lat: ' + p.latitude.toFixed(6) + ' | Lon: ' + p.longitude.toFixed(6)
+            + '</p></div>';
+    }};
+}})()"""
+
+
+def template_popup_bloco_js() -> str:
+    """Função JS `(p) -> html` equivalente a `generate_bloco_popup_html`."""
+    return f"""(function () {{
+    {_ESCAPAR_JS}
+    var cores = {json_para_script(CORES_USO_LOTE)};
+    var valido = function (v) {{ return v !== null && v !== undefined && !isNaN(v); }};
+    return function (p) {{
+        var cabecalho = '<h4 style="margin: 0 0 5px 0; color: #1a1a2e; border-bottom: 2px solid #667eea; padding-bottom: 3px;">'
+            + esc(p.id_bloco, "N/A") + '</h4>'
+            + '<p style="margin: 0; color: #999; font-size: 9px;">Lat: ' + p.latitude.toFixed(6)
+            + ' | Lon: ' + p.longitude.toFixed(6) + '</p>';
+        if (!p.total_lotes) {{
+            return '<div style="font-family: Arial; min-width: 150px; color: #333;">' + cabecalho
+                + '<p style="margin-top: 5px; font-size: 11px; color: #666;">Sem dados de lotes.</p></div>';
+        }}
+
+        var badges = "";
+        var usos = p.usos_counts || {{}};
+        for (var uso in usos) {{
+            badges += '<span style="background: ' + (cores[uso] || "#ccc") + '; color: white; padding: 2px 6px; '
+                + 'border-radius: 4px; font-size: 9px; margin-right: 4px; margin-bottom: 4px; display: inline-block;">'
+                + esc(uso) + ': ' + usos[uso] + '</span>';
+        }}
+
+        var indicadores = [];
+        if (valido(p.entropia_usos)) {{
+            indicadores.push('<b style="color: #444;">Mix (entropia):</b> ' + p.entropia_usos.toFixed(2));
+        }}
+        if (valido(p.participacao_comercial)) {{
+            indicadores.push('<b style="color: #444;">Comercial:</b> ' + Math.round(p.participacao_comercial * 100) + '%');
+        }}
+        if (valido(p.dist_comercial_media_m)) {{
+            indicadores.push('<b style="color: #444;">Resid. → comércio:</b> '
+                + Math.round(p.dist_comercial_media_m).toLocaleString("en-US") + ' m');
+        }}
+
+        return '<div style="font-family: Arial; min-width: 220px; color: #333;">' + cabecalho
+            + '<div style="display: grid; grid-template-columns: 1fr 1fr; gap: 8px; margin-top: 10px;">'
+            + '<div style="background: #f0f2f6; padding: 8px; border-radius: 6px; text-align: center; grid-column: span 2;">'
+            + '<span style="display: block; font-size: 9px; color: #666; text-transform: uppercase;">Total de Lotes</span>'
+            + '<span style="font-size: 18px; font-weight: bold; color: #667eea;">' + p.total_lotes + '</span></div>'
+            + '<div style="font-size: 11px;"><b style="color: #444;">Uso Predom.:</b><br>'
+            + '<span style="color: #666;">' + esc(p.uso_predominante, "N/A") + '</span></div>'
+            + '<div style="font-size: 11px;"><b style="color: #444;">Tipologia:</b><br>'
+            + '<span style="color: #666;">' + esc(p.tipologia_pred, "N/A") + '</span></div>'
+            + '</div>'
+            + (indicadores.length ? '<div style="font-size: 11px; color: #666; margin-top: 8px;">' + indicadores.join(" · ") + '</div>' : '')
+            + '<div style="margin-top: 10px; border-top: 1px solid #eee; padding-top: 8px;">'
+            + '<b style="font-size: 11px; color: #444;">Distribuição de Usos:</b>'
+            + '<div style="display: flex; flex-wrap: wrap; gap: 4px; margin-top: 4px;">' + badges + '</div>'
+            + '</div></div>';
+    }};
+}})()"""
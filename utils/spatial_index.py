@@ -0,0 +1,177 @@
+import numpy as np
+import pandas as pd
+
+from config.settings import SPATIAL_GRID_CELL_M
+from utils.coordinates import coordenadas_metricas, projetar_local
+
+
+def _expandir(consultas: np.ndarray, inicio: np.ndarray, fim: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Para pares (consulta, intervalo [inicio, fim)), gera todos os pares (consulta, índice)."""
+    n = fim - inicio
+    total = int(n.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    deslocamentos = np.arange(total) - np.repeat(np.cumsum(n) - n, n)
+    return np.repeat(consultas, n), np.repeat(inicio, n) + deslocamentos
+
+
+class GradeEspacial:
+    """
+    Índice espacial em grade uniforme sobre coordenadas projetadas localmente
+    (metros, ver `projetar_local`); as consultas aceitam latitude/longitude.
+
+    Os pontos são ordenados por célula (estrutura CSR: `ordem` + `limites`), de modo
+    que cada consulta visita apenas as células próximas. As consultas devolvem
+    posições (0..n-1) dos pontos na ordem em que foram passados; pontos sem
+    coordenada ficam fora do índice.
+    """
+
+    def __init__(self, x, y, tamanho_celula: float = None):
+        self.tamanho_celula = float(tamanho_celula or SPATIAL_GRID_CELL_M)
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.n = len(self.x)
+
+        validos = np.flatnonzero(np.isfinite(self.x) & np.isfinite(self.y))
+        xv, yv = self.x[validos], self.y[validos]
+        self.x_min = float(xv.min()) if len(validos) else 0.0
+        self.y_min = float(yv.min()) if len(validos) else 0.0
+        self.colunas = int((xv.max() - self.x_min) // self.tamanho_celula) + 1 if len(validos) else 1
+        self.linhas = int((yv.max() - self.y_min) // self.tamanho_celula) + 1 if len(validos) else 1
+
+        celulas = self._celula(*self._indices_celula(xv, yv))
+        self.ordem = validos[np.argsort(celulas, kind="stable")]
+        self.limites = np.concatenate([[0], np.cumsum(np.bincount(celulas, minlength=self.colunas * self.linhas))])
+
+    @classmethod
+    def de_coordenadas(cls, lat, lon, tamanho_celula: float = None) -> "GradeEspacial":
+        """Indexa pontos dados em latitude/longitude (projetados com `projetar_local`)."""
+        return cls(*projetar_local(lat, lon), tamanho_celula)
+
+    @classmethod
+    def para_vizinhos(cls, x, y, pontos_por_celula: float = 2.0) -> "GradeEspacial":
+        """
+        Grade com células dimensionadas pela densidade dos pontos (~`pontos_por_celula`
+        por célula), adequada a buscas de vizinho mais próximo em lote.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        validos = np.isfinite(x) & np.isfinite(y)
+        if validos.sum() < 2:
+            return cls(x, y)
+        area = max(np.ptp(x[validos]), 1.0) * max(np.ptp(y[validos]), 1.0)
+        return cls(x, y, tamanho_celula=max(np.sqrt(area * pontos_por_celula / validos.sum()), 1.0))
+
+    @classmethod
+    def de_dataframe(cls, df: pd.DataFrame, tamanho_celula: float = None) -> "GradeEspacial":
+        """Indexa as coordenadas métricas (x_m/y_m) de um DataFrame (posições = linhas do DataFrame)."""
+        if df is None:
+            return cls([], [], tamanho_celula)
+        return cls(*coordenadas_metricas(df), tamanho_celula)
+
+    # --- Células ---
+
+    def _indices_celula(self, x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Coluna/linha da célula de cada ponto, limitadas à grade."""
+        x = np.nan_to_num(x, nan=self.x_min)
+        y = np.nan_to_num(y, nan=self.y_min)
+        cx = np.clip(((x - self.x_min) // self.tamanho_celula), 0, self.colunas - 1).astype(np.int64)
+        cy = np.clip(((y - self.y_min) // self.tamanho_celula), 0, self.linhas - 1).astype(np.int64)
+        return cx, cy
+
+    def _celula(self, cx: np.ndarray, cy: np.ndarray) -> np.ndarray:
+        return cy * self.colunas + cx
+
+    def _candidatos_retangulo(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """Posições dos pontos nas células que cobrem o retângulo projetado [x0, x1] × [y0, y1]."""
+        if not len(self.ordem) or x1 < x0 or y1 < y0:
+            return np.zeros(0, dtype=np.int64)
+        (cx0, cx1), (cy0, cy1) = self._indices_celula(np.array([x0, x1]), np.array([y0, y1]))
+        # Uma faixa contígua de células por linha da grade
+        linhas = np.arange(cy0, cy1 + 1)
+        inicio = self.limites[self._celula(cx0, linhas)]
+        fim = self.limites[self._celula(cx1, linhas) + 1]
+        _, indices = _expandir(linhas, inicio, fim)
+        return self.ordem[indices]
+
+    # --- Consultas ---
+
+    def no_raio(self, lat: float, lon: float, raio_m: float) -> np.ndarray:
+        """Posições dos pontos a até `raio_m` metros de (lat, lon), em ordem crescente."""
+        x, y = projetar_local(lat, lon)
+        x, y = float(x), float(y)
+        candidatos = self._candidatos_retangulo(x - raio_m, y - raio_m, x + raio_m, y + raio_m)
+        dentro = (self.x[candidatos] - x) ** 2 + (self.y[candidatos] - y) ** 2 <= raio_m ** 2
+        return np.sort(candidatos[dentro])
+
+    def na_janela(self, sul: float, oeste: float, norte: float, leste: float) -> np.ndarray:
+        """Posições dos pontos dentro da janela geográfica (ex.: viewport do mapa), em ordem crescente."""
+        (x0, x1), (y0, y1) = projetar_local([sul, norte], [oeste, leste])
+        candidatos = self._candidatos_retangulo(x0, y0, x1, y1)
+        dentro = (
+            (self.x[candidatos] >= x0) & (self.x[candidatos] <= x1)
+            & (self.y[candidatos] >= y0) & (self.y[candidatos] <= y1)
+        )
+        return np.sort(candidatos[dentro])
+
+    def mais_proximos(self, lat, lon) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Vizinho mais próximo de cada ponto de consulta (lat, lon), em lote.
+        Retorna (posicoes, distancias_m); -1/NaN para consultas sem coordenada ou índice vazio.
+        """
+        return self.mais_proximos_xy(*projetar_local(lat, lon))
+
+    def mais_proximos_xy(self, x, y) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Como `mais_proximos`, para consultas já projetadas em metros.
+
+        Busca em anéis de células crescentes, só para as consultas ainda não
+        resolvidas: um candidato a distância d está garantido quando d <= r·célula,
+        pois qualquer ponto fora do anel r está mais longe que isso.
+        """
+        qx = np.atleast_1d(np.asarray(x, dtype=np.float64))
+        qy = np.atleast_1d(np.asarray(y, dtype=np.float64))
+        posicoes = np.full(len(qx), -1, dtype=np.int64)
+        distancias = np.full(len(qx), np.inf)
+        pendentes = np.flatnonzero(np.isfinite(qx) & np.isfinite(qy))
+        if not len(self.ordem):
+            pendentes = pendentes[:0]
+        cx, cy = self._indices_celula(qx, qy)
+
+        raio = 0
+        while len(pendentes):
+            # Células do anel: max(|dx|, |dy|) == raio
+            passos = np.arange(-raio, raio + 1)
+            dx, dy = np.meshgrid(passos, passos)
+            borda = np.maximum(np.abs(dx), np.abs(dy)) == raio
+            dx, dy = dx[borda], dy[borda]
+
+            ccx = cx[pendentes][:, None] + dx
+            ccy = cy[pendentes][:, None] + dy
+            na_grade = (ccx >= 0) & (ccx < self.colunas) & (ccy >= 0) & (ccy < self.linhas)
+            consultas = np.broadcast_to(pendentes[:, None], ccx.shape)[na_grade]
+            celulas = self._celula(ccx[na_grade], ccy[na_grade])
+            q, indices = _expandir(consultas, self.limites[celulas], self.limites[celulas + 1])
+
+            if len(q):
+                pontos = self.ordem[indices]
+                d = np.hypot(self.x[pontos] - qx[q], self.y[pontos] - qy[q])
+                # Melhor candidato por consulta (os pares já saem agrupados por consulta)
+                inicios = np.flatnonzero(np.concatenate([[True], q[1:] != q[:-1]]))
+                minimos = np.minimum.reduceat(d, inicios)
+                empates = np.flatnonzero(d == np.repeat(minimos, np.diff(np.append(inicios, len(q)))))
+                primeiro = np.concatenate([[True], q[empates][1:] != q[empates][:-1]])
+                q, pontos, d = q[empates][primeiro], pontos[empates][primeiro], d[empates][primeiro]
+                melhora = d < distancias[q]
+                posicoes[q[melhora]] = pontos[melhora]
+                distancias[q[melhora]] = d[melhora]
+
+            resolvidas = distancias[pendentes] <= raio * self.tamanho_celula
+            # Anéis além da grade inteira não trazem candidatos novos
+            if raio > max(self.colunas, self.linhas):
+                break
+            pendentes = pendentes[~resolvidas]
+            raio += 1
+
+        distancias[posicoes < 0] = np.nan
+        return posicoes, distancias